@@ -2,28 +2,223 @@
 
 # atmos.py
 # Contains the entrypoint for the ATMOS software
-from menus.menu import App
-from menus import (
-    mops_menu,
-    sim_menu,
-    test_menu,
-    test_loader_menu,
-    welcome,
-)
-from test_loader import TestLoader
+# (imports are made inside main() so that --profile-startup can time them)
+import argparse
+import json
+import sys
+from contextlib import nullcontext, redirect_stdout
 
-# Application Entrypoint
-if __name__ == "__main__":
+
+def build(profiler=None):
+    """
+    Imports the menus and constructs everything needed before the welcome screen is shown
+
+    :param profiler: (optional) A started StartupProfiler to record each step with
+    :type profiler: StartupProfiler
+    :return: The app, the test loader and the first menu
+    :rtype: tuple
+    """
+
+    def measure(kind, name):
+        return profiler.measure(kind, name) if profiler is not None else nullcontext()
+
+    # (each module imported here is timed by the profiler's import hook)
+    from menus.menu import App
+    from menus import (
+        mops_menu,
+        sim_menu,
+        test_menu,
+        test_loader_menu,
+        welcome,
+    )
+    from test_loader import TestLoader
+
+    with measure("loader", "TestLoader"):
+        loader = TestLoader()
+    with measure("loader", "TestLoader.watch"):
+        loader.watch()  # hot-reload tests as they are edited
+
+    with measure("menu", "WelcomeScreen"):
+        welc = welcome.WelcomeScreen()  # Main menu (mode select)
+
+    # the other menus register themselves with the app, which finds them by name
+    with measure("menu", "TestMenu"):
+        test_menu.TestMenu(loader)  # Test menu
+    with measure("menu", "TestLoaderMenu"):
+        test_loader_menu.TestLoaderMenu(loader)
+
+    with measure("menu", "SimMenu"):
+        sim_menu.SimMenu()  # Simulation menu
+    with measure("menu", "MissionOpsMenu"):
+        mops_menu.MissionOpsMenu()  # Mission Ops menu
+
+    with measure("menu", "App"):
+        app = App.instance()
+    return app, loader, welc
+
+
+def profile_tests(loader, profiler) -> None:
+    """
+    Imports and constructs every test in the catalog (normally done on demand, one at a time)
+
+    :param loader: The test loader
+    :type loader: TestLoader
+    :param profiler: A started StartupProfiler to record each test with
+    :type profiler: StartupProfiler
+    """
+    for entry in loader.catalog:
+        try:
+            with profiler.measure("test", entry.name):
+                test = loader.get(entry.name)()
+            test.connection.release()
+        except Exception as e:  # a broken test shouldn't stop the report
+            print(f"Could not construct {entry.name}: {e!r}")
+
+
+def run(args, parser) -> int:
+    """
+    Runs tests without the menus (the "run" command) and reports each result
+
+    :param args: The parsed command line
+    :type args: argparse.Namespace
+    :param parser: The "run" command's parser (for reporting usage errors)
+    :type parser: argparse.ArgumentParser
+    :return: 0 if every run passed, 1 if any failed, 2 if the command line was unusable
+    :rtype: int
+    """
+    from runner import run_batch
+    from test_loader import TestLoader
 
     loader = TestLoader()
-    
-    welc = welcome.WelcomeScreen()  # Main menu (mode select)
+    names = list(args.tests)
+    if args.tag:
+        names += [entry.name for entry in loader.catalog.search(tags=args.tag)]
+    if not names:
+        parser.print_usage(sys.stderr)
+        print("atmos run: no tests given (name them or select them with --tag)", file=sys.stderr)
+        return 2
+    unknown = [name for name in names if loader.catalog.find(name) is None]
+    if unknown:
+        print(f"atmos run: unknown test(s): {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    tests = [loader.get(loader.catalog.find(name).name) for name in names]
+
+    # in JSON mode stdout carries only results, so whatever the tests print goes to stderr
+    output = sys.stdout
+    quiet = redirect_stdout(sys.stderr) if args.json else nullcontext()
+    counts = {True: 0, False: 0}
+    try:
+        with quiet:
+            results = run_batch(tests, args.port, args.baud, args.repeat, args.results)
+            for result in results:
+                counts[result.passed] += 1
+                if args.json:
+                    print(json.dumps(result._asdict()), file=output, flush=True)
+                else:
+                    status = "PASS" if result.passed else "FAIL"
+                    line = f"[{status}] {result.test} on {result.port} ({result.seconds:.2f} s)"
+                    print(line if result.error is None else f"{line}: {result.error}")
+    except KeyboardInterrupt:
+        print("Run cancelled", file=sys.stderr)
+        return 130
+
+    summary = {"runs": counts[True] + counts[False], "passed": counts[True], "failed": counts[False]}
+    if args.json:
+        print(json.dumps({"summary": summary}), file=output)
+    else:
+        print(f"{summary['passed']} of {summary['runs']} runs passed")
+    return 0 if not counts[False] else 1
+
+
+def profile(args) -> int:
+    """
+    Profiles startup (--profile-startup) and prints the report
+    Loading every test class is timed afterwards and reported separately, since startup only
+    loads tests on demand.
+
+    :param args: The parsed command line
+    :type args: argparse.Namespace
+    :return: 1 if startup went over the budget, 0 otherwise
+    :rtype: int
+    """
+    from profiling import StartupProfiler
+
+    profiler = StartupProfiler()
+    profiler.start()
+    app, loader, welc = build(profiler)
+    profiler.stop()
+
+    tests = StartupProfiler()
+    tests.start()
+    profile_tests(loader, tests)
+    tests.stop()
+    loader.watcher.stop()
 
-    test = test_menu.TestMenu(loader)  # Test menu
-    load = test_loader_menu.TestLoaderMenu(loader)
+    print(profiler.report())
+    print()
+    print(tests.report(title="Loading every test"))
+    if args.startup_budget is not None and profiler.total > args.startup_budget:
+        print(
+            f"Startup took {profiler.total:.3f} s, over the budget of {args.startup_budget:.3f} s",
+            file=sys.stderr,
+        )
+        return 1
+    return 0
 
-    sim = sim_menu.SimMenu()  # Simulation menu
-    mos = mops_menu.MissionOpsMenu()  # Mission Ops menu
 
-    app = App.instance()
+def main(argv=None) -> int:
+    """
+    Runs ATMOS
+
+    :param argv: (optional) The command line arguments, defaults to sys.argv[1:]
+    :type argv: list
+    :return: The exit code
+    :rtype: int
+    """
+    parser = argparse.ArgumentParser(description="Advance Testing & Mission Ops Software")
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="time every import, menu and test class, print a report and exit",
+    )
+    parser.add_argument(
+        "--startup-budget",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="with --profile-startup, exit with an error if startup takes longer than this",
+    )
+    commands = parser.add_subparsers(dest="command")
+    run_parser = commands.add_parser(
+        "run", help="run tests without the menus, e.g. atmos.py run SampleTest --repeat 10"
+    )
+    run_parser.add_argument("tests", nargs="*", metavar="TEST", help="the tests to run, in order")
+    run_parser.add_argument(
+        "-t", "--tag", action="append", default=[], help="also run every test with this tag"
+    )
+    run_parser.add_argument("--port", default=None, help="override every test's serial port")
+    run_parser.add_argument("--baud", type=int, default=None, help="override the baud rate")
+    run_parser.add_argument(
+        "--repeat", type=int, default=1, metavar="N", help="run the whole sequence N times"
+    )
+    run_parser.add_argument(
+        "--json", action="store_true", help="print one JSON object per run (and a summary)"
+    )
+    run_parser.add_argument(
+        "--results", default=None, metavar="DIR", help="append each test's records to DIR"
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        return run(args, run_parser)
+    if args.profile_startup or args.startup_budget is not None:
+        return profile(args)
+
+    app, loader, welc = build()
     app.run(welc)
+    return 0
+
+
+# Application Entrypoint
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,23 @@
 # config.py
 # Contains settings and system-wide variables for the menus system
 
-from .menu import TerminalMenu
+import os
+
+from .menu import CursesMenu, TerminalMenu
+
+# The most times per second a full-screen menu is repainted (ATMOS_MAX_FPS overrides this)
+MAX_FRAME_RATE = float(os.environ.get("ATMOS_MAX_FPS", 15))
+
+# The ground stations that Mission Ops predicts passes over, as
+# name:latitude:longitude[:altitude[:min elevation]] separated by semicolons (ATMOS_STATIONS)
+GROUND_STATIONS = os.environ.get("ATMOS_STATIONS", "")
 
 # Change this to a different class if moving away from a TUI
-MENU_TYPE = TerminalMenu
+# (ATMOS_UI=curses selects the full-screen UI when running in a terminal)
+if os.environ.get("ATMOS_UI", "").lower() == "curses" and CursesMenu.available():
+    MENU_TYPE = CursesMenu
+else:
+    MENU_TYPE = TerminalMenu
 
 # Basic navigation menu prompt
 nav_select = {
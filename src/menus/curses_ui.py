@@ -0,0 +1,348 @@
+# curses_ui.py
+# Contains the CursesUI, a full-screen terminal UI that repaints only the cells that changed
+# (select it with ATMOS_UI=curses, see config.py)
+
+import curses
+import sys
+import threading
+from collections import deque
+from time import monotonic
+
+from .ui import TUI
+
+
+# Class: _PaneWriter
+# Purpose: Catches print() output while curses owns the terminal
+class _PaneWriter:
+    """
+    Stands in for sys.stdout while curses owns the terminal: printed text goes to the UI's
+    message pane instead of scribbling over the screen
+    """
+
+    def __init__(self, ui):
+        self.ui = ui
+        self._partial = ""
+
+    def write(self, text: str) -> int:
+        *lines, self._partial = (self._partial + text).split("\n")
+        if lines:
+            self.ui.log(lines)
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+    def isatty(self) -> bool:
+        return False
+
+
+# Class: KeyReader
+# Purpose: Line editing on top of curses keystrokes
+class KeyReader:
+    """
+    Edits a line from the keys pressed and delivers it to the app's event loop on Enter
+    (the counterpart of ui.LineReader for the CursesUI)
+    """
+
+    BACKSPACE = (curses.KEY_BACKSPACE, "\x7f", "\b")
+    ENTER = (curses.KEY_ENTER, "\n", "\r")
+
+    def __init__(self, ui, loop, on_line, on_eof):
+        """
+        :param ui: The UI whose screen to read keys from
+        :type ui: CursesUI
+        :param loop: The event loop to deliver lines on
+        :type loop: asyncio.AbstractEventLoop
+        :param on_line: Called with each line entered
+        :type on_line: Callable[[str], None]
+        :param on_eof: Called when the user presses Ctrl+D on an empty line
+        :type on_eof: Callable[[], None]
+        """
+        self.ui = ui
+        self.loop = loop
+        self.on_line = on_line
+        self.on_eof = on_eof
+        self._fd = None
+
+    def start(self) -> None:
+        """
+        Takes over the terminal and starts watching for keys
+        """
+        self.ui.start(self.loop)
+        self._fd = sys.stdin.fileno()
+        self.loop.add_reader(self._fd, self._readable)
+
+    def stop(self) -> None:
+        """
+        Stops watching for keys and gives the terminal back
+        """
+        if self._fd is not None:
+            self.loop.remove_reader(self._fd)
+            self._fd = None
+        self.ui.stop()
+
+    def _readable(self) -> None:
+        """
+        Handles every key that is waiting
+        """
+        while self._fd is not None:
+            line = self._key(blocking=False)
+            if line is False:
+                return
+            if line is None:
+                self.on_eof()
+                return
+            self.on_line(line)
+
+    def _key(self, blocking: bool):
+        """
+        Handles one key press
+
+        :param blocking: Whether to wait for a key
+        :type blocking: bool
+        :return: The line if Enter was pressed, None at end of input, otherwise False
+        :rtype: Union[str, None, bool]
+        """
+        screen = self.ui.screen
+        screen.nodelay(not blocking)
+        try:
+            key = screen.get_wch()
+        except curses.error:
+            return False  # no key waiting
+        finally:
+            screen.nodelay(True)
+
+        if key in self.ENTER:
+            line, self.ui.entry = self.ui.entry, ""
+            self.ui.request_paint()
+            return line
+        if key in self.BACKSPACE:
+            self.ui.entry = self.ui.entry[:-1]
+        elif key == "\x04" and not self.ui.entry:  # Ctrl+D
+            return None
+        elif key == curses.KEY_RESIZE:
+            self.ui.resized()
+        elif isinstance(key, str) and key.isprintable():
+            self.ui.entry += key
+        self.ui.request_paint()
+        return False
+
+    def read_line(self) -> str:
+        """
+        Waits for the next line, e.g. for a prompt made from inside a menu's perform()
+
+        :return: The line entered
+        :rtype: str
+        """
+        self.ui.paint()
+        while True:
+            line = self._key(blocking=True)
+            if line is None:
+                raise EOFError
+            if line is not False:
+                return line
+            self.ui.paint()
+
+
+# Class: CursesUI
+# Purpose: User interface in a full-screen terminal setting
+class CursesUI(TUI):
+    """
+    Implements a full-screen user interface with curses
+    The screen holds the current menu at the top, recent messages (anything printed) below it
+    and the line being typed at the bottom. Each frame is compared with the one on screen and
+    only the changed cells are rewritten, at most max_fps times per second, so a menu showing
+    live data can refresh often without flooding the terminal (e.g. over SSH).
+    IMPORTANT: This is a singleton class! (there is only one screen)
+    """
+
+    _instance = None
+
+    def __init__(self, max_fps: float = 15):
+        """
+        :param max_fps: (optional) The most frames painted per second
+        :type max_fps: float
+        """
+        if CursesUI._instance is not None:
+            raise Exception("CursesUI instance already exists!")
+        CursesUI._instance = self
+        super().__init__()
+
+        self.live = True
+        self.max_fps = max_fps
+        self.screen = None  # the curses window (while started)
+        self.entry = ""  # the line being typed
+        self.frames = 0  # how many frames have been painted
+        self.cells_written = 0  # how many characters have been sent to the terminal
+        self._frame = []  # the lines of the current menu
+        self._building = None  # the lines of a menu being drawn (between begin/end_frame)
+        self._log = deque(maxlen=200)  # recent messages
+        self._log_lock = threading.Lock()
+        self._shown = []  # the rows that are on the screen now
+        self._loop = None
+        self._pending = None  # the scheduled paint (if any)
+        self._last_paint = 0.0
+        self._stdout = None
+
+    @staticmethod
+    def instance(max_fps: float = 15):
+        """
+        Static access method
+        """
+        if CursesUI._instance is None:
+            CursesUI(max_fps)
+        return CursesUI._instance
+
+    def start(self, loop) -> None:
+        """
+        Takes over the terminal
+        """
+        if self.screen is not None:
+            return
+        self._loop = loop
+        self.screen = curses.initscr()
+        curses.noecho()
+        curses.cbreak()
+        self.screen.keypad(True)
+        self.screen.nodelay(True)
+        self._shown = []
+        self._stdout, sys.stdout = sys.stdout, _PaneWriter(self)
+
+    def stop(self) -> None:
+        """
+        Gives the terminal back, then prints the most recent messages to it
+        """
+        if self.screen is None:
+            return
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        self.screen.keypad(False)
+        curses.nocbreak()
+        curses.echo()
+        curses.endwin()
+        self.screen = None
+        self._loop = None
+        sys.stdout = self._stdout
+        with self._log_lock:
+            for line in list(self._log)[-10:]:
+                print(line)
+
+    def reader(self, loop, on_line, on_eof) -> KeyReader:
+        return KeyReader(self, loop, on_line, on_eof)
+
+    def get_str(self) -> str:
+        """
+        Gets a user-entered string from the screen (or the terminal, if curses isn't running)
+
+        :return: The string the user entered
+        :rtype: str
+        """
+        return self.inputSrc.get()
+
+    def begin_frame(self) -> None:
+        self._building = []
+
+    def end_frame(self) -> None:
+        self._frame, self._building = self._building or [], None
+        self.request_paint()
+
+    def output(self, string: str) -> None:
+        """
+        Adds text to the menu being drawn, or to the messages if no menu is being drawn
+
+        :param string: The string to be displayed
+        :type string: str
+        """
+        if self.screen is None:
+            super().output(string)
+        elif self._building is not None:
+            self._building += string.split("\n")
+        else:
+            self.log(string.split("\n"))
+
+    def log(self, lines) -> None:
+        """
+        Adds lines to the messages (safe to use from any thread)
+
+        :param lines: The lines to add
+        :type lines: Iterable[str]
+        """
+        with self._log_lock:
+            self._log.extend(lines)
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self.request_paint)
+
+    def request_paint(self) -> None:
+        """
+        Paints soon, but no sooner than 1/max_fps seconds after the last paint
+        """
+        if self.screen is None or self._pending is not None:
+            return
+        if self._loop is None or not self._loop.is_running():
+            self.paint()
+            return
+        delay = max(0.0, self._last_paint + 1 / self.max_fps - monotonic())
+        self._pending = self._loop.call_later(delay, self.paint)
+
+    def resized(self) -> None:
+        """
+        Forgets what is on the screen so that the next paint redraws all of it
+        """
+        self._shown = []
+        if self.screen is not None:
+            self.screen.clear()
+
+    def _compose(self, height: int, width: int) -> list:
+        """
+        Lays out a screenful: the menu, then as many recent messages as fit, then the entry line
+
+        :return: One string per row, each shorter than the screen is wide
+        :rtype: list
+        """
+        rows = [line[: width - 1] for line in self._frame[: height - 1]]
+        room = height - 1 - len(rows)
+        with self._log_lock:
+            messages = list(self._log)[-room:] if room > 0 else []
+        rows += [line[: width - 1] for line in messages]
+        rows += [""] * (height - 1 - len(rows))
+        rows.append(("> " + self.entry)[-(width - 1) :])
+        return rows
+
+    def paint(self) -> None:
+        """
+        Rewrites the cells that differ between the screen and the current frame
+        """
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        if self.screen is None:
+            return
+        height, width = self.screen.getmaxyx()
+        rows = self._compose(height, width)
+        shown = self._shown + [""] * (len(rows) - len(self._shown))
+
+        for y, (old, new) in enumerate(zip(shown, rows)):
+            if old == new:
+                continue
+            start = 0
+            while start < min(len(old), len(new)) and old[start] == new[start]:
+                start += 1
+            end = len(new)
+            if len(old) == len(new):
+                while end > start and old[end - 1] == new[end - 1]:
+                    end -= 1
+            try:
+                self.screen.addstr(y, start, new[start:end])
+                if len(new) < len(old):
+                    self.screen.clrtoeol()
+            except curses.error:
+                pass  # the terminal shrank mid-paint; the resize repaints everything
+            self.cells_written += end - start
+
+        self.screen.move(height - 1, min(len(rows[-1]), width - 1))
+        self.screen.refresh()
+        self._shown = rows
+        self._last_paint = monotonic()
+        self.frames += 1
@@ -1,10 +1,13 @@
 # menu.py
 # Handles application state and manages transitions
 
+import asyncio
+import sys
+import traceback
 from abc import ABC, abstractmethod
 from typing import Any
 
-from .ui import Prompt, TUI
+from .ui import Prompt, TUI, TerminalInput
 
 
 class BaseMenu(ABC):
@@ -26,18 +29,43 @@ class BaseMenu(ABC):
 
     def display(self) -> None:
         """
-        Displays the menu via the applicable UI
+        Displays the menu via the applicable UI and waits for (and acts on) the user's response
+        """
+        self.render()
+        self.handle(self.interface.get_str() if self._prompt is not None else None)
+
+    def render(self) -> None:
+        """
+        Draws the menu (and its prompt, if any) without waiting for input
+        Menus showing live data can call refresh() to have this run again.
         """
         self.interface.output(self.message)
-        response = None
         if self._prompt is not None:
-            response = self.interface.prompt(self._prompt)
+            self.interface.output(self._prompt.message)
+
+    def handle(self, entry: str) -> None:
+        """
+        Acts on what the user entered in response to the menu's prompt
+
+        :param entry: The line the user entered (None if the menu has no prompt)
+        :type entry: str
+        """
+        response = None
+        if self._prompt is not None and entry is not None:
+            response = self.interface.parse(self._prompt, entry)
         try:
             self._callback(response)
         except TypeError:
             pass
         self.perform(response)
 
+    def refresh(self) -> None:
+        """
+        Asks the app to redraw this menu (if it is the one on screen) with up-to-date data
+        """
+        if self._app.current_menu is self:
+            self._app.invalidate()
+
     @property
     def prompt(self) -> Prompt:
         """
@@ -139,9 +167,84 @@ class TerminalMenu(BaseMenu):
         pass
 
 
+class CursesMenu(BaseMenu):
+    """
+    Implements a full-screen terminal menu that repaints only what changed (see curses_ui)
+    """
+
+    def __init__(self, message: str = None, prompt: Prompt = None, callback=None):
+        from .config import MAX_FRAME_RATE
+        from .curses_ui import CursesUI
+
+        super().__init__(message, prompt, callback)
+        self.interface = CursesUI.instance(MAX_FRAME_RATE)
+
+    @staticmethod
+    def available() -> bool:
+        """
+        Determines whether a full-screen UI can be used here
+
+        :return: True if curses is installed and ATMOS is attached to a terminal
+        :rtype: bool
+        """
+        try:
+            import curses  # noqa: F401 (not included with Python on Windows)
+        except ImportError:
+            return False
+        return sys.stdin.isatty() and sys.stdout.isatty()
+
+    @abstractmethod
+    def perform(self) -> None:
+        pass
+
+
+class Repeating:
+    """
+    A callback that the app calls every interval seconds (see App.call_every)
+    """
+
+    def __init__(self, interval: float, callback):
+        self.interval = interval
+        self.callback = callback
+        self._handle = None
+        self._loop = None
+        self.cancelled = False
+
+    def start(self, loop) -> None:
+        """
+        Schedules the first call
+        """
+        self._loop = loop
+        if not self.cancelled:
+            self._next = loop.time() + self.interval
+            self._handle = loop.call_at(self._next, self._run)
+
+    def _run(self) -> None:
+        if self.cancelled:
+            return
+        try:
+            self.callback()
+        finally:
+            # keep to the original schedule, skipping calls that were missed entirely
+            now = self._loop.time()
+            self._next = max(self._next + self.interval, now)
+            self._handle = self._loop.call_at(self._next, self._run)
+
+    def cancel(self) -> None:
+        """
+        Stops the calls
+        """
+        self.cancelled = True
+        if self._handle is not None:
+            self._handle.cancel()
+
+
 class App:
     """
     Manages the state of the application and transitions between menus
+    The app runs an event loop in which the user's input is just one source of events: menus
+    (or anything else) can also schedule timers, watch file descriptors such as serial lines,
+    and run background jobs, all of which carry on while the menu waits for input.
     """
 
     _instance = None
@@ -164,6 +267,12 @@ class App:
         self.previous_menu = None
         self.next_menu = None
         self.running = False
+        self.loop = None  # the event loop (while the app is running)
+        self.reader = None  # the LineReader for the terminal (while the app is running)
+        self._pending = []  # things to start once the loop is running
+        self._jobs = {}  # background jobs that haven't finished yet: their stop hook (if any)
+        self._redraw = None  # the scheduled redraw (see invalidate)
+        self._stopped = None
 
     @staticmethod
     def instance():
@@ -205,8 +314,190 @@ class App:
         """
         self.load_next(start)
         self.running = True
-        while self.running:
-            self.current_menu.display()
+        try:
+            asyncio.run(self._main())
+        except KeyboardInterrupt:
+            print("Exiting...")
+            self.running = False
+
+    async def _main(self) -> None:
+        """
+        Runs the event loop until the app is told to exit (or the terminal is closed)
+        """
+        self.loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self.reader = self.current_menu.interface.reader(self.loop, self._on_line, self.stop)
+        self.reader.start()
+        TerminalInput.reader = self.reader
+        for start in self._pending:
+            start(self.loop)
+        self._pending.clear()
+
+        self._show()
+        try:
+            await self._stopped.wait()
+        finally:
+            TerminalInput.reader = None
+            self.reader.stop()
+            for job, stop in list(self._jobs.items()):
+                if stop is not None:
+                    stop()  # a worker thread can't be cancelled, so the job must end itself
+                job.cancel()
+            self.loop = None
+
+    def _on_line(self, line: str) -> None:
+        """
+        Passes a line the user entered to the current menu, then shows whichever menu is next
+        """
+        try:
+            self.current_menu.handle(line)
+        except EOFError:  # the terminal closed during a prompt
+            self.stop()
+        except Exception:  # report it, but keep the app (and its links) running
+            traceback.print_exc()
+        if not self.running:
+            self.stop()
+            return
+        self._show()
+
+    def _show(self) -> None:
+        """
+        Draws the current menu (a menu without a prompt is acted on straight away)
+        """
+        menu = self.current_menu
+        self._draw(menu)
+        if menu.prompt is None:
+            self.loop.call_soon(self._on_line, None)
+
+    @staticmethod
+    def _draw(menu: BaseMenu) -> None:
+        """
+        Draws a menu as one frame of its UI
+        """
+        menu.interface.begin_frame()
+        try:
+            menu.render()
+        finally:
+            menu.interface.end_frame()
+
+    def stop(self) -> None:
+        """
+        Ends the event loop (and so the app)
+        """
+        self.running = False
+        if self._stopped is not None:
+            self._stopped.set()
+
+    def invalidate(self) -> None:
+        """
+        Redraws the current menu soon (several calls before the redraw result in one redraw)
+        """
+        if self.loop is None or self._redraw is not None:
+            return
+
+        def redraw():
+            self._redraw = None
+            if self.running:
+                self._draw(self.current_menu)
+
+        self._redraw = self.loop.call_soon_threadsafe(redraw)
+
+    def call_soon(self, callback, *args) -> None:
+        """
+        Calls a function on the event loop (safe to use from any thread)
+        If the app isn't running, the function is called straight away instead.
+
+        :param callback: The function to call
+        :type callback: Callable
+        """
+        if self.loop is None:
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def call_later(self, delay: float, callback, *args):
+        """
+        Calls a function on the event loop after a delay
+
+        :param delay: The delay in seconds
+        :type delay: float
+        :param callback: The function to call
+        :type callback: Callable
+        :return: A handle whose cancel() stops the call
+        :rtype: asyncio.TimerHandle
+        """
+        return self.loop.call_later(delay, callback, *args)
+
+    def call_every(self, interval: float, callback) -> Repeating:
+        """
+        Calls a function on the event loop every interval seconds (e.g. a heartbeat)
+        This can be set up before the app starts running, e.g. in a menu's constructor.
+
+        :param interval: The interval in seconds
+        :type interval: float
+        :param callback: The function to call
+        :type callback: Callable
+        :return: A handle whose cancel() stops the calls
+        :rtype: Repeating
+        """
+        timer = Repeating(interval, callback)
+        if self.loop is None:
+            self._pending.append(timer.start)
+        else:
+            timer.start(self.loop)
+        return timer
+
+    def add_reader(self, fileobj, callback) -> None:
+        """
+        Calls a function on the event loop whenever a file (e.g. a serial port) is readable
+
+        :param fileobj: A file descriptor, or an object with a fileno() method
+        :type fileobj: Union[int, Any]
+        :param callback: The function to call (with no arguments)
+        :type callback: Callable
+        """
+        if self.loop is None:
+            self._pending.append(lambda loop: loop.add_reader(fileobj, callback))
+        else:
+            self.loop.add_reader(fileobj, callback)
+
+    def remove_reader(self, fileobj) -> None:
+        """
+        Stops watching a file passed to add_reader()
+        """
+        if self.loop is not None:
+            self.loop.remove_reader(fileobj)
+
+    def submit(self, job, *args, done=None, stop=None) -> asyncio.Future:
+        """
+        Runs a background job while the app keeps handling input
+        A coroutine runs on the event loop; a plain function runs in a worker thread.
+
+        :param job: A coroutine, or a function to call with args
+        :type job: Union[Coroutine, Callable]
+        :param done: (optional) Called on the event loop with the job's future once it finishes
+        :type done: Callable[[asyncio.Future], None]
+        :param stop: (optional) Called on the event loop if the app exits while the job is still
+                     running, to make it finish (the app waits for its worker thread to end)
+        :type stop: Callable[[], None]
+        :return: The job's future (cancel() it to give up on the job)
+        :rtype: asyncio.Future
+        """
+        if self.loop is None:
+            raise RuntimeError("Background jobs can only be submitted while the app is running")
+        if asyncio.iscoroutine(job):
+            future = self.loop.create_task(job)
+        else:
+            future = self.loop.run_in_executor(None, job, *args)
+        self._jobs[future] = stop
+
+        def finished(future):
+            self._jobs.pop(future, None)
+            if done is not None and not future.cancelled():
+                done(future)
+
+        future.add_done_callback(finished)
+        return future
 
     def load_next(self, next: BaseMenu) -> None:
         """
@@ -240,7 +531,7 @@ class App:
         """
         if message == "EXIT":
             print("Exiting...")
-            self.running = False
+            self.stop()
         elif message == "BAD_RESPONSE":
             print("ERROR: BadResponse")
             # quit()
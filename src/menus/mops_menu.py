@@ -1,28 +1,345 @@
 # mops_menu.py
 # Contains the class MissionOpsMenu which displays the Mission Ops screen
 
-from .config import MENU_TYPE, nav_select
+import threading
+from datetime import datetime, timezone
+from time import perf_counter, time
+
+from mops.dashboard import Dashboard, TelemetryFeed
+from mops.scheduler import CommandScheduler, ContactWindow
+
+from .config import GROUND_STATIONS, MENU_TYPE
 from .ui import Prompt
 
+# ## Instance variables for MissionOpsMenu ## #
+
+# Mission ops menu prompt
+mops_select = {
+    1: "Back",
+    2: "Start Live Telemetry",
+    3: "Stop Live Telemetry",
+    4: "Predict Passes",
+    5: "Next Pass",
+    6: "Upcoming Passes",
+    7: "Queue Command",
+    8: "Uplink at Next Pass",
+    10: "Cancel Uplink",
+    11: "Decode Downlink File",
+    9: "Exit",
+    0: "Home",
+}
+
+# How many times per second the live telemetry panel is redrawn (independent of the rate at
+# which telemetry arrives)
+REFRESH_RATE = 2
+
+# The usable uplink rate assumed when packing commands into a pass (bytes/s)
+UPLINK_RATE = 120
+
+#######################################
+
 
 class MissionOpsMenu(MENU_TYPE):
     """
     The mission ops main menu
+    While live telemetry is running, the menu shows the latest value and trend of every
+    channel. Full-screen UIs redraw it REFRESH_RATE times per second; line-based UIs redraw
+    it whenever Enter is pressed.
+    Passes over the ground stations are predicted once for a span of days and kept in a
+    PassIndex, which the next/upcoming pass queries are answered from. Queued commands are
+    uplinked by priority during the next pass, in a background job. Downlinked files of CCSDS
+    space packets are decoded all at once.
     """
 
     def __init__(self, *args, **kwargs):
         """
-        :precond: nav_select must exist in the scope immediately outside of this method call
-        :type nav_select: dict
+        :precond: mops_select must exist in the scope immediately outside of this method call
+        :type mops_select: dict
         """
         super().__init__(*args, **kwargs)
         self.message = "======== MISSION OPS ========"
-        self.prompt = Prompt("Where to next?", int, nav_select)
+        self.prompt = Prompt("Where to next?", int, mops_select)
+        self.dashboard = None
+        self.feed = None
+        self._timer = None  # redraws the panel while telemetry is live
+        self.passes = None  # the PassIndex of the last prediction
+        self.scheduler = CommandScheduler()
+        self.uplink = None  # the background uplink job (while one is waiting or running)
+        self._stop_uplink = threading.Event()
+
+    def render(self) -> None:
+        """
+        Draws the menu, with the telemetry panel while telemetry is live
+        """
+        self.interface.output(self.message)
+        if self.feed is not None:
+            self.interface.output(self.dashboard.render())
+            if self.feed.error is not None:
+                self.interface.output(f"Telemetry stopped: {self.feed.error}")
+        counts = self.scheduler.counts
+        if len(self.scheduler) or any(counts.values()):
+            self.interface.output(
+                f"Uplink queue: {len(self.scheduler)} queued, {counts['acked']} acked, "
+                f"{counts['failed']} failed, {counts['expired']} expired"
+                + (" (uplink pending)" if self.uplink is not None else "")
+            )
+        self.interface.output(self.prompt.message)
+
+    def start_telemetry(self, port: str, baud: int) -> None:
+        """
+        Starts streaming telemetry from a serial port into the panel
+
+        :param port: The serial port (or socket URL, see sockets.make_transport)
+        :type port: str
+        :param baud: The baud rate
+        :type baud: int
+        """
+        from testdata.connections import ACK, ENQ
+        from testdata.ports import PortManager
+
+        self.stop_telemetry()
+        connection = PortManager.instance().lease(
+            "Telemetry", port, baud, ready_probe=ENQ, ready_response=ACK, capture=True
+        )
+        self.dashboard = Dashboard()
+        self.feed = TelemetryFeed(self.dashboard, connection)
+        self.feed.start()
+        if self.interface.live:
+            self._timer = self._app.call_every(1 / REFRESH_RATE, self.refresh)
+
+    def stop_telemetry(self) -> None:
+        """
+        Stops streaming telemetry
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self.feed is not None:
+            self.feed.stop()
+            self.feed = None
+
+    def predict_passes(self) -> None:
+        """
+        Predicts the passes over the ground stations for the coming days, from a TLE or the
+        orbit last propagated in the simulation menu
+        """
+        from mops.passes import GroundStation, PassPredictor
+        from sim.orbit import elements_from_tle
+
+        line1 = self.interface.prompt(Prompt("TLE line 1 (blank for the simulated orbit):", str))
+        if line1:
+            line2 = self.interface.prompt(Prompt("TLE line 2:", str)) or ""
+            try:
+                elements = elements_from_tle(line1, line2)
+            except ValueError:
+                print("That doesn't look like a TLE!")
+                return
+        else:
+            elements = self.lookup_menu("SimMenu").elements
+            if elements is None:
+                print("Enter a TLE, or propagate an orbit in the simulation menu first!")
+                return
+            if elements.epoch is None:
+                elements = elements._replace(epoch=datetime.now(timezone.utc))
+
+        try:
+            stations = GroundStation.parse(GROUND_STATIONS)
+            if not stations:
+                entry = self.interface.prompt(
+                    Prompt("Ground station (name:latitude:longitude):", str)
+                )
+                stations = GroundStation.parse(entry or "")
+        except ValueError as e:
+            print(e)
+            return
+        if not stations:
+            print("No ground stations (set ATMOS_STATIONS to skip this question)")
+            return
+        days = self.interface.prompt(Prompt("Days to predict [7]:", float)) or 7
+
+        start = perf_counter()
+        predictor = PassPredictor(elements, stations)
+        now = (datetime.now(timezone.utc) - elements.epoch).total_seconds()
+        self.passes = predictor.predict(now, now + days * 86400)
+        elapsed = perf_counter() - start
+        print(f"Found {len(self.passes)} passes over {len(stations)} station(s)", end="")
+        print(f" in {elapsed * 1000:.0f} ms")
+        self.show_passes(self.passes.between(now, now + 86400)[:5])
+
+    def show_passes(self, passes) -> None:
+        """
+        Prints a table of passes (times are UTC)
+
+        :param passes: The passes
+        :type passes: Iterable[Pass]
+        """
+        passes = list(passes)
+        if not passes:
+            print("No passes")
+        for item in passes:
+            aos, los = self.passes.time(item.aos), self.passes.time(item.los)
+            print(
+                f"{item.station:<12} AOS {aos:%Y-%m-%d %H:%M:%S}  LOS {los:%H:%M:%S}  "
+                f"max {item.max_elevation:4.1f} deg  ({item.duration / 60:.1f} min)"
+            )
+
+    def queue_command(self) -> None:
+        """
+        Adds a command to the uplink queue
+        """
+        payload = self.interface.prompt(Prompt("Command:", str))
+        if not payload:
+            return
+        priority = self.interface.prompt(Prompt("Priority (higher goes first) [0]:", int)) or 0
+        delay = self.interface.prompt(Prompt("Not before (minutes from now) [0]:", float)) or 0
+        expiry = self.interface.prompt(Prompt("Expires after (hours, blank for never):", float))
+        now = time()
+        command = self.scheduler.submit(
+            payload,
+            release=now + delay * 60,
+            deadline=now + expiry * 3600 if expiry else None,
+            priority=priority,
+        )
+        print(f"Queued command {command.id} ({len(self.scheduler)} in the queue)")
+
+    def start_uplink(self, port: str, baud: int) -> None:
+        """
+        Uplinks the queue during the next pass (or the current one), in the background
+
+        :param port: The radio's serial port (or socket URL)
+        :type port: str
+        :param baud: The baud rate
+        :type baud: int
+        """
+        upcoming = self.passes.next(self.passes.seconds(datetime.now(timezone.utc)))
+        if upcoming is None:
+            print("No passes left in the prediction: predict again")
+            return
+        window = ContactWindow.from_pass(upcoming, self.passes, UPLINK_RATE)
+        self._stop_uplink.clear()
+        self.uplink = self._app.submit(
+            self._uplink, window, port, baud, done=self.uplink_finished, stop=self.cancel_uplink
+        )
+        start = self.passes.time(upcoming.aos)
+        print(f"Uplink scheduled for the {upcoming.station} pass at {start:%Y-%m-%d %H:%M:%S}")
+
+    def _uplink(self, window: ContactWindow, port: str, baud: int):
+        """
+        Body of the uplink job: waits for AOS, then sends commands until LOS
+        """
+        from testdata.connections import ACK, ENQ
+        from testdata.ports import PortManager
+
+        if self._stop_uplink.wait(max(0.0, window.start - time())):
+            return window, 0, 0
+        connection = PortManager.instance().lease(
+            "Uplink", port, baud, ready_probe=ENQ, ready_response=ACK, capture=True
+        )
+        try:
+            connection.open()
+            sent, acked = self.scheduler.run_window(window, connection, self._stop_uplink)
+        finally:
+            connection.release()
+        return window, sent, acked
+
+    def uplink_finished(self, job) -> None:
+        """
+        Reports how an uplink went
+
+        :param job: The finished background job (see App.submit)
+        :type job: asyncio.Future
+        """
+        self.uplink = None
+        error = job.exception()
+        if error is not None:
+            print(f"Uplink failed: {error!r}")
+        else:
+            window, sent, acked = job.result()
+            print(f"Uplink over {window.station or 'the station'}: {sent} sent, {acked} acked")
+        self.refresh()
+
+    def cancel_uplink(self) -> None:
+        """
+        Stops the uplink job (commands that weren't acknowledged stay queued)
+        """
+        if self.uplink is not None:
+            self._stop_uplink.set()
+
+    def decode_downlink(self, path: str) -> None:
+        """
+        Decodes a file of CCSDS space packets and reports what it holds
+        The file is memory-mapped rather than read, so even a long pass dump is never copied.
+
+        :param path: The file of concatenated space packets
+        :type path: str
+        """
+        import numpy as np
+
+        from mops.ccsds import decode
+
+        try:
+            data = np.memmap(path, np.uint8, mode="r")
+        except (OSError, ValueError) as e:  # ValueError: the file is empty
+            print(f"Couldn't open {path}: {e}")
+            return
+        start = perf_counter()
+        packets = decode(data)
+        check = packets.check_sequence()
+        elapsed = perf_counter() - start
+        print(f"Decoded {len(packets):,} packets in {elapsed * 1000:.0f} ms")
+        for apid, (count, size) in packets.summary().items():
+            print(f"  APID {apid:4d}  {count:9,} packets  {size:12,} bytes")
+        print(
+            f"{len(check.gaps)} gaps ({check.missing:,} packets missing), "
+            f"{len(check.duplicates)} duplicates"
+        )
+        if packets.remainder:
+            print(f"{packets.remainder:,} bytes after the last complete packet were not decoded")
 
     def perform(self, data):
         if data == 1:
             self.next = self.prev
+        elif data == 2:
+            port = self.interface.prompt(Prompt("Enter the telemetry port (or socket URL):", str))
+            if port:
+                baud = self.interface.prompt(Prompt("Enter the baud rate (9600):", int))
+                self.start_telemetry(port.strip(), baud or 9600)
+        elif data == 3:
+            self.stop_telemetry()
+        elif data == 4:
+            self.predict_passes()
+        elif data in (5, 6):
+            if self.passes is None:
+                print("Predict the passes first!")
+                return
+            now = self.passes.seconds(datetime.now(timezone.utc))
+            if data == 5:
+                upcoming = self.passes.next(now)
+                self.show_passes([upcoming] if upcoming is not None else [])
+            else:
+                hours = self.interface.prompt(Prompt("Hours ahead [24]:", float)) or 24
+                self.show_passes(self.passes.between(now, now + hours * 3600))
+        elif data == 7:
+            self.queue_command()
+        elif data == 8:
+            if self.passes is None:
+                print("Predict the passes first!")
+            elif self.uplink is not None:
+                print("An uplink is already scheduled (cancel it first)")
+            else:
+                port = self.interface.prompt(Prompt("Enter the radio's port (or socket URL):", str))
+                if port:
+                    baud = self.interface.prompt(Prompt("Enter the baud rate (9600):", int))
+                    self.start_uplink(port.strip(), baud or 9600)
+        elif data == 10:
+            self.cancel_uplink()
+        elif data == 11:
+            path = self.interface.prompt(Prompt("Downlink file:", str))
+            if path:
+                self.decode_downlink(path.strip())
         elif data == 9:
+            self.stop_telemetry()
+            self.cancel_uplink()
             self.app_event("EXIT")
         elif data == 0:
             self.next = self.lookup_menu("WelcomeScreen")
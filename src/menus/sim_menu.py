@@ -1,28 +1,315 @@
 # sim_menu.py
 # Contains the class SimMenu which displays the Simulation mode screen
 
-from .config import MENU_TYPE, nav_select
+import threading
+from time import perf_counter
+from typing import List
+
+from .config import MENU_TYPE
 from .ui import Prompt
 
+# ## Instance variables for SimMenu ## #
+
+# Simulation menu prompt
+sim_select = {
+    1: "Back",
+    2: "Propagate Orbit",
+    3: "Propagate TLE",
+    4: "Power & Thermal Budget",
+    5: "Monte Carlo",
+    6: "Cancel Simulation",
+    9: "Exit",
+    0: "Home",
+}
+
+#######################################
+
 
 class SimMenu(MENU_TYPE):
     """
     The simulation main menu
+    The simulation engine (see the sim package) is only imported when it is first used, so
+    that NumPy doesn't slow down the start of ATMOS. Budget and Monte Carlo simulations run in
+    a background job, so the app keeps handling input while they run.
     """
 
     def __init__(self, *args, **kwargs):
         """
-        :precond: nav_select must exist in the scope immediately outside of this method call
-        :type nav_select: dict
+        :precond: sim_select must exist in the scope immediately outside of this method call
+        :type sim_select: dict
         """
         super().__init__(*args, **kwargs)
         self.message = "======== SIM ========"
-        self.prompt = Prompt("Where to next?", int, nav_select)
+        self.prompt = Prompt("Where to next?", int, sim_select)
+        self.elements = None  # the most recently propagated orbit
+        self.trajectory = None  # the states of the last propagated orbit
+        self.job = None  # the background simulation job (while one is running)
+        self._simulation = None  # the MonteCarlo being run (if any)
+        self._stop = threading.Event()  # asks the budget simulation to stop early
+
+    def ask(self, message: str, default: float, positive: bool = False) -> float:
+        """
+        Prompts for a number, falling back to a default if nothing (or nonsense) is entered
+
+        :param message: The question
+        :type message: str
+        :param default: The value used if the user just presses Enter
+        :type default: float
+        :param positive: (optional) If True, asks again until the number is more than 0
+        :type positive: bool
+        :return: The number
+        :rtype: float
+        """
+        while True:
+            value = self.interface.prompt(Prompt(f"{message} [{default:g}]:", float))
+            value = default if value is None else value
+            if not positive or value > 0:
+                return value
+            print("It must be more than 0!")
+
+    def propagate_orbit(self) -> None:
+        """
+        Propagates a circular orbit described by the user
+        """
+        import numpy as np
+        from sim.orbit import OrbitalElements, propagate, time_grid
+
+        altitude = self.ask("Altitude (km)", 500)
+        inclination = self.ask("Inclination (deg)", 97.4)
+        days = self.ask("Duration (days)", 1, positive=True)
+        step = self.ask("Step (s)", 10, positive=True)
+        elements = OrbitalElements.circular(altitude * 1000, np.radians(inclination))
+        self.run(lambda: propagate(elements, time_grid(days * 86400, step)), elements)
+
+    def propagate_tle(self) -> None:
+        """
+        Propagates a two-line element set entered by the user (with SGP4 if it is installed,
+        otherwise with the TLE's mean elements and J2)
+        """
+        from sim import orbit
+
+        line1 = self.interface.prompt(Prompt("TLE line 1:", str)) or ""
+        line2 = self.interface.prompt(Prompt("TLE line 2:", str)) or ""
+        days = self.ask("Duration (days)", 1, positive=True)
+        step = self.ask("Step (s)", 10, positive=True)
+        try:
+            elements = orbit.elements_from_tle(line1, line2)
+        except ValueError:
+            print("That doesn't look like a TLE!")
+            return
+        t = orbit.time_grid(days * 86400, step)
+        if orbit.Satrec is not None:
+            self.run(lambda: orbit.propagate_tle(line1, line2, t), elements)
+        else:
+            print("(sgp4 isn't installed: using the mean elements with J2 instead)")
+            self.run(lambda: orbit.propagate(elements, t), elements)
+
+    def run(self, propagation, elements) -> None:
+        """
+        Runs a propagation and prints a summary of the result
+
+        :param propagation: Does the propagation, returning a Trajectory
+        :type propagation: Callable
+        :param elements: The orbit that is being propagated
+        :type elements: OrbitalElements
+        """
+        import numpy as np
+
+        start = perf_counter()
+        try:
+            trajectory = propagation()
+        except (ValueError, ImportError) as e:
+            print(f"Propagation failed: {e}")
+            return
+        elapsed = perf_counter() - start
+        self.elements, self.trajectory = elements, trajectory
+
+        altitude = trajectory.altitude / 1000
+        raan_dot = elements.j2_rates()[0]
+        print(f"Propagated {len(trajectory.t):,} steps in {elapsed * 1000:.0f} ms")
+        print(f"  period       {elements.period / 60:.2f} min")
+        print(f"  altitude     {altitude.min():.1f} .. {altitude.max():.1f} km")
+        print(f"  node drift   {np.degrees(raan_dot) * 86400:+.4f} deg/day")
+
+    def budget(self) -> None:
+        """
+        Simulates the power and thermal budget along the last orbit propagated in the
+        background, optionally streaming the timeline to a results directory (as .npy channels)
+        """
+        if self.elements is None:
+            print("Propagate an orbit first!")
+            return
+        days = self.ask("Duration (days)", 30, positive=True)
+        step = self.ask("Step (s)", 10, positive=True)
+        folder = self.interface.prompt(Prompt("Results directory (blank for none):", str))
+        print("Simulating the budget (Cancel Simulation stops early)")
+        self._start(self._budget, self.elements, days, step, folder)
+
+    def _budget(self, elements, days: float, step: float, folder: str) -> List[str]:
+        """
+        Body of the budget job
+
+        :return: The lines of the report
+        :rtype: List[str]
+        """
+        import numpy as np
+        from sim.budget import ThermalModel, export, simulate
+        from testdata.results import NpyChannelSink
+
+        thermal = ThermalModel.cubesat()
+        timeline = simulate(elements, days * 86400, step, thermal=thermal)
+        sink = NpyChannelSink(folder) if folder else None
+        if sink is not None:
+            timeline = export(timeline, sink, thermal.names)
+
+        start = perf_counter()
+        samples = lit = energy = 0
+        lowest = 1.0
+        coldest = np.full(len(thermal.names), np.inf)
+        hottest = np.full(len(thermal.names), -np.inf)
+        try:
+            for part in timeline:
+                samples += len(part.t)
+                lit += int(part.sunlit.sum())
+                energy += float(part.generated.sum()) * step / 3600
+                lowest = min(lowest, float(part.soc.min()))
+                coldest = np.minimum(coldest, part.temperatures.min(axis=0))
+                hottest = np.maximum(hottest, part.temperatures.max(axis=0))
+                if self._stop.is_set():
+                    break
+        finally:
+            if sink is not None:
+                sink.close()
+        elapsed = perf_counter() - start
+        if not samples:
+            return ["Budget cancelled"]
+
+        simulated = samples * step / 86400
+        lines = [
+            f"Simulated {samples:,} steps in {elapsed * 1000:.0f} ms"
+            + (" (cancelled early)" if self._stop.is_set() else ""),
+            f"  in eclipse   {100 * (1 - lit / samples):.1f} % of the time",
+            f"  generated    {energy / simulated:.1f} Wh/day",
+            f"  lowest SOC   {100 * lowest:.1f} %",
+        ]
+        for name, low, high in zip(thermal.names, coldest, hottest):
+            lines.append(f"  {name:<12} {low - 273.15:+.1f} .. {high - 273.15:+.1f} C")
+        if sink is not None:
+            lines.append(f"  saved {sink.rows:,} rows to {folder}")
+        return lines
+
+    def monte_carlo(self) -> None:
+        """
+        Runs the mission model many times in the background with dispersed drag, orbit
+        insertion, battery fade and load (around the last orbit propagated, if any), printing
+        progress as the runs finish and percentiles at the end
+        """
+        import numpy as np
+        from sim.montecarlo import MISSION, Dispersion, MonteCarlo, mission
+        from sim.orbit import R_EARTH
+
+        nominal = dict(MISSION)
+        if self.elements is not None:
+            nominal["altitude"] = (self.elements.a - R_EARTH) / 1000
+            nominal["inclination"] = np.degrees(self.elements.i)
+        runs = max(int(self.ask("Runs", 200, positive=True)), 1)
+        nominal["days"] = self.ask("Duration (days)", 7, positive=True)
+        nominal["step"] = self.ask("Step (s)", 60, positive=True)
+        seed = int(self.ask("Seed", 0))
+        path = self.interface.prompt(Prompt("Results file (blank for none):", str))
+        dispersions = {
+            "altitude": Dispersion("normal", nominal["altitude"], 5.0),
+            "raan": Dispersion("uniform", 0.0, 360.0),
+            "anomaly": Dispersion("uniform", 0.0, 360.0),
+            "drag_coefficient": Dispersion("normal", nominal["drag_coefficient"], 0.2),
+            "battery_fade": Dispersion("uniform", 0.0, 0.2),
+            "load": Dispersion("normal", nominal["load"], 0.2),
+        }
+        self._simulation = MonteCarlo(mission, runs, dispersions, nominal, seed)
+        print(
+            f"Running {runs} runs on {self._simulation.workers} workers "
+            "(Cancel Simulation stops early)"
+        )
+        self._start(self._monte_carlo, self._simulation, path)
+
+    def _monte_carlo(self, simulation, path: str) -> List[str]:
+        """
+        Body of the Monte Carlo job: progress is printed on the event loop as the runs finish
+
+        :return: The lines of the report
+        :rtype: List[str]
+        """
+        from testdata.results import JsonLinesSink
+
+        sink = JsonLinesSink(path) if path else None
+        start = perf_counter()
+        every = max(simulation.runs // 10, 1)
+        try:
+            for summary in simulation.run(sink):
+                if summary.error is not None:
+                    self._app.call_soon(print, f"Run {summary.run} failed: {summary.error}")
+                elif simulation.completed % every == 0:
+                    message = f"  {simulation.completed} of {simulation.runs} runs done"
+                    self._app.call_soon(print, message)
+        finally:
+            if sink is not None:
+                sink.close()
+        return [simulation.report(), f"({perf_counter() - start:.1f} s)"]
+
+    def _start(self, job, *args) -> None:
+        """
+        Runs a simulation job in the background (one at a time)
+        """
+        self._stop.clear()
+        self.job = self._app.submit(job, *args, done=self.simulation_finished, stop=self.cancel)
+
+    def simulation_finished(self, job) -> None:
+        """
+        Prints the report of a finished simulation job
+
+        :param job: The finished background job (see App.submit)
+        :type job: asyncio.Future
+        """
+        self.job = None
+        self._simulation = None
+        error = job.exception()
+        if error is not None:
+            print(f"Simulation failed: {error!r}")
+        else:
+            for line in job.result():
+                print(line)
+        self.refresh()
+
+    def cancel(self) -> None:
+        """
+        Stops the running simulation early (the report covers what was simulated so far)
+        """
+        if self.job is None:
+            print("No simulation is running!")
+            return
+        self._stop.set()
+        if self._simulation is not None:
+            self._simulation.cancel()
+        print("Cancelling the simulation...")
 
     def perform(self, data):
         if data == 1:
             self.next = self.prev
+        elif data == 2:
+            self.propagate_orbit()
+        elif data == 3:
+            self.propagate_tle()
+        elif data in (4, 5) and self.job is not None:
+            print("A simulation is already running!")
+        elif data == 4:
+            self.budget()
+        elif data == 5:
+            self.monte_carlo()
+        elif data == 6:
+            self.cancel()
         elif data == 9:
+            if self.job is not None:
+                self.cancel()
             self.app_event("EXIT")
         elif data == 0:
             self.next = self.lookup_menu("WelcomeScreen")
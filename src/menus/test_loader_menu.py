@@ -1,7 +1,6 @@
 # test_loader_menu.py
 # Contains the TestLoaderMenu class which prompts the user to select a test to load into ATMOS
 
-from os import listdir, path
 from typing import Any
 
 from .config import MENU_TYPE
@@ -9,53 +8,78 @@ from .ui import Prompt
 
 # ## Instance variables for TestLoaderMenu ## #
 
+# The most tests listed at once (narrow the list down by searching)
+PAGE_SIZE = 20
+
+
 class TestLoaderMenu(MENU_TYPE):
     """
     The test loader menu (prompts user to select a test)
+    The tests are listed from the loader's catalog. Entering a number loads that test, entering
+    a test's name loads it by name, and anything else searches the catalog by name prefix and
+    tags (e.g. "pow #smoke"); an empty entry clears the search.
     """
 
     def __init__(self, loader, *args, **kwargs):
         """
-        :precond: test_loader_select must exist in a local or non-local scope
-        :type test_loader_select: dict
         :param loader: The TestLoader instance that will be used to load the selected test
         :type loader: TestLoader
         """
         super().__init__(*args, **kwargs)
         self.message = "======== LOAD ========"
         self.loader = loader
+        self.query = ""  # the current search
         self.prompt_options = {}
-
-        test_path = path.join(path.dirname(path.abspath(__file__)), "..", "testdata")
-        files = listdir(test_path)
-
-        for f in files:
-            if f in [
-                "test_module.py",
-                "test_registry.py",
-                "connections.py",
-            ]:  # blacklist of py files
-                continue
-            name = "".join(f.split(".")[:-1])
-            if name not in ["", "\n", "\r", "\r\n"] and f.endswith(".py"):
-                self.prompt_options.update(
-                    {len(self.prompt_options.keys())+1: f"{name.title()}Test"}
-                )
-        self.prompt = Prompt(
-            "Select one of the following tests:", Any, self.prompt_options
-        )
         self.selection = None
+        self._version = None  # the catalog version that prompt_options were built from
+        self._refresh()
+
+    def _refresh(self) -> None:
+        """
+        Rebuilds the list of tests for the current search (if the catalog has changed)
+        """
+        version = (self.loader.catalog.version, self.query)
+        if version == self._version:
+            return
+        self._version = version
+
+        results = self.loader.search(self.query, PAGE_SIZE + 1)
+        self.prompt_options = {
+            number: entry.name for number, entry in enumerate(results[:PAGE_SIZE], start=1)
+        }
+        if not results:
+            heading = f'No tests match "{self.query}"'
+        elif len(results) > PAGE_SIZE:
+            heading = f"Showing the first {PAGE_SIZE} tests (type to search)"
+        elif self.query:
+            heading = f'Tests matching "{self.query}"'
+        else:
+            heading = "Select one of the following tests (or type to search)"
+        self.prompt = Prompt(f"{heading}:", Any, self.prompt_options)
+
+    def render(self) -> None:
+        """
+        Draws the menu, listing the tests as they are now (tests can be hot-reloaded)
+        """
+        self._refresh()
+        super().render()
 
     def perform(self, data):
         """
         Test Loader menu options are a list of strings corresponding to test names
         """
-        self.loader.unload()
-        if isinstance(data, str):
-            self.loader.load(str(data))
-        elif isinstance(data, int):
-            self.loader.load(self.prompt_options[data])
+        if isinstance(data, int) and data in self.prompt_options:
+            name = self.prompt_options[data]
+        elif isinstance(data, str):
+            entry = self.loader.catalog.find(data.strip())
+            if entry is None:
+                self.query = data.strip()  # stay here and show the search results
+                return
+            name = entry.name
         else:
-            pass  # But we should probably handle this better
+            return  # But we should probably handle this better
 
+        self.loader.unload()
+        self.loader.load(name)
+        self.query = ""
         self.next = self.lookup_menu("TestMenu")
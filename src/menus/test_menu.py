@@ -1,6 +1,8 @@
 # test_menu.py
 # Contains the TestMenu class which displays the Test mode screen
 
+from runner import ParallelRunner
+
 from .config import MENU_TYPE
 from .ui import Prompt
 
@@ -12,6 +14,8 @@ test_select = {
     2: "Check Connection",
     3: "Start Test",
     4: "Export Results",
+    5: "Run Tests in Parallel",
+    6: "Cancel Parallel Run",
     9: "Exit",
     0: "Home",
 }
@@ -38,6 +42,9 @@ class TestMenu(MENU_TYPE):
         self.loader.set_menu(self)
         self.test = None
         self.test_kwargs = None
+        self.running = False  # True while the loaded test is being run
+        self._reloaded = None  # a new version of the loaded test, waiting for its run to end
+        self.parallel = None  # the ParallelRunner of the run in progress (if any)
 
     def load_test(self, test):
         """
@@ -48,9 +55,134 @@ class TestMenu(MENU_TYPE):
         """
         self.test = test() if test is not None else test
 
+    def reload_test(self, test):
+        """
+        Swaps the loaded test for a new version of its class (e.g. after its file was edited)
+        If the test is running, the swap waits until the run is over. This may be called from
+        any thread (e.g. the TestLoader's watcher).
+
+        :param test: The new version of the loaded test's class (or None if it was deleted)
+        :type test: Test or None
+        """
+        self._app.call_soon(self._swap_test, test)
+
+    def notify(self, message: str) -> None:
+        """
+        Prints a message on the app's event loop, so it can be called from any thread (e.g. the
+        TestLoader's watcher) without writing over the screen
+
+        :param message: The message to print
+        :type message: str
+        """
+        self._app.call_soon(self._notify, message)
+
+    def _notify(self, message: str) -> None:
+        """
+        Prints a message (on the app's event loop)
+        """
+        print(f"\n{message}")
+        self.refresh()
+
+    def _swap_test(self, test):
+        """
+        Swaps the loaded test (on the app's event loop) unless it is running
+        """
+        if self.running:
+            self._reloaded = (test,)
+            return
+        if self.test is None:  # unloaded in the meantime
+            return
+        name = self.test.__class__.__name__
+        self.load_test(test)
+        print(f"\n{name} was {'reloaded' if test is not None else 'removed'}")
+
+    def test_finished(self, run) -> None:
+        """
+        Reports the outcome of a test run, and applies any reload that waited for it
+
+        :param run: The finished background job (see App.submit)
+        :type run: asyncio.Future
+        """
+        self.running = False
+        error = run.exception()
+        if error is not None:
+            print(f"Test crashed: {error!r}")
+        else:
+            print("Test passed!" if run.result() else "Test failed!")
+        if self._reloaded is not None:
+            (test,), self._reloaded = self._reloaded, None
+            self._swap_test(test)
+        self.refresh()
+
+    def run_parallel(self, ports):
+        """
+        Runs all of the loader's tests across several ports at once in a background job,
+        printing each result as it arrives (Cancel Parallel Run stops the run)
+
+        :param ports: The serial ports to spread the tests across
+        :type ports: list
+        """
+        port_map = ParallelRunner.distribute(sorted(self.loader.library), ports)
+        self.parallel = ParallelRunner(self.loader.library, port_map)
+        self._app.submit(
+            self._run_parallel, self.parallel, done=self.parallel_finished, stop=self.cancel
+        )
+
+    def _run_parallel(self, runner: ParallelRunner) -> int:
+        """
+        Body of the parallel run job: hands each result to the event loop as it arrives
+
+        :param runner: The runner to run
+        :type runner: ParallelRunner
+        :return: The number of results received
+        :rtype: int
+        """
+        received = 0
+        for result in runner.run():
+            received += 1
+            self._app.call_soon(self.show_result, result)
+        return received
+
+    def show_result(self, result) -> None:
+        """
+        Prints the result of one test from a parallel run
+
+        :param result: The result
+        :type result: RunResult
+        """
+        status = {True: "PASS", False: "FAIL", None: "SKIP"}[result.passed]
+        line = f"[{status}] {result.test} on {result.port} ({result.seconds:.2f} s)"
+        print(line if result.error is None else f"{line}: {result.error}")
+        self.refresh()
+
+    def parallel_finished(self, run) -> None:
+        """
+        Reports the end of a parallel run
+
+        :param run: The finished background job (see App.submit)
+        :type run: asyncio.Future
+        """
+        self.parallel = None
+        error = run.exception()
+        if error is not None:
+            print(f"Parallel run crashed: {error!r}")
+        else:
+            print(f"Parallel run finished ({run.result()} results)")
+        self.refresh()
+
+    def cancel(self) -> None:
+        """
+        Stops the running test and parallel run (if any)
+        """
+        if self.running:
+            self.test.cancel()
+        if self.parallel is not None:
+            self.parallel.cancel(force=True)
+
     def perform(self, data):
         """
-        Test menu options are Load Test, Check Connection, Start Test, Export Results, Exit, Home.
+        Test menu options are Load Test, Check Connection, Start Test, Export Results,
+        Run Tests in Parallel, Cancel Parallel Run, Exit, Home.
         """
 
         if data == 1:
@@ -65,17 +197,43 @@ class TestMenu(MENU_TYPE):
                 print("Connection not found!")
 
         elif data == 3:
-            # Start test
-            self.test._run_full()
+            # Start test (in the background, so the app keeps handling input and links)
+            if self.running:
+                print("A test is already running!")
+            else:
+                self.running = True
+                self._app.submit(self.test._run_full, done=self.test_finished, stop=self.cancel)
 
         elif data == 4:
             # Export results
             # self.next = self.lookup_menu("TestExportMenu")
-            self.test._export(
-                f"testdata/{self.test.__class__.__name__}_results.json"
-            )  # TODO ^^
+            location = f"testdata/{self.test.__class__.__name__}_results.jsonl"
+            if self.test._export(location):  # TODO ^^
+                print(f"Results exported to {location}")
+            else:
+                print("There are no results to export!")
+
+        elif data == 5:
+            # Run every test in the library, spread across the given ports
+            ports = self.interface.prompt(
+                Prompt("Enter the serial ports or socket URLs to use (comma-separated):", str)
+            )
+            ports = [port.strip() for port in (ports or "").split(",") if port.strip()]
+            if self.parallel is not None:
+                print("A parallel run is already in progress!")
+            elif ports:
+                self.run_parallel(ports)
+
+        elif data == 6:
+            # Cancel the parallel run (the tests running right now are stopped too)
+            if self.parallel is None:
+                print("No parallel run is in progress!")
+            else:
+                self.parallel.cancel(force=True)
+                print("Cancelling the parallel run...")
 
         elif data == 9:
+            self.cancel()
             self.app_event("EXIT")
 
         elif data == 0:
@@ -1,6 +1,10 @@
 # ui.py
 # Handles user input and outputs information to console
 
+import os
+import queue
+import sys
+import threading
 from abc import ABC, abstractmethod
 from typing import Any, Union
 
@@ -14,15 +18,36 @@ class Prompt:
         self._message = message
         self.type = expected_type
         self._options = options
+        self._rendered = None  # the message as last built (see invalidate)
 
     @property
     def message(self):
-        output = self._message
-        if len(self._options) > 0:
-            output += "\n"
-            for k, v in self._options.items():
-                output += f"{k}. {v}\n"
-        return output
+        if self._rendered is None:
+            lines = [self._message]
+            if len(self._options) > 0:
+                lines += [f"{k}. {v}" for k, v in self._options.items()]
+                lines.append("")
+            self._rendered = "\n".join(lines)
+        return self._rendered
+
+    @property
+    def options(self) -> dict:
+        """
+        :return: The numbered options (call invalidate() after changing the dict in place)
+        :rtype: dict
+        """
+        return self._options
+
+    @options.setter
+    def options(self, options: dict) -> None:
+        self._options = options
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """
+        Makes the message be rebuilt the next time it is shown
+        """
+        self._rendered = None
 
 
 # Class: BaseOutput
@@ -85,6 +110,10 @@ class TerminalInput(BaseInput):
     Allows text input from a terminal environment.
     """
 
+    # Set by the App while its event loop owns the terminal, so that a prompt made from inside
+    # a menu reads from the same buffer (see LineReader)
+    reader = None
+
     def get(self) -> str:
         """
         Returns a string as input from the terminal
@@ -92,9 +121,131 @@ class TerminalInput(BaseInput):
         :return: The newline-terminated string from the terminal
         :rtype: str
         """
+        if TerminalInput.reader is not None:
+            return TerminalInput.reader.read_line()
         return input()
 
 
+# Class: LineReader
+# Purpose: Delivers terminal input to the App's event loop
+class LineReader:
+    """
+    Delivers the lines typed at the terminal to the app's event loop
+    The terminal is watched with the loop's add_reader() where that is supported (Unix
+    terminals and pipes); otherwise a thread blocks on sys.stdin and hands lines to the loop.
+    """
+
+    def __init__(self, loop, on_line, on_eof):
+        """
+        :param loop: The event loop to deliver lines on
+        :type loop: asyncio.AbstractEventLoop
+        :param on_line: Called with each line entered (without its newline)
+        :type on_line: Callable[[str], None]
+        :param on_eof: Called once the terminal (or pipe) is closed
+        :type on_eof: Callable[[], None]
+        """
+        self.loop = loop
+        self.on_line = on_line
+        self.on_eof = on_eof
+        self._buffer = bytearray()  # bytes read but not yet delivered (add_reader mode)
+        self._lines = queue.Queue()  # lines read but not yet delivered (thread mode)
+        self._fd = None
+        self._thread = None
+        self._eof = False
+
+    def start(self) -> None:
+        """
+        Starts watching the terminal
+        """
+        try:
+            fd = sys.stdin.fileno()
+            self.loop.add_reader(fd, self._readable)
+            self._fd = fd
+        except (AttributeError, NotImplementedError, OSError, ValueError):
+            # e.g. Windows, or stdin redirected from a regular file
+            self._thread = threading.Thread(target=self._read_lines, name="LineReader", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops watching the terminal (a reader thread finishes with its current line)
+        """
+        if self._fd is not None:
+            self.loop.remove_reader(self._fd)
+            self._fd = None
+
+    def _readable(self) -> None:
+        """
+        Reads whatever the terminal has and delivers each complete line
+        """
+        data = os.read(self._fd, 4096)
+        if not data:
+            if self._buffer:  # a last line without a newline
+                self.on_line(self._pop_line())
+            self.stop()
+            self._eof = True
+            self.on_eof()
+            return
+        self._buffer += data
+        while self._fd is not None and b"\n" in self._buffer:
+            self.on_line(self._pop_line())
+
+    def _pop_line(self) -> str:
+        """
+        :return: The first complete line in the buffer
+        :rtype: str
+        """
+        line, _, rest = bytes(self._buffer).partition(b"\n")
+        self._buffer = bytearray(rest)
+        return line.decode(errors="replace").rstrip("\r")
+
+    def _read_lines(self) -> None:
+        """
+        Body of the reader thread (used when the loop can't watch the terminal)
+        """
+        for line in iter(sys.stdin.readline, ""):
+            self._lines.put(line.rstrip("\r\n"))
+            self.loop.call_soon_threadsafe(self._deliver)
+        self._lines.put(None)
+        self.loop.call_soon_threadsafe(self._deliver)
+
+    def _deliver(self) -> None:
+        """
+        Hands lines read by the thread to the app (on the loop)
+        """
+        while True:
+            try:
+                line = self._lines.get_nowait()
+            except queue.Empty:
+                return
+            if line is None:
+                self._eof = True
+                self.on_eof()
+                return
+            self.on_line(line)
+
+    def read_line(self) -> str:
+        """
+        Waits for the next line, e.g. for a prompt made from inside a menu's perform()
+        This blocks the event loop until the line arrives, so it is best kept for short prompts.
+
+        :return: The line entered (without its newline)
+        :rtype: str
+        """
+        if self._thread is not None:
+            line = self._lines.get()
+        else:
+            while not self._eof and b"\n" not in self._buffer:
+                data = os.read(sys.stdin.fileno(), 4096)
+                if not data:
+                    self._eof = True
+                self._buffer += data
+            line = self._pop_line() if b"\n" in self._buffer or self._buffer else None
+        if line is None:
+            raise EOFError
+        return line
+
+
 # Class: UI
 # Purpose: Abstract base class for user interface
 class UI(ABC):
@@ -114,6 +265,7 @@ class UI(ABC):
         self.inputSrc = None
         self.outputDst = None
         self.quietMode = False
+        self.live = False  # True if a redrawn menu replaces the old one (rather than scrolling)
 
     @abstractmethod
     def get_str(self) -> str:
@@ -145,6 +297,48 @@ class UI(ABC):
         """
         pass
 
+    def reader(self, loop, on_line, on_eof):
+        """
+        Creates the source of the lines the user enters, for the app's event loop
+
+        :param loop: The event loop to deliver lines on
+        :type loop: asyncio.AbstractEventLoop
+        :param on_line: Called with each line entered
+        :type on_line: Callable[[str], None]
+        :param on_eof: Called once input has ended
+        :type on_eof: Callable[[], None]
+        :return: The (not yet started) reader
+        :rtype: LineReader
+        """
+        return LineReader(loop, on_line, on_eof)
+
+    def begin_frame(self) -> None:
+        """
+        Marks the start of a menu being drawn (everything output until end_frame() belongs to
+        one screenful)
+        """
+        pass
+
+    def end_frame(self) -> None:
+        """
+        Marks the end of a menu being drawn
+        """
+        pass
+
+    @abstractmethod
+    def parse(self, prompt, entry: str) -> Union[Union[int, float], str]:
+        """
+        Converts what the user entered into the response a prompt expects
+
+        :param prompt: The prompt that was answered
+        :type prompt: Prompt
+        :param entry: The text the user entered
+        :type entry: str
+        :return: The response (as an int, float, or str)
+        :rtype: Union[Union[int, float], str]
+        """
+        pass
+
     @abstractmethod
     def prompt(self, prompt: str, type_: Any = str) -> Union[Union[int, float], str]:
         """
@@ -190,7 +384,20 @@ class TUI(UI):
         :return: The number (int or float) that the user entered
         :rtype: Union[int, float]
         """
-        input_str = self.get_str()
+        return self._to_num(self.get_str(), any)
+
+    @staticmethod
+    def _to_num(input_str: str, any=False) -> Union[int, float]:
+        """
+        Converts a user-entered string to a number
+
+        :param input_str: The string the user entered
+        :type input_str: str
+        :param any: (optional) If True, return input_str if it cannot be converted
+        :type any: bool
+        :return: The number (int or float) that the user entered
+        :rtype: Union[int, float]
+        """
         try:
             if float(input_str):
                 if int(float(input_str)):
@@ -224,15 +431,28 @@ class TUI(UI):
         :rtype: Union[Union[int, float], str]
         """
         self.output(prompt.message)
+        return self.parse(prompt, self.get_str())
+
+    def parse(self, prompt: Prompt, entry: str) -> Union[Union[int, float], str]:
+        """
+        Converts what the user entered into the response a prompt expects
+
+        :param prompt: The Prompt object that was answered
+        :type prompt: Prompt
+        :param entry: The text the user entered (without the newline)
+        :type entry: str
+        :return: The user's response to the prompt
+        :rtype: Union[Union[int, float], str]
+        """
         response = None
         if prompt.type == Any:
-            response = self.get_num(any=True)  # This could be better-implemented
+            response = self._to_num(entry, any=True)  # This could be better-implemented
             try:
                 response = int(response)
-            except ValueError:
+            except (TypeError, ValueError):
                 pass
         elif prompt.type == str:
-            response = self.get_str()
+            response = entry
         elif prompt.type in [int, float]:
-            response = self.get_num()
+            response = self._to_num(entry)
         return response
@@ -0,0 +1,309 @@
+# ccsds.py
+# Contains a decoder for CCSDS space packets (CCSDS 133.0-B) that decodes a whole downlinked
+# buffer of concatenated packets at once
+#
+# Decoding is done in two stages: the primary headers are walked to find where every packet
+# starts (the only sequential part, since each packet's position depends on the length of the one
+# before it; runs of equally-sized packets are found with one vectorized check per run), then the
+# header fields of every packet are read through a structured dtype and unpacked with array
+# operations. Payloads are views into the original buffer, so nothing is copied.
+
+from typing import Iterator, NamedTuple, Tuple
+
+import numpy as np
+
+PRIMARY_HEADER = 6  # bytes
+SEQUENCE_MODULUS = 1 << 14  # the sequence count wraps around after 16383
+
+# The primary header, as three big-endian words
+HEADER_DTYPE = np.dtype([("id", ">u2"), ("sequence", ">u2"), ("length", ">u2")])
+
+# Sequence flags
+CONTINUATION = 0
+FIRST = 1
+LAST = 2
+UNSEGMENTED = 3
+
+GAP_DTYPE = np.dtype([("apid", "u2"), ("index", "i8"), ("missing", "i8")])
+
+
+def walk(buffer, start: int = 0, run: int = 4096) -> Tuple[np.ndarray, int]:
+    """
+    Finds where every complete packet in a buffer starts by following the packet lengths
+    Once two packets in a row have the same size, the rest of the run is checked with one array
+    operation, so buffers of mostly fixed-size packets are walked at array speed.
+    The walk stops at a truncated packet (e.g. the rest of it is in the next buffer) or at a header
+    that isn't a version 1 space packet (the data is corrupt and there is no way to resynchronize).
+
+    :param buffer: The packets, back to back
+    :type buffer: Union[bytes, bytearray, memoryview, np.ndarray]
+    :param start: (optional) The offset of the first packet, defaults to 0
+    :type start: int
+    :param run: (optional) The most packets checked at once, defaults to 4096
+    :type run: int
+    :return: The offset of every packet, and the offset just past the last one
+    :rtype: Tuple[np.ndarray, int]
+    """
+    data = np.frombuffer(buffer, np.uint8)
+    view = memoryview(data)  # plain int indexing for the sequential part
+    end = len(data)
+    found = []  # offsets found one at a time, not yet added to chunks
+    chunks = []
+    pos = start
+    previous = -1
+    span = 16  # how many packets to check at once: doubles while runs keep going
+    while pos + PRIMARY_HEADER <= end and view[pos] >> 5 == 0:
+        size = PRIMARY_HEADER + 1 + (view[pos + 4] << 8 | view[pos + 5])
+        if pos + size > end:
+            break
+        if size != previous:
+            found.append(pos)
+            previous = size
+            pos += size
+            continue
+
+        # the same size twice in a row: check as much of the run as fits in one go
+        count = min(span, (end - pos) // size)
+        candidates = np.arange(pos, pos + count * size, size)
+        sizes = data[candidates + 4].astype(np.int64) << 8 | data[candidates + 5]
+        valid = (sizes == size - PRIMARY_HEADER - 1) & (data[candidates] >> 5 == 0)
+        if valid.all():
+            span = min(span * 2, run)
+        else:
+            count = int(np.argmin(valid))  # up to the first packet that breaks the run
+            span = 16
+        if found:
+            chunks.append(np.array(found, np.int64))
+            found = []
+        chunks.append(candidates[:count])
+        pos += count * size
+    if found:
+        chunks.append(np.array(found, np.int64))
+    offsets = np.concatenate(chunks) if chunks else np.empty(0, np.int64)
+    return offsets, pos
+
+
+class SequenceCheck(NamedTuple):
+    """
+    The result of checking the sequence counts of each APID for gaps and duplicates
+    """
+
+    gaps: np.ndarray  # GAP_DTYPE: the packet after each gap, and how many packets are missing
+    duplicates: np.ndarray  # the indices of packets that repeat the previous count of their APID
+
+    @property
+    def missing(self) -> int:
+        """
+        :return: The total number of packets missing
+        :rtype: int
+        """
+        return int(self.gaps["missing"].sum())
+
+
+class Packets:
+    """
+    Every complete space packet in a buffer, with its header fields as arrays (one element per
+    packet, in buffer order)
+    """
+
+    def __init__(self, buffer, offsets: np.ndarray, end: int):
+        """
+        Initializes a new Packets instance (use decode() instead)
+
+        :param buffer: The buffer the packets are in
+        :type buffer: Union[bytes, bytearray, memoryview, np.ndarray]
+        :param offsets: The offset of each packet (see walk)
+        :type offsets: np.ndarray
+        :param end: The offset just past the last complete packet
+        :type end: int
+        """
+        self.data = np.frombuffer(buffer, np.uint8)
+        self.offsets = offsets
+        self.end = end
+        self.headers = _gather(self.data, offsets, HEADER_DTYPE)
+
+        words = self.headers
+        self.version = (words["id"] >> 13).astype(np.uint8)
+        self.type = (words["id"] >> 12 & 1).astype(np.uint8)  # 0 telemetry, 1 telecommand
+        self.secondary = (words["id"] >> 11 & 1).astype(bool)  # has a secondary header
+        self.apid = words["id"] & 0x7FF
+        self.flags = (words["sequence"] >> 14).astype(np.uint8)  # see FIRST, LAST, etc.
+        self.count = words["sequence"] & 0x3FFF
+        self.length = words["length"].astype(np.int64) + 1  # bytes in the packet data field
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    @property
+    def remainder(self) -> int:
+        """
+        :return: The number of bytes after the last complete packet (e.g. to prepend to the next
+                 buffer)
+        :rtype: int
+        """
+        return len(self.data) - self.end
+
+    def select(self, apid: int) -> np.ndarray:
+        """
+        :param apid: An application process identifier
+        :type apid: int
+        :return: The indices of that APID's packets
+        :rtype: np.ndarray
+        """
+        return np.flatnonzero(self.apid == apid)
+
+    def payload(self, index: int) -> np.ndarray:
+        """
+        :param index: The index of a packet
+        :type index: int
+        :return: The packet data field (secondary header included), as a view into the buffer
+        :rtype: np.ndarray
+        """
+        start = int(self.offsets[index]) + PRIMARY_HEADER
+        return self.data[start : start + int(self.length[index])]
+
+    def payloads(self, apid: int = None) -> Iterator[np.ndarray]:
+        """
+        Iterates over the packet data fields, as views into the buffer
+
+        :param apid: (optional) Only the packets of this APID, defaults to every packet
+        :type apid: int
+        :return: The data field of each packet, in buffer order
+        :rtype: Iterator[np.ndarray]
+        """
+        indices = range(len(self)) if apid is None else self.select(apid)
+        for index in indices:
+            yield self.payload(index)
+
+    def fields(self, dtype: np.dtype, apid: int = None, offset: int = 0) -> np.ndarray:
+        """
+        Reads the same fields out of many packets' data fields at once
+        When the packets are evenly spaced in the buffer (e.g. one APID of fixed-size packets),
+        the result is a strided view into the buffer rather than a copy.
+
+        :param dtype: The layout of the fields (e.g. a structured dtype of big-endian values)
+        :type dtype: np.dtype
+        :param apid: (optional) Only the packets of this APID, defaults to every packet
+        :type apid: int
+        :param offset: (optional) Where the fields start in the data field, e.g. the size of the
+                       secondary header, defaults to 0
+        :type offset: int
+        :return: One element per packet
+        :rtype: np.ndarray
+        """
+        dtype = np.dtype(dtype)
+        indices = slice(None) if apid is None else self.select(apid)
+        if np.any(self.length[indices] < offset + dtype.itemsize):
+            raise ValueError(f"Some packets are too short to hold {dtype.itemsize} bytes of fields")
+        starts = self.offsets[indices] + PRIMARY_HEADER + offset
+        return _gather(self.data, starts, dtype)
+
+    def check_sequence(self) -> SequenceCheck:
+        """
+        Looks for gaps and duplicates in each APID's sequence counts (which wrap at 16383)
+        A packet whose count equals the previous one of its APID is a duplicate; one that skips
+        ahead follows a gap.
+
+        :return: The gaps and duplicates found
+        :rtype: SequenceCheck
+        """
+        order = np.argsort(self.apid, kind="stable")  # each APID's packets, in buffer order
+        apid = self.apid[order]
+        step = np.diff(self.count[order].astype(np.int64)) % SEQUENCE_MODULUS
+        same = apid[1:] == apid[:-1]
+        after = order[1:]  # the packet each step leads to
+
+        duplicate = same & (step == 0)
+        gap = same & (step > 1)
+        gaps = np.empty(int(gap.sum()), GAP_DTYPE)
+        gaps["apid"] = apid[1:][gap]
+        gaps["index"] = after[gap]
+        gaps["missing"] = step[gap] - 1
+        gaps.sort(order="index")
+        return SequenceCheck(gaps, np.sort(after[duplicate]))
+
+    def summary(self) -> dict:
+        """
+        :return: The number of packets and bytes of each APID
+        :rtype: dict
+        """
+        apids, inverse, counts = np.unique(self.apid, return_inverse=True, return_counts=True)
+        sizes = np.bincount(inverse, weights=self.length + PRIMARY_HEADER)
+        return {
+            int(apid): (int(count), int(size)) for apid, count, size in zip(apids, counts, sizes)
+        }
+
+
+def _gather(data: np.ndarray, starts: np.ndarray, dtype: np.dtype) -> np.ndarray:
+    """
+    Reads one dtype-shaped record at each offset in a byte array
+
+    :param data: The bytes
+    :type data: np.ndarray
+    :param starts: The offset of each record
+    :type starts: np.ndarray
+    :param dtype: The layout of a record
+    :type dtype: np.dtype
+    :return: The records (a strided view when they are evenly spaced, otherwise a copy)
+    :rtype: np.ndarray
+    """
+    if len(starts) == 0:
+        return np.empty(0, dtype)
+    steps = np.diff(starts)
+    if len(steps) == 0 or np.all(steps == steps[0]):
+        stride = int(steps[0]) if len(steps) else dtype.itemsize
+        return np.ndarray(
+            (len(starts),), dtype, buffer=data, offset=int(starts[0]), strides=(stride,)
+        )
+    rows = data[starts[:, None] + np.arange(dtype.itemsize)]
+    return rows.view(dtype)[:, 0]
+
+
+def decode(buffer, start: int = 0) -> Packets:
+    """
+    Decodes every complete space packet in a buffer
+
+    :param buffer: The packets, back to back
+    :type buffer: Union[bytes, bytearray, memoryview, np.ndarray]
+    :param start: (optional) The offset of the first packet, defaults to 0
+    :type start: int
+    :return: The packets
+    :rtype: Packets
+    """
+    offsets, end = walk(buffer, start)
+    return Packets(buffer, offsets, end)
+
+
+def encode(
+    apid: int,
+    count: int,
+    payload: bytes,
+    telecommand: bool = False,
+    secondary: bool = False,
+    flags: int = UNSEGMENTED,
+) -> bytes:
+    """
+    Builds a space packet (e.g. to test the decoder with)
+
+    :param apid: The application process identifier (0 to 2047)
+    :type apid: int
+    :param count: The sequence count (taken modulo 16384)
+    :type count: int
+    :param payload: The packet data field (1 to 65536 bytes, secondary header included)
+    :type payload: bytes
+    :param telecommand: (optional) Whether it is a telecommand rather than telemetry
+    :type telecommand: bool
+    :param secondary: (optional) Whether the data field starts with a secondary header
+    :type secondary: bool
+    :param flags: (optional) The sequence flags, defaults to UNSEGMENTED
+    :type flags: int
+    :return: The packet
+    :rtype: bytes
+    """
+    if not 0 < len(payload) <= 1 << 16:
+        raise ValueError("A packet data field must be 1 to 65536 bytes long")
+    header = np.empty(1, HEADER_DTYPE)
+    header["id"] = int(telecommand) << 12 | int(secondary) << 11 | apid & 0x7FF
+    header["sequence"] = flags << 14 | count % SEQUENCE_MODULUS
+    header["length"] = len(payload) - 1
+    return header.tobytes() + bytes(payload)
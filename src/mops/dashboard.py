@@ -0,0 +1,276 @@
+# dashboard.py
+# Contains the telemetry Dashboard behind the MissionOpsMenu: the latest value of each channel
+# plus a min/max-decimated trend, fed from a serial line by a TelemetryFeed
+#
+# Telemetry frames are lines of comma-separated name=value fields, e.g. (from the McuEmulator)
+#   t=12.250,bus_voltage=7.4123,bus_current=0.5012,board_temp=20.0410
+
+import math
+import threading
+from array import array
+from time import monotonic
+from typing import Dict, List, Tuple, Union
+
+SPARKS = " ▁▂▃▄▅▆▇█"  # sparkline levels, from "no data" up to the top of the range
+
+
+def parse_frame(frame: Union[bytes, str]) -> Dict[str, float]:
+    """
+    Reads the numeric fields of a telemetry frame
+
+    :param frame: A frame such as b"t=1.0,bus_voltage=7.4"
+    :type frame: Union[bytes, str]
+    :return: The value of each field (fields that aren't name=number are skipped)
+    :rtype: Dict[str, float]
+    """
+    if isinstance(frame, (bytes, bytearray, memoryview)):
+        frame = bytes(frame).decode("ascii", errors="replace")
+    values = {}
+    for field in frame.strip().split(","):
+        name, _, value = field.partition("=")
+        try:
+            values[name.strip()] = float(value)
+        except ValueError:
+            continue
+    return values
+
+
+class MinMaxTrace:
+    """
+    The recent history of one channel, decimated to a fixed number of columns
+    Each column covers an equal slice of the time window and keeps only the minimum and maximum
+    sample that fell into it, so adding a sample is O(1) and a 1 kHz channel takes no more
+    memory or drawing time than a 1 Hz one, while spikes still show up.
+    """
+
+    def __init__(self, columns: int = 60, window: float = 60.0):
+        """
+        :param columns: (optional) The number of columns (e.g. the width of the sparkline)
+        :type columns: int
+        :param window: (optional) The number of seconds of history to keep
+        :type window: float
+        """
+        self.columns = columns
+        self.window = window
+        self.width = window / columns  # the seconds covered by one column
+        self.mins = array("d", [math.nan] * columns)
+        self.maxs = array("d", [math.nan] * columns)
+        self.newest = None  # the number of the newest column (time // width)
+        self.last = math.nan  # the most recent sample
+        self.samples = 0
+
+    def add(self, timestamp: float, value: float) -> None:
+        """
+        Adds a sample
+
+        :param timestamp: When the sample was taken, in seconds
+        :type timestamp: float
+        :param value: The sample
+        :type value: float
+        """
+        column = int(timestamp // self.width)
+        self._advance(column)
+        if column <= self.newest - self.columns:
+            return  # older than the window
+        index = column % self.columns
+        if not value >= self.mins[index]:  # (also true when the column is empty: NaN)
+            self.mins[index] = value
+        if not value <= self.maxs[index]:
+            self.maxs[index] = value
+        if column == self.newest:
+            self.last = value
+        self.samples += 1
+
+    def _advance(self, column: int) -> None:
+        """
+        Moves the window forward so that it ends at a column, emptying the columns it passes
+        """
+        if self.newest is None:
+            self.newest = column
+            return
+        if column <= self.newest:
+            return
+        for number in range(max(self.newest + 1, column - self.columns + 1), column + 1):
+            self.mins[number % self.columns] = math.nan
+            self.maxs[number % self.columns] = math.nan
+        self.newest = column
+
+    def history(self, now: float = None) -> Tuple[List[float], List[float]]:
+        """
+        :param now: (optional) The current time, to end the window at (defaults to the newest
+                    sample)
+        :type now: float
+        :return: The minimum and maximum of each column, oldest first (NaN where empty)
+        :rtype: Tuple[List[float], List[float]]
+        """
+        if self.newest is None:
+            return [math.nan] * self.columns, [math.nan] * self.columns
+        if now is not None:
+            self._advance(int(now // self.width))
+        start = self.newest + 1
+        order = [(start + i) % self.columns for i in range(self.columns)]
+        return [self.mins[i] for i in order], [self.maxs[i] for i in order]
+
+
+def sparkline(mins: List[float], maxs: List[float]) -> str:
+    """
+    Draws a trend with one character per column, scaled to the overall range
+    Each column is drawn at the height of its maximum, so short spikes are never hidden.
+
+    :param mins: The minimum of each column (NaN where empty)
+    :type mins: List[float]
+    :param maxs: The maximum of each column (NaN where empty)
+    :type maxs: List[float]
+    :return: The sparkline
+    :rtype: str
+    """
+    present = [value for value in mins + maxs if not math.isnan(value)]
+    if not present:
+        return " " * len(maxs)
+    low, high = min(present), max(present)
+    span = high - low
+    top = len(SPARKS) - 1
+    out = []
+    for value in maxs:
+        if math.isnan(value):
+            out.append(SPARKS[0])
+        elif span == 0:
+            out.append(SPARKS[(top + 1) // 2])
+        else:
+            out.append(SPARKS[1 + round((value - low) / span * (top - 1))])
+    return "".join(out)
+
+
+class Dashboard:
+    """
+    The latest value and decimated trend of every telemetry channel seen
+    Frames can be ingested from any thread at any rate; render() reads a consistent snapshot
+    and costs the same however fast the data arrives.
+    """
+
+    def __init__(self, columns: int = 40, window: float = 60.0):
+        """
+        :param columns: (optional) The width of each channel's sparkline
+        :type columns: int
+        :param window: (optional) The number of seconds each sparkline covers
+        :type window: float
+        """
+        self.columns = columns
+        self.window = window
+        self.traces = {}  # type: Dict[str, MinMaxTrace]
+        self.frames = 0  # how many frames have been ingested
+        self._lock = threading.Lock()
+        self._started = monotonic()
+
+    def ingest(self, frame: Union[bytes, str], timestamp: float = None) -> None:
+        """
+        Adds a telemetry frame
+
+        :param frame: The frame, e.g. b"t=1.0,bus_voltage=7.4"
+        :type frame: Union[bytes, str]
+        :param timestamp: (optional) When it arrived (time.monotonic()), defaults to now
+        :type timestamp: float
+        """
+        values = parse_frame(frame)
+        values.pop("t", None)  # the MCU's own clock (frames are placed by arrival time)
+        if not values:
+            return
+        timestamp = monotonic() if timestamp is None else timestamp
+        with self._lock:
+            self.frames += 1
+            for name, value in values.items():
+                trace = self.traces.get(name)
+                if trace is None:
+                    trace = self.traces[name] = MinMaxTrace(self.columns, self.window)
+                trace.add(timestamp, value)
+
+    def render(self, now: float = None) -> str:
+        """
+        Draws a panel with one row per channel: name, latest value, trend and window range
+
+        :param now: (optional) The current time (time.monotonic()), defaults to now
+        :type now: float
+        :return: The panel
+        :rtype: str
+        """
+        now = monotonic() if now is None else now
+        with self._lock:
+            rate = self.frames / max(now - self._started, 1e-9)
+            rows = [f"{self.frames} frames ({rate:.1f}/s), trends cover {self.window:g} s"]
+            if not self.traces:
+                rows.append("(waiting for telemetry)")
+            for name in sorted(self.traces):
+                trace = self.traces[name]
+                mins, maxs = trace.history(now)
+                present = [value for value in mins + maxs if not math.isnan(value)]
+                if present:
+                    extent = f"[{min(present):.4g} .. {max(present):.4g}]"
+                else:
+                    extent = "[stale]"
+                rows.append(
+                    f"{name:<16} {trace.last:>10.4g} {sparkline(mins, maxs)} {extent}"
+                )
+        return "\n".join(rows)
+
+
+class TelemetryFeed:
+    """
+    Reads telemetry frames from a serial line into a Dashboard on a background thread, so that
+    ingest carries on at the link's rate whatever the dashboard's refresh rate
+    """
+
+    def __init__(self, dashboard: Dashboard, connection):
+        """
+        :param dashboard: The dashboard to feed
+        :type dashboard: Dashboard
+        :param connection: The line (or channel) to read frames from, e.g. a PortManager lease
+        :type connection: SerialChannel
+        """
+        self.dashboard = dashboard
+        self.connection = connection
+        self.error = None  # what stopped the feed early (if anything)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        """
+        :return: True while the feed is reading
+        :rtype: bool
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """
+        Opens the line and starts reading
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="TelemetryFeed", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops reading and gives the line back
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        release = getattr(self.connection, "release", None)
+        if release is not None:
+            release()
+
+    def _run(self) -> None:
+        """
+        Body of the feed thread
+        """
+        try:
+            self.connection.open()
+            while not self._stop.is_set():
+                frame = self.connection.receive(0.1)
+                if frame:
+                    self.dashboard.ingest(frame)
+                elif frame is None:  # the line is still settling (see SerialLock)
+                    self._stop.wait(0.05)
+        except OSError as e:  # includes serial.SerialException
+            self.error = repr(e)
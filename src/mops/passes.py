@@ -0,0 +1,379 @@
+# passes.py
+# Contains the PassPredictor, which finds when a satellite is in view of ground stations, and
+# the PassIndex it caches the passes in
+#
+# Prediction is done in two stages: elevations are screened at a coarse step for the whole span
+# at once (one vectorized propagation shared by every station), then acquisition of signal
+# (AOS), loss of signal (LOS) and the highest point of each pass are refined with vectorized
+# golden-section and bisection searches, all passes at a time. Times are seconds after the
+# orbit's epoch.
+
+import math
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator, List, NamedTuple, Union
+
+import numpy as np
+
+from sim.orbit import OrbitalElements, SECONDS_PER_DAY, propagate
+
+WGS84_A = 6378137.0  # equatorial radius (m)
+WGS84_E2 = 6.69437999014e-3  # eccentricity squared
+J2000 = datetime(2000, 1, 1, 12, tzinfo=timezone.utc)
+_GOLDEN = (math.sqrt(5) - 1) / 2
+
+
+class GroundStation(NamedTuple):
+    """
+    A ground station (geodetic coordinates on the WGS84 ellipsoid)
+    """
+
+    name: str
+    latitude: float  # deg
+    longitude: float  # deg (east positive)
+    altitude: float = 0.0  # m
+    min_elevation: float = 5.0  # the lowest elevation a contact is possible at (deg)
+
+    @classmethod
+    def parse(cls, text: str) -> List["GroundStation"]:
+        """
+        Reads stations written as name:latitude:longitude[:altitude[:min_elevation]],
+        separated by semicolons (e.g. from the ATMOS_STATIONS environment variable)
+
+        :param text: The stations, e.g. "Home:49.26:-123.25;South:-33.9:18.4:0:10"
+        :type text: str
+        :return: The stations
+        :rtype: List[GroundStation]
+        """
+        stations = []
+        for item in text.split(";"):
+            if not item.strip():
+                continue
+            name, *numbers = item.split(":")
+            if not 2 <= len(numbers) <= 4:
+                raise ValueError(f'Expected name:latitude:longitude, got "{item}"')
+            stations.append(cls(name.strip(), *(float(number) for number in numbers)))
+        return stations
+
+    def position(self):
+        """
+        :return: The station's Earth-fixed position (m) and local vertical (unit vector)
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        lat, lon = math.radians(self.latitude), math.radians(self.longitude)
+        up = np.array([math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)])
+        n = WGS84_A / math.sqrt(1 - WGS84_E2 * math.sin(lat) ** 2)
+        position = (n + self.altitude) * up
+        position[2] = (n * (1 - WGS84_E2) + self.altitude) * math.sin(lat)
+        return position, up
+
+
+class Pass(NamedTuple):
+    """
+    One contact between the satellite and a station
+    """
+
+    station: str
+    aos: float  # acquisition of signal (s after the epoch)
+    tca: float  # time of closest approach, i.e. of the highest elevation (s after the epoch)
+    los: float  # loss of signal (s after the epoch)
+    max_elevation: float  # deg
+
+    @property
+    def duration(self) -> float:
+        """
+        :return: How long the contact lasts (s)
+        :rtype: float
+        """
+        return self.los - self.aos
+
+
+def gmst(epoch: Union[datetime, None], t: np.ndarray) -> np.ndarray:
+    """
+    :param epoch: The time t is measured from (J2000 if None)
+    :type epoch: Union[datetime, None]
+    :param t: Seconds after the epoch
+    :type t: np.ndarray
+    :return: The Greenwich mean sidereal angle, i.e. the Earth's rotation (rad)
+    :rtype: np.ndarray
+    """
+    offset = 0.0 if epoch is None else (epoch - J2000).total_seconds()
+    days = (offset + np.asarray(t, dtype=np.float64)) / SECONDS_PER_DAY
+    return np.remainder(4.894961212823756 + 6.300388098984891 * days, 2 * np.pi)
+
+
+class PassIndex:
+    """
+    Passes sorted by AOS, so that "the next pass" and "the passes in a range" are binary
+    searches (the longest pass bounds how far back a pass overlapping a time can start)
+    """
+
+    def __init__(self, passes: Iterable[Pass] = (), epoch: Union[datetime, None] = None):
+        """
+        :param passes: (optional) The passes, in any order
+        :type passes: Iterable[Pass]
+        :param epoch: (optional) The time that pass times are measured from
+        :type epoch: Union[datetime, None]
+        """
+        self.passes = sorted(passes, key=lambda item: item.aos)
+        self.epoch = epoch
+        self._starts = [item.aos for item in self.passes]
+        self._longest = max((item.duration for item in self.passes), default=0.0)
+        self._stations = {}  # name: PassIndex of that station's passes (built when needed)
+
+    def __len__(self) -> int:
+        return len(self.passes)
+
+    def __iter__(self) -> Iterator[Pass]:
+        return iter(self.passes)
+
+    def station(self, name: str) -> "PassIndex":
+        """
+        :param name: A station's name
+        :type name: str
+        :return: The index of just that station's passes
+        :rtype: PassIndex
+        """
+        index = self._stations.get(name)
+        if index is None:
+            index = PassIndex((item for item in self.passes if item.station == name), self.epoch)
+            self._stations[name] = index
+        return index
+
+    def next(self, t: float, station: str = None) -> Union[Pass, None]:
+        """
+        :param t: The time (s after the epoch)
+        :type t: float
+        :param station: (optional) Only consider this station's passes
+        :type station: str
+        :return: The pass in progress at t (the earliest, if several are), or else the next one
+                 to start (None if there is none)
+        :rtype: Union[Pass, None]
+        """
+        if station is not None:
+            return self.station(station).next(t)
+        first = bisect_left(self._starts, t - self._longest)
+        for item in self.passes[first:]:
+            if item.los >= t:
+                return item
+        return None
+
+    def between(self, start: float, end: float, station: str = None) -> List[Pass]:
+        """
+        :param start: The start of the range (s after the epoch)
+        :type start: float
+        :param end: The end of the range (s after the epoch)
+        :type end: float
+        :param station: (optional) Only consider this station's passes
+        :type station: str
+        :return: The passes that are in progress at any time in the range, by AOS
+        :rtype: List[Pass]
+        """
+        if station is not None:
+            return self.station(station).between(start, end)
+        first = bisect_left(self._starts, start - self._longest)
+        last = bisect_right(self._starts, end)
+        return [item for item in self.passes[first:last] if item.los >= start]
+
+    def seconds(self, when: datetime) -> float:
+        """
+        :param when: A time (timezone-aware)
+        :type when: datetime
+        :return: The time in seconds after the epoch
+        :rtype: float
+        """
+        return (when - (self.epoch or J2000)).total_seconds()
+
+    def time(self, seconds: float) -> datetime:
+        """
+        :param seconds: A time in seconds after the epoch
+        :type seconds: float
+        :return: The time (UTC)
+        :rtype: datetime
+        """
+        return (self.epoch or J2000) + timedelta(seconds=seconds)
+
+
+class PassPredictor:
+    """
+    Predicts passes of one orbit over a set of ground stations
+    """
+
+    def __init__(
+        self,
+        elements: OrbitalElements,
+        stations: Iterable[GroundStation],
+        step: float = 60.0,
+        margin: float = 15.0,
+        tolerance: float = 0.01,
+    ):
+        """
+        :param elements: The orbit
+        :type elements: OrbitalElements
+        :param stations: The ground stations
+        :type stations: Iterable[GroundStation]
+        :param step: (optional) The screening step (s); it must be shorter than the shortest
+                     pass of interest
+        :type step: float
+        :param margin: (optional) How far (deg) below a station's minimum a screened peak may be
+                       and still be refined, in case the real peak between samples is above it
+        :type margin: float
+        :param tolerance: (optional) How precisely to find AOS, LOS and the peak (s)
+        :type tolerance: float
+        """
+        self.elements = elements
+        self.stations = list(stations)
+        self.step = step
+        self.margin = margin
+        self.tolerance = tolerance
+        self._sites = [station.position() for station in self.stations]
+
+    def elevations(self, t: np.ndarray, stations: np.ndarray = None) -> np.ndarray:
+        """
+        :param t: Times (s after the epoch), shape (n,)
+        :type t: np.ndarray
+        :param stations: (optional) The index of the station for each time, shape (n,);
+                         if None, the elevation from every station is found
+        :type stations: np.ndarray
+        :return: Elevations (deg), shape (n,), or (stations, n) if stations is None
+        :rtype: np.ndarray
+        """
+        t = np.asarray(t, dtype=np.float64)
+        r = propagate(self.elements, t, velocity=False).r
+        theta = gmst(self.elements.epoch, t)
+        # turn the satellite into the Earth-fixed frame (rather than each station out of it)
+        cos_t, sin_t = np.cos(theta), np.sin(theta)
+        fixed = np.empty_like(r)
+        fixed[:, 0] = cos_t * r[:, 0] + sin_t * r[:, 1]
+        fixed[:, 1] = cos_t * r[:, 1] - sin_t * r[:, 0]
+        fixed[:, 2] = r[:, 2]
+        if stations is None:
+            return np.array([self._elevation(fixed, *site) for site in self._sites])
+        sites = np.array([site for site, _ in self._sites])[stations]
+        ups = np.array([up for _, up in self._sites])[stations]
+        return self._elevation(fixed, sites, ups)
+
+    @staticmethod
+    def _elevation(fixed: np.ndarray, site: np.ndarray, up: np.ndarray) -> np.ndarray:
+        """
+        :return: The elevation of Earth-fixed positions seen from a site (deg)
+        :rtype: np.ndarray
+        """
+        look = fixed - site
+        height = np.einsum("ij,ij->i", look, np.broadcast_to(up, look.shape))
+        return np.degrees(np.arcsin(height / np.sqrt(np.einsum("ij,ij->i", look, look))))
+
+    def predict(self, start: float, end: float) -> PassIndex:
+        """
+        Finds every pass between two times (passes already in progress at the start, or
+        still in progress at the end, are cut off there)
+
+        :param start: The start of the span (s after the epoch)
+        :type start: float
+        :param end: The end of the span (s after the epoch)
+        :type end: float
+        :return: The passes
+        :rtype: PassIndex
+        """
+        t = np.append(np.arange(start, end, self.step), end)
+        elevations = self.elevations(t)
+        minimums = np.array([station.min_elevation for station in self.stations])[:, None]
+        above = elevations >= minimums
+
+        # candidate peaks: samples at least as high as their neighbours, near enough the minimum
+        padded = np.pad(elevations, ((0, 0), (1, 1)), constant_values=-np.inf)
+        peaks = (
+            (elevations >= padded[:, :-2])
+            & (elevations >= padded[:, 2:])
+            & (elevations >= minimums - self.margin)
+        )
+        station, sample = np.nonzero(peaks)
+        if not len(sample):
+            return PassIndex((), self.elements.epoch)
+        tca, highest = self._peak(
+            station, t[np.maximum(sample - 1, 0)], t[np.minimum(sample + 1, len(t) - 1)]
+        )
+        visible = highest >= minimums[station, 0]
+        station, tca, highest = station[visible], tca[visible], highest[visible]
+
+        # bracket AOS and LOS by the last sample below the minimum before the peak, and the
+        # first one after it (the peak itself may fall between two samples below the minimum)
+        after = np.searchsorted(t, tca, side="right")  # the first sample after the peak
+        below = np.where(above, -1, np.arange(len(t)))
+        last_below = np.maximum.accumulate(below, axis=1)
+        first_below = np.where(above, len(t), np.arange(len(t)))
+        first_below = np.minimum.accumulate(first_below[:, ::-1], axis=1)[:, ::-1]
+        rise = last_below[station, after - 1]
+        fall = first_below[station, np.minimum(after, len(t) - 1)]
+
+        # one pass per rise (a flat-topped pass can look like two neighbouring peaks)
+        keep = np.ones(len(rise), dtype=bool)
+        order = np.lexsort((-highest, rise, station))
+        group = station[order] * (len(t) + 1) + rise[order]  # (rise is -1 for "before start")
+        repeated = group[1:] == group[:-1]
+        keep[order[1:][repeated]] = False
+        station, tca, highest, rise, fall = (
+            array[keep] for array in (station, tca, highest, rise, fall)
+        )
+
+        aos = np.full(len(rise), float(start))
+        rising = rise >= 0
+        if rising.any():
+            lower = t[rise[rising]]
+            upper = np.minimum(t[np.minimum(rise[rising] + 1, len(t) - 1)], tca[rising])
+            aos[rising] = self._crossing(station[rising], lower, upper, True)
+        los = np.full(len(fall), float(end))
+        falling = fall < len(t)
+        if falling.any():
+            lower = np.maximum(t[fall[falling] - 1], tca[falling])
+            upper = t[fall[falling]]
+            los[falling] = self._crossing(station[falling], lower, upper, False)
+
+        passes = [
+            Pass(self.stations[s].name, float(a), float(c), float(l), float(h))
+            for s, a, c, l, h in zip(station, aos, tca, los, highest)
+        ]
+        return PassIndex(passes, self.elements.epoch)
+
+    def _peak(self, stations: np.ndarray, lower: np.ndarray, upper: np.ndarray):
+        """
+        Finds the highest elevation in each bracket (golden-section search, all at once)
+
+        :return: The time of each peak and its elevation (deg)
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        a, b = lower.astype(np.float64), upper.astype(np.float64)
+        c = b - _GOLDEN * (b - a)
+        d = a + _GOLDEN * (b - a)
+        fc, fd = self.elevations(c, stations), self.elevations(d, stations)
+        while (b - a).max() > self.tolerance:
+            left = fc > fd  # the peak is in [a, d]
+            b = np.where(left, d, b)
+            a = np.where(left, a, c)
+            new = np.where(left, b - _GOLDEN * (b - a), a + _GOLDEN * (b - a))
+            fnew = self.elevations(new, stations)
+            c, d = np.where(left, new, d), np.where(left, c, new)
+            fc, fd = np.where(left, fnew, fd), np.where(left, fc, fnew)
+        middle = (a + b) / 2
+        return middle, self.elevations(middle, stations)
+
+    def _crossing(
+        self, stations: np.ndarray, lower: np.ndarray, upper: np.ndarray, rising: bool
+    ) -> np.ndarray:
+        """
+        Finds when the elevation crosses each station's minimum within each bracket
+        (bisection, all at once)
+
+        :return: The crossing times
+        :rtype: np.ndarray
+        """
+        minimums = np.array([station.min_elevation for station in self.stations])[stations]
+        a, b = lower.astype(np.float64), upper.astype(np.float64)
+        while (b - a).max() > self.tolerance:
+            middle = (a + b) / 2
+            up = self.elevations(middle, stations) >= minimums
+            if rising:
+                a, b = np.where(up, a, middle), np.where(up, middle, b)
+            else:
+                a, b = np.where(up, middle, a), np.where(up, b, middle)
+        return (a + b) / 2
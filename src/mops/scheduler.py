@@ -0,0 +1,456 @@
+# scheduler.py
+# Contains the CommandScheduler, which queues time-tagged commands for uplink, packs them into
+# contact windows within the link budget, and sends them with acknowledgement tracking
+#
+# Commands go out as "CMD <id> <payload>" and are acknowledged by "ACK <id>" (see the
+# McuEmulator's ack option). Every queue is a heap, so submitting, releasing, expiring,
+# cancelling and packing each cost O(log n) per command, however many are queued.
+
+import heapq
+import math
+import re
+import threading
+from time import sleep, time
+from typing import Callable, List, NamedTuple, Tuple, Union
+
+# Command states
+QUEUED = "queued"  # waiting for its release time or for a contact
+PLANNED = "planned"  # packed into the current contact, not yet sent
+SENT = "sent"  # sent, waiting for its acknowledgement
+ACKED = "acked"  # acknowledged by the spacecraft
+EXPIRED = "expired"  # its deadline passed before it could be sent
+FAILED = "failed"  # sent max_attempts times without an acknowledgement
+CANCELLED = "cancelled"
+
+_ACK = re.compile(rb"\s*ACK (\d+)")
+
+
+class Command:
+    """
+    A command waiting to be (or that has been) uplinked
+    """
+
+    def __init__(
+        self,
+        id: int,
+        payload: bytes,
+        release: float,
+        deadline: float,
+        priority: int,
+    ):
+        """
+        :param id: The command's number (unique within its scheduler)
+        :type id: int
+        :param payload: What to send
+        :type payload: bytes
+        :param release: The earliest time it may be sent (s, on the scheduler's clock)
+        :type release: float
+        :param deadline: The latest time it is still worth sending (s, math.inf for none)
+        :type deadline: float
+        :param priority: Higher priorities are sent first
+        :type priority: int
+        """
+        self.id = id
+        self.payload = payload
+        self.release = release
+        self.deadline = deadline
+        self.priority = priority
+        self.status = QUEUED
+        self.attempts = 0  # how many times it has been sent
+        self.sent_at = None  # when it was last sent
+        self.acked_at = None
+
+    def frame(self) -> bytes:
+        """
+        :return: The command as it is sent
+        :rtype: bytes
+        """
+        return b"CMD %d %s" % (self.id, self.payload)
+
+    def __repr__(self):
+        return f"Command({self.id}, {self.payload!r}, {self.status}, priority={self.priority})"
+
+
+class ContactWindow(NamedTuple):
+    """
+    A span of time in which commands can be uplinked
+    """
+
+    start: float  # s, on the scheduler's clock
+    end: float
+    rate: float  # the usable uplink rate (bytes/s)
+    station: str = ""
+
+    @classmethod
+    def from_pass(cls, item, passes, rate: float):
+        """
+        :param item: A predicted pass
+        :type item: Pass
+        :param passes: The PassIndex it came from (for its epoch)
+        :type passes: PassIndex
+        :param rate: The usable uplink rate (bytes/s)
+        :type rate: float
+        :return: The pass as a window on the wall clock (UNIX time)
+        :rtype: ContactWindow
+        """
+        start = passes.time(item.aos).timestamp()
+        end = passes.time(item.los).timestamp()
+        return cls(start, end, rate, item.station)
+
+
+class CommandScheduler:
+    """
+    A priority queue of time-tagged commands
+    Commands wait in a heap by release time until they are released into a heap by priority
+    (then deadline, then submission order); a third heap by deadline expires them even if they
+    never reach the front. Cancelled, expired and sent commands are left in the heaps and
+    skipped when they surface (lazy deletion), so no operation ever searches a heap.
+    """
+
+    def __init__(
+        self,
+        ack_timeout: float = 5.0,
+        max_attempts: int = 3,
+        overhead: int = 16,
+        lookahead: int = 256,
+        clock: Callable[[], float] = time,
+    ):
+        """
+        :param ack_timeout: (optional) How long to wait for an acknowledgement (s) before the
+                            command is sent again
+        :type ack_timeout: float
+        :param max_attempts: (optional) How many times a command is sent before it fails
+        :type max_attempts: int
+        :param overhead: (optional) The bytes added to each command by its header and framing
+        :type overhead: int
+        :param lookahead: (optional) How many commands in a row that are too big for what is
+                          left of a window are passed over (for smaller ones behind them)
+                          before packing gives up
+        :type lookahead: int
+        :param clock: (optional) The time source (UNIX time by default)
+        :type clock: Callable[[], float]
+        """
+        self.ack_timeout = ack_timeout
+        self.max_attempts = max_attempts
+        self.overhead = overhead
+        self.lookahead = lookahead
+        self.clock = clock
+        self.commands = {}  # id: Command (until they are finished with)
+        self.counts = {state: 0 for state in (ACKED, EXPIRED, FAILED, CANCELLED)}
+        self._ids = 0
+        self._waiting = []  # (release, id)
+        self._ready = []  # (-priority, deadline, id)
+        self._deadlines = []  # (deadline, id)
+        self._unacked = []  # (ack due, id, attempt)
+        self._queued = 0  # how many commands are QUEUED
+        self._sent = 0  # how many commands are SENT
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        """
+        :return: The number of commands still queued
+        :rtype: int
+        """
+        return self._queued
+
+    def submit(
+        self,
+        payload: Union[bytes, str],
+        release: float = None,
+        deadline: float = None,
+        priority: int = 0,
+    ) -> Command:
+        """
+        Queues a command
+
+        :param payload: What to send (str payloads are UTF-8 encoded)
+        :type payload: Union[bytes, str]
+        :param release: (optional) The earliest time to send it, defaults to now
+        :type release: float
+        :param deadline: (optional) The latest time it is still worth sending
+        :type deadline: float
+        :param priority: (optional) Higher priorities are sent first, defaults to 0
+        :type priority: int
+        :return: The queued command
+        :rtype: Command
+        """
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        with self._lock:
+            self._ids += 1
+            command = Command(
+                self._ids,
+                payload,
+                self.clock() if release is None else release,
+                math.inf if deadline is None else deadline,
+                priority,
+            )
+            self.commands[command.id] = command
+            self._queue(command)
+            if command.deadline < math.inf:
+                heapq.heappush(self._deadlines, (command.deadline, command.id))
+            return command
+
+    def _queue(self, command: Command) -> None:
+        """
+        Puts a command (back) in the queue (the caller must hold the lock)
+        """
+        if command.status == SENT:
+            self._sent -= 1
+        command.status = QUEUED
+        self._queued += 1
+        heapq.heappush(self._waiting, (command.release, command.id))
+
+    def _finish(self, command: Command, status: str) -> None:
+        """
+        Retires a command (the caller must hold the lock)
+        """
+        if command.status == QUEUED:
+            self._queued -= 1
+        elif command.status == SENT:
+            self._sent -= 1
+        command.status = status
+        self.counts[status] += 1
+        del self.commands[command.id]
+
+    def cancel(self, id: int) -> bool:
+        """
+        :param id: The number of a command that hasn't been sent
+        :type id: int
+        :return: True if it was cancelled, False if it was already sent or finished
+        :rtype: bool
+        """
+        with self._lock:
+            command = self.commands.get(id)
+            if command is None or command.status not in (QUEUED, PLANNED):
+                return False
+            self._finish(command, CANCELLED)
+            return True
+
+    def _release(self, until: float) -> None:
+        """
+        Releases the commands whose release time comes by a time (the caller must hold the
+        lock)
+        """
+        while self._waiting and self._waiting[0][0] <= until:
+            _, id = heapq.heappop(self._waiting)
+            command = self.commands.get(id)
+            if command is not None and command.status == QUEUED:
+                heapq.heappush(self._ready, (-command.priority, command.deadline, id))
+
+    def _expire(self, now: float) -> None:
+        """
+        Expires the queued commands whose deadline has passed (the caller must hold the lock)
+        Commands that are planned or sent keep their entries, so that they still expire if they
+        come back to the queue (see unplan and check_acks).
+        """
+        kept = []
+        while self._deadlines and self._deadlines[0][0] < now:
+            entry = heapq.heappop(self._deadlines)
+            command = self.commands.get(entry[1])
+            if command is None:
+                continue
+            if command.status == QUEUED:
+                self._finish(command, EXPIRED)
+            else:
+                kept.append(entry)
+        for entry in kept:
+            heapq.heappush(self._deadlines, entry)
+
+    def _requeue(self, command: Command, now: float) -> None:
+        """
+        Puts a planned or sent command back in the queue, or expires it if its deadline has
+        passed meanwhile (the caller must hold the lock)
+        """
+        if now > command.deadline:
+            self._finish(command, EXPIRED)
+        else:
+            self._queue(command)
+
+    def pack(self, window: ContactWindow) -> List[Tuple[float, Command]]:
+        """
+        Plans which commands to send in a contact window, and when: the highest priority
+        released commands first, each as soon as the link is free, for as long as the window
+        and the link budget (rate x duration) allow
+        The planned commands leave the queue; unplan() returns any that don't get sent.
+        Commands that can no longer make their deadline are skipped without counting towards
+        the lookahead, so a backlog of them can't stop the window from being filled.
+
+        :param window: The contact window
+        :type window: ContactWindow
+        :return: (send time, command) for each planned command, in order
+        :rtype: List[Tuple[float, Command]]
+        """
+        plan = []
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            cursor = max(window.start, now)
+            self._release(cursor)
+            passed_over = []  # too big for what is left of the window
+            skipped = []  # too late for their deadline
+            while cursor < window.end and len(passed_over) < self.lookahead:
+                if not self._ready:
+                    # nothing to send yet: skip ahead to the next release within the window
+                    if not self._waiting or self._waiting[0][0] >= window.end:
+                        break
+                    cursor = max(cursor, self._waiting[0][0])
+                    self._release(cursor)
+                    continue
+                _, deadline, id = heapq.heappop(self._ready)
+                command = self.commands.get(id)
+                if command is None or command.status != QUEUED:
+                    continue
+                done = cursor + (len(command.payload) + self.overhead) / window.rate
+                if done > deadline:  # the cursor only moves on, so it can't fit later either
+                    skipped.append(command)
+                    continue
+                if done > window.end:
+                    passed_over.append(command)
+                    continue
+                command.status = PLANNED
+                self._queued -= 1
+                plan.append((cursor, command))
+                cursor = done
+                self._release(cursor)
+            for command in passed_over + skipped:
+                heapq.heappush(self._ready, (-command.priority, command.deadline, command.id))
+        return plan
+
+    def unplan(self, plan: List[Tuple[float, Command]]) -> None:
+        """
+        Returns planned commands that weren't sent to the queue
+
+        :param plan: A plan from pack()
+        :type plan: List[Tuple[float, Command]]
+        """
+        with self._lock:
+            now = self.clock()
+            for _, command in plan:
+                if command.status == PLANNED:
+                    self._requeue(command, now)
+
+    def sent(self, command: Command) -> None:
+        """
+        Records that a command has been sent
+
+        :param command: The command
+        :type command: Command
+        """
+        with self._lock:
+            if command.status != SENT:
+                self._sent += 1
+            command.status = SENT
+            command.attempts += 1
+            command.sent_at = self.clock()
+            due = command.sent_at + self.ack_timeout
+            heapq.heappush(self._unacked, (due, command.id, command.attempts))
+
+    def acknowledge(self, id: int) -> bool:
+        """
+        Records a command's acknowledgement
+
+        :param id: The command's number
+        :type id: int
+        :return: True if the command was waiting for it
+        :rtype: bool
+        """
+        with self._lock:
+            command = self.commands.get(id)
+            if command is None or command.status != SENT:
+                return False
+            command.acked_at = self.clock()
+            self._finish(command, ACKED)
+            return True
+
+    def check_acks(self) -> List[Command]:
+        """
+        Requeues (to be sent again) the sent commands whose acknowledgement is overdue, or
+        fails them if they have had max_attempts (or expires them if their deadline has passed)
+
+        :return: The commands that failed
+        :rtype: List[Command]
+        """
+        failed = []
+        with self._lock:
+            now = self.clock()
+            while self._unacked and self._unacked[0][0] <= now:
+                _, id, attempt = heapq.heappop(self._unacked)
+                command = self.commands.get(id)
+                if command is None or command.status != SENT or command.attempts != attempt:
+                    continue
+                if command.attempts >= self.max_attempts:
+                    self._finish(command, FAILED)
+                    failed.append(command)
+                else:
+                    command.release = now
+                    self._requeue(command, now)
+        return failed
+
+    @property
+    def outstanding(self) -> int:
+        """
+        :return: The number of commands sent and waiting for an acknowledgement
+        :rtype: int
+        """
+        return self._sent
+
+    def run_window(self, window: ContactWindow, connection, stop: threading.Event = None):
+        """
+        Uplinks commands for the length of a contact window: packs the window, sends each
+        planned command at its time, and listens for acknowledgements throughout (commands
+        whose acknowledgement is overdue are packed again while the window lasts)
+
+        :param window: The contact window
+        :type window: ContactWindow
+        :param connection: The line to the spacecraft (anything with transmit/receive)
+        :type connection: SerialChannel
+        :param stop: (optional) Set to end the window early
+        :type stop: threading.Event
+        :return: The number of commands sent (including resends) and acknowledged
+        :rtype: Tuple[int, int]
+        """
+        stop = stop or threading.Event()
+        framed = getattr(connection, "framing", None) is not None
+        sent = acked = 0
+        while self.clock() < window.end and not stop.is_set():
+            self.check_acks()
+            plan = self.pack(window)
+            if not plan:
+                releasing = self._waiting and self._waiting[0][0] < window.end
+                if not self.outstanding and not releasing:
+                    break
+                acked += self._listen(connection, min(window.end, self.clock() + 0.5))
+                continue
+            for index, (when, command) in enumerate(plan):
+                acked += self._listen(connection, when)
+                if stop.is_set() or self.clock() >= window.end:
+                    self.unplan(plan[index:])
+                    break
+                if command.status != PLANNED:
+                    continue  # cancelled while it waited
+                connection.transmit(command.frame() if framed else command.frame() + b"\n")
+                self.sent(command)
+                sent += 1
+        self.check_acks()
+        return sent, acked
+
+    def _listen(self, connection, until: float) -> int:
+        """
+        Handles acknowledgements until a time (and at least once)
+
+        :return: The number of commands acknowledged
+        :rtype: int
+        """
+        acked = 0
+        while True:
+            remaining = until - self.clock()
+            frame = connection.receive(max(0.0, min(remaining, 0.05)))
+            if frame:
+                match = _ACK.match(bytes(frame))
+                if match and self.acknowledge(int(match.group(1))):
+                    acked += 1
+            elif frame is None:  # the line is still settling
+                sleep(min(max(remaining, 0.0), 0.01))
+            if self.clock() >= until:
+                return acked
@@ -0,0 +1,184 @@
+# profiling.py
+# Contains the StartupProfiler, which records how long ATMOS spends importing each module and
+# constructing each menu and test class before the welcome screen appears
+#
+# Usage: python atmos.py --profile-startup [--startup-budget SECONDS]
+
+import sys
+from contextlib import contextmanager
+from time import perf_counter
+from typing import NamedTuple
+
+
+class Timing(NamedTuple):
+    """
+    How long one step of startup took
+    """
+
+    kind: str  # "import", "menu", "loader", "test", ...
+    name: str  # the module, menu or class
+    seconds: float  # the time taken, including anything the step did along the way
+    own: float  # the time taken, excluding nested imports (the same as seconds for the rest)
+
+
+class _TimedLoader:
+    """
+    Wraps a module's loader to time how long the module takes to execute
+    Everything other than exec_module() is passed straight through to the real loader.
+    """
+
+    def __init__(self, loader, name: str, finder):
+        self._loader = loader
+        self._name = name
+        self._finder = finder
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        stack = self._finder.stack
+        start = perf_counter()
+        stack.append(0.0)  # the time spent importing this module's own imports
+        try:
+            self._loader.exec_module(module)
+        finally:
+            elapsed = perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self._finder.profiler.add("import", self._name, elapsed, elapsed - nested)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class _ImportTimer:
+    """
+    A meta path finder that finds modules with the other finders and times their loaders
+    """
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.stack = []
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, name, self)
+        return spec
+
+
+class StartupProfiler:
+    """
+    Collects startup timings and reports them ranked by cost
+    Only modules imported after start() are timed, so the entrypoint should import as little
+    as possible before starting the profiler.
+    """
+
+    def __init__(self):
+        """
+        Initializes a new StartupProfiler instance
+        """
+        self.timings = []  # a Timing for each step, in the order they finished
+        self._finder = _ImportTimer(self)
+        self._started = None
+        self._stopped = None
+
+    def start(self) -> None:
+        """
+        Starts the clock and begins timing imports
+        """
+        self._started = perf_counter()
+        sys.meta_path.insert(0, self._finder)
+
+    def stop(self) -> None:
+        """
+        Stops the clock and stops timing imports
+        """
+        self._stopped = perf_counter()
+        if self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+
+    def add(self, kind: str, name: str, seconds: float, own: float = None) -> None:
+        """
+        Records a timing
+
+        :param kind: What sort of step was timed, e.g. "menu"
+        :type kind: str
+        :param name: What was timed, e.g. "WelcomeScreen"
+        :type name: str
+        :param seconds: How long it took
+        :type seconds: float
+        :param own: (optional) How long it took excluding nested imports, defaults to seconds
+        :type own: float
+        """
+        self.timings.append(Timing(kind, name, seconds, seconds if own is None else own))
+
+    @contextmanager
+    def measure(self, kind: str, name: str):
+        """
+        Times the body of a with statement (imports made inside it are timed separately too)
+
+        Usage:
+            with profiler.measure("menu", "WelcomeScreen"):
+                welc = welcome.WelcomeScreen()
+        """
+        stack = self._finder.stack
+        start = perf_counter()
+        stack.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.add(kind, name, elapsed, elapsed - nested)
+
+    @property
+    def total(self) -> float:
+        """
+        :return: The seconds between start() and stop() (or now, if still running)
+        :rtype: float
+        """
+        if self._started is None:
+            return 0.0
+        end = self._stopped if self._stopped is not None else perf_counter()
+        return end - self._started
+
+    def report(self, limit: int = 25, title: str = "Startup") -> str:
+        """
+        Builds a report of the most expensive steps of startup
+
+        :param limit: (optional) The number of steps to list, defaults to 25
+        :type limit: int
+        :param title: (optional) What was profiled, for the first line, defaults to "Startup"
+        :type title: str
+        :return: The steps ranked by the time they took themselves, with a total per kind
+        :rtype: str
+        """
+        ranked = sorted(self.timings, key=lambda timing: timing.own, reverse=True)
+        kinds = {}
+        for timing in self.timings:
+            kinds[timing.kind] = kinds.get(timing.kind, 0.0) + timing.own
+
+        lines = [f"{title} took {self.total * 1000:.1f} ms"]
+        for kind, seconds in sorted(kinds.items(), key=lambda item: item[1], reverse=True):
+            lines.append(f"  {kind:<8} {seconds * 1000:9.1f} ms")
+        lines.append("")
+        lines.append(f"{'self ms':>9} {'total ms':>9}  {'kind':<8} name")
+        for timing in ranked[:limit]:
+            lines.append(
+                f"{timing.own * 1000:9.2f} {timing.seconds * 1000:9.2f}  "
+                f"{timing.kind:<8} {timing.name}"
+            )
+        if len(ranked) > limit:
+            lines.append(f"... and {len(ranked) - limit} more")
+        return "\n".join(lines)
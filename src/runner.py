@@ -0,0 +1,254 @@
+# runner.py
+# Contains the ParallelRunner, which runs tests on several flatsats at once (one worker process
+# per serial port) and streams the results back as each test finishes, and run_batch(), which
+# runs tests back-to-back in this process (e.g. for scripted runs without the menus)
+
+import multiprocessing
+import os
+import queue
+from importlib import import_module
+from pathlib import Path
+from time import monotonic
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Union
+
+from testdata.results import JsonLinesSink
+
+# Set in each worker process by _init_worker()
+_results = None
+_cancel = None
+
+# Put on the result queue by each worker, with its port, when it starts (with its process ID)
+# and once it has put all of its results
+STARTED = "started"
+DONE = "done"
+
+
+class RunResult(NamedTuple):
+    """
+    The outcome of one test run
+    """
+
+    test: str  # the name of the test class
+    port: str  # the serial port the test ran on
+    passed: Union[bool, None]  # None if the test was cancelled before it started
+    seconds: float  # how long the test took to run
+    error: Union[str, None] = None  # the exception that ended the test (if any)
+
+
+def _init_worker(results, cancel) -> None:
+    """
+    Gives a worker process the shared result queue and cancellation flag
+    """
+    global _results, _cancel
+    _results = results
+    _cancel = cancel
+
+
+def _run_on_port(port: str, tests: List[tuple]) -> None:
+    """
+    Runs tests one after another on a single port (in a worker process)
+    Puts STARTED on the result queue first, so that the parent can tell if this process dies,
+    and DONE after the last result, so that it knows every one of this port's results has been
+    delivered.
+
+    :param port: The serial port to run the tests on
+    :type port: str
+    :param tests: (module name, class name) for each test to run
+    :type tests: List[tuple]
+    """
+    _results.put((STARTED, port, os.getpid()))
+    try:
+        for module_name, class_name in tests:
+            if _cancel.is_set():
+                _results.put(RunResult(class_name, port, None, 0.0, "cancelled"))
+                continue
+            start = monotonic()
+            error = None
+            try:
+                test = getattr(import_module(module_name), class_name)(port=port)
+                passed = bool(test._run_full())
+                error = test.error
+            except Exception as e:
+                passed = False
+                error = repr(e)
+            _results.put(RunResult(class_name, port, passed, monotonic() - start, error))
+    finally:
+        _results.put((DONE, port))
+
+
+class ParallelRunner:
+    """
+    Runs tests concurrently in a process pool with one worker per serial port
+    Tests that share a port run one after another; different ports run at the same time.
+    """
+
+    def __init__(self, library: dict, port_map: Dict[str, Iterable[str]]):
+        """
+        :param library: The module of each test that may be run, by class name (see
+                        TestLoader.library)
+        :type library: dict
+        :param port_map: The names of the tests to run on each port
+        :type port_map: Dict[str, Iterable[str]]
+        """
+        self.library = library
+        self.port_map = {port: list(tests) for port, tests in port_map.items() if tests}
+        self._pool = None
+        self._cancel = None
+
+    @staticmethod
+    def distribute(tests: Iterable[str], ports: Iterable[str]) -> Dict[str, List[str]]:
+        """
+        Builds a port map that spreads tests across ports round-robin
+
+        :param tests: The names of the tests to run
+        :type tests: Iterable[str]
+        :param ports: The serial ports available
+        :type ports: Iterable[str]
+        :return: The names of the tests to run on each port
+        :rtype: Dict[str, List[str]]
+        """
+        ports = list(ports)
+        port_map = {port: [] for port in ports}
+        for index, test in enumerate(tests):
+            port_map[ports[index % len(ports)]].append(test)
+        return port_map
+
+    def run(self) -> Iterator[RunResult]:
+        """
+        Starts the run and yields each test's result as soon as it finishes
+        If a worker process dies (e.g. a test crashes the interpreter), the tests it had left
+        on its port are reported as failed.
+
+        :return: The results, in the order in which the tests finished
+        :rtype: Iterator[RunResult]
+        """
+        jobs = []
+        for port, tests in self.port_map.items():
+            jobs.append((port, [(self.library[name], name) for name in tests]))
+        expected = sum(len(names) for _, names in jobs)
+        if not expected:
+            return
+
+        results = multiprocessing.Queue()
+        self._cancel = multiprocessing.Event()
+        self._pool = multiprocessing.Pool(
+            len(jobs), initializer=_init_worker, initargs=(results, self._cancel)
+        )
+        try:
+            for job in jobs:
+                self._pool.apply_async(_run_on_port, job)
+            self._pool.close()
+            tests = dict(jobs)
+            reported = {port: 0 for port in tests}  # how many of each port's results arrived
+            workers = {}  # the process ID of the worker running each port's tests
+            finished = set()  # the ports whose results have all been delivered
+            suspects = set()  # ports whose worker was gone when the queue was last empty
+            while len(finished) < len(jobs):
+                try:
+                    message = results.get(timeout=0.1)
+                except queue.Empty:
+                    if self._pool is None:
+                        break  # the run was terminated
+                    # anything a dead worker put on the queue has been read by now
+                    for port in suspects - finished:
+                        finished.add(port)
+                        for _, name in tests[port][reported[port] :]:
+                            yield RunResult(name, port, False, 0.0, "the worker process died")
+                    alive = {process.pid for process in multiprocessing.active_children()}
+                    suspects = {
+                        port
+                        for port, pid in workers.items()
+                        if pid not in alive and port not in finished
+                    }
+                    continue
+                if isinstance(message, RunResult):
+                    reported[message.port] += 1
+                    yield message
+                elif message[0] == STARTED:
+                    workers[message[1]] = message[2]
+                else:
+                    finished.add(message[1])
+        finally:
+            # stop any workers left behind (e.g. if the caller stopped iterating early)
+            self.cancel(force=True)
+
+    def cancel(self, force: bool = False) -> None:
+        """
+        Cancels the run: tests that have not started yet are skipped
+        This may be called from any thread while run() is being iterated.
+
+        :param force: (optional) If True, also kill the tests that are running right now
+        :type force: bool
+        """
+        if self._cancel is not None:
+            self._cancel.set()
+        if force:
+            pool, self._pool = self._pool, None  # may be called from another thread than run()
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+
+def run_batch(
+    tests: Iterable[type],
+    port: str = None,
+    baud: int = None,
+    repeat: int = 1,
+    results_dir: Union[str, Path] = None,
+) -> Iterator[RunResult]:
+    """
+    Runs tests one after another in this process, yielding each result as it finishes
+    Each test leases its line before the previous test gives its lease back, so consecutive
+    tests on the same port share one open (and already probed) connection.
+
+    :param tests: The test classes to run, in order
+    :type tests: Iterable[type]
+    :param port: (optional) Overrides the serial port of every test
+    :type port: str
+    :param baud: (optional) Overrides the baud rate of every test
+    :type baud: int
+    :param repeat: (optional) How many times to run the whole sequence, defaults to 1
+    :type repeat: int
+    :param results_dir: (optional) A directory to append each test's records to (as
+                        <ClassName>.jsonl) instead of discarding them
+    :type results_dir: Union[str, Path]
+    :return: The results, in the order the tests ran
+    :rtype: Iterator[RunResult]
+    """
+    tests = list(tests)
+    if results_dir is not None:
+        Path(results_dir).mkdir(parents=True, exist_ok=True)
+    previous = None
+    try:
+        for _ in range(repeat):
+            for test_class in tests:
+                start = monotonic()
+                test = None
+                try:
+                    test = test_class(port=port, baud=baud)
+                    if previous is not None:
+                        previous.connection.release()  # the new lease keeps the line open
+                        previous = None
+                    if results_dir is not None:
+                        path = Path(results_dir) / f"{test_class.__name__}.jsonl"
+                        test.results = JsonLinesSink(path)
+                    passed = bool(test._run_full())
+                    error = test.error
+                except Exception as e:
+                    passed = False
+                    error = repr(e)
+                finally:
+                    if test is not None and test.results is not None:
+                        test.results.close()
+                yield RunResult(
+                    test_class.__name__,
+                    test.port if test is not None else port,
+                    passed,
+                    monotonic() - start,
+                    error,
+                )
+                if test is not None:
+                    previous = test
+    finally:
+        if previous is not None:
+            previous.connection.release()
@@ -0,0 +1,434 @@
+# budget.py
+# Contains the power and thermal budget simulation: eclipses, solar array generation, battery
+# state of charge and lumped-capacitance thermal nodes along an orbit
+#
+# The mission timeline is evaluated in chunks of whole arrays (see simulate()), so memory stays
+# bounded however long the run is: each chunk is propagated, evaluated and handed on (e.g. to a
+# results sink with export()) before the next one is computed.
+
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, NamedTuple, Tuple, Union
+
+import numpy as np
+
+from .orbit import R_EARTH, SECONDS_PER_DAY, OrbitalElements, propagate
+
+SOLAR_CONSTANT = 1361.0  # solar flux at 1 AU (W/m^2)
+EARTH_IR = 237.0  # Earth's mean outgoing long-wave flux (W/m^2)
+ALBEDO = 0.3  # fraction of sunlight reflected by the Earth
+SIGMA = 5.670374419e-8  # Stefan-Boltzmann constant (W/m^2/K^4)
+J2000 = datetime(2000, 1, 1, 12, tzinfo=timezone.utc)  # (used when an orbit has no epoch)
+
+
+def sun_vector(epoch: Union[datetime, None], t: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the direction of the Sun and the solar flux (low-precision almanac formulae, good to
+    about 0.01 degrees, which is plenty for eclipses and power)
+
+    :param epoch: The time t is measured from (J2000 if None)
+    :type epoch: Union[datetime, None]
+    :param t: Seconds after the epoch, shape (n,)
+    :type t: np.ndarray
+    :return: Unit vectors towards the Sun in the inertial frame, shape (n, 3), and the solar
+             flux at the Earth (W/m^2), shape (n,)
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    offset = 0.0 if epoch is None else (epoch - J2000).total_seconds()
+    days = (offset + np.asarray(t, dtype=np.float64)) / SECONDS_PER_DAY
+    mean_longitude = np.radians(280.460 + 0.9856474 * days)
+    g = np.radians(357.528 + 0.9856003 * days)  # the Sun's mean anomaly
+    longitude = mean_longitude + np.radians(1.915 * np.sin(g) + 0.020 * np.sin(2 * g))
+    obliquity = np.radians(23.439 - 4e-7 * days)
+    sun = np.empty((len(days), 3))
+    sun[:, 0] = np.cos(longitude)
+    sun[:, 1] = np.cos(obliquity) * np.sin(longitude)
+    sun[:, 2] = np.sin(obliquity) * np.sin(longitude)
+    distance = 1.00014 - 0.01671 * np.cos(g) - 0.00014 * np.cos(2 * g)  # AU
+    return sun, SOLAR_CONSTANT / distance ** 2
+
+
+def sunlit(r: np.ndarray, sun: np.ndarray) -> np.ndarray:
+    """
+    Finds where a spacecraft is in sunlight, treating the Earth's shadow as a cylinder
+
+    :param r: Positions (m), shape (n, 3)
+    :type r: np.ndarray
+    :param sun: Unit vectors towards the Sun, shape (n, 3)
+    :type sun: np.ndarray
+    :return: True where the spacecraft is in sunlight, shape (n,)
+    :rtype: np.ndarray
+    """
+    along = np.einsum("ij,ij->i", r, sun)  # distance towards the Sun
+    across = np.einsum("ij,ij->i", r, r) - along * along  # squared distance from the axis
+    return (along > 0) | (across > R_EARTH * R_EARTH)
+
+
+class PowerSystem(NamedTuple):
+    """
+    The electrical power system (the defaults are roughly a 3U CubeSat's)
+    """
+
+    array_area: float = 0.06  # solar cell area (m^2)
+    efficiency: float = 0.28  # solar cell efficiency
+    pointing: str = "sun"  # "sun" (the array tracks the Sun) or "zenith" (faces away from Earth)
+    load: float = 4.0  # average power drawn by the spacecraft (W)
+    capacity: float = 40.0  # battery capacity (Wh)
+    initial_soc: float = 1.0  # state of charge at the start (0-1)
+    charge_efficiency: float = 0.95
+    discharge_efficiency: float = 0.95
+
+    def generation(
+        self, r: np.ndarray, sun: np.ndarray, flux: np.ndarray, lit: np.ndarray
+    ) -> np.ndarray:
+        """
+        :param r: Positions (m), shape (n, 3)
+        :type r: np.ndarray
+        :param sun: Unit vectors towards the Sun, shape (n, 3)
+        :type sun: np.ndarray
+        :param flux: The solar flux (W/m^2), shape (n,)
+        :type flux: np.ndarray
+        :param lit: Where the spacecraft is in sunlight, shape (n,)
+        :type lit: np.ndarray
+        :return: The power generated by the array (W), shape (n,)
+        :rtype: np.ndarray
+        """
+        power = np.where(lit, flux * (self.array_area * self.efficiency), 0.0)
+        if self.pointing == "zenith":
+            radius = np.sqrt(np.einsum("ij,ij->i", r, r))
+            power *= np.maximum(np.einsum("ij,ij->i", r, sun) / radius, 0.0)
+        elif self.pointing != "sun":
+            raise ValueError(f'Unknown pointing "{self.pointing}" (use "sun" or "zenith")')
+        return power
+
+    def battery(
+        self, generated: np.ndarray, step: float, energy: float
+    ) -> Tuple[np.ndarray, float]:
+        """
+        Charges and discharges the battery (excess power is shed when it is full, and the
+        load goes unserved when it is empty)
+
+        :param generated: The power generated at each time (W), shape (n,)
+        :type generated: np.ndarray
+        :param step: The time between samples (s)
+        :type step: float
+        :param energy: The energy stored at the first time (Wh)
+        :type energy: float
+        :return: The state of charge at each time (0-1) and the energy stored one step after
+                 the last time (Wh)
+        :rtype: Tuple[np.ndarray, float]
+        """
+        net = generated - self.load
+        net = np.where(
+            net > 0, net * self.charge_efficiency, net / self.discharge_efficiency
+        ) * (step / 3600)
+        stored = _bounded_cumsum(net, energy, 0.0, self.capacity)
+        soc = np.empty_like(net)
+        soc[0] = energy
+        soc[1:] = stored[:-1]
+        soc /= self.capacity
+        return soc, float(stored[-1])
+
+
+def _bounded_cumsum(steps: np.ndarray, start: float, low: float, high: float) -> np.ndarray:
+    """
+    Accumulates steps while clamping the running total to [low, high] after every step
+    Between clamps against different bounds the total is a running sum reflected off one bound,
+    which has a closed form, so this makes one vectorized pass per switch between the bounds
+    (e.g. at most a few per orbit, for a battery that both fills and empties each orbit).
+
+    :param steps: The changes, shape (n,)
+    :type steps: np.ndarray
+    :param start: The total before the first step
+    :type start: float
+    :param low: The lower bound
+    :type low: float
+    :param high: The upper bound
+    :type high: float
+    :return: The total after each step, shape (n,)
+    :rtype: np.ndarray
+    """
+    out = np.empty_like(steps)
+    begin = 0
+    total = min(max(start, low), high)
+    while begin < len(steps):
+        free = total + np.cumsum(steps[begin:])
+        outside = np.flatnonzero((free > high) | (free < low))
+        if not len(outside):
+            out[begin:] = free
+            break
+        if free[outside[0]] > high:  # full: shed the excess until it runs empty
+            clamped = free - np.maximum.accumulate(np.maximum(free - high, 0.0))
+            switch = np.flatnonzero(clamped < low)
+            bound = low
+        else:  # empty: go without until it fills up
+            clamped = free - np.minimum.accumulate(np.minimum(free - low, 0.0))
+            switch = np.flatnonzero(clamped > high)
+            bound = high
+        if not len(switch):
+            out[begin:] = clamped
+            break
+        end = begin + switch[0]
+        out[begin:end] = clamped[: switch[0]]
+        out[end] = total = bound
+        begin = end + 1
+    return out
+
+
+class ThermalNode(NamedTuple):
+    """
+    A lump of the spacecraft at a single temperature
+    """
+
+    name: str
+    capacitance: float  # heat capacity (J/K)
+    radiating_area: float = 0.0  # area radiating to space (m^2)
+    emissivity: float = 0.8
+    absorptivity: float = 0.6  # solar absorptivity
+    sun_area: float = 0.0  # projected area facing the Sun (m^2)
+    earth_area: float = 0.0  # projected area facing the Earth (m^2)
+    dissipation: float = 0.0  # heat generated inside it (W)
+    temperature: float = 293.15  # temperature at the start (K)
+
+
+class ThermalModel:
+    """
+    A network of lumped thermal nodes, radiating to space and conducting to each other:
+        C dT/dt = Q_sun + Q_albedo + Q_earth_ir + Q_internal - e A sigma T^4 - sum G (T - T_other)
+    Radiation is linearized about the mean temperature of each chunk and the (small) remainder
+    is fed back by fixed-point iteration, so that every iteration is linear: decoupled into the
+    network's modes, each mode is a first-order recurrence, solved for the whole chunk with a
+    parallel prefix scan instead of a Python loop over time steps.
+    """
+
+    def __init__(
+        self, nodes: List[ThermalNode], conductances: Dict[Tuple[str, str], float] = None
+    ):
+        """
+        :param nodes: The nodes
+        :type nodes: List[ThermalNode]
+        :param conductances: (optional) The conductance between pairs of nodes (W/K), by name
+        :type conductances: Dict[Tuple[str, str], float]
+        """
+        self.nodes = nodes
+        self.names = [node.name for node in nodes]
+        self.capacitance = np.array([node.capacitance for node in nodes], dtype=np.float64)
+        self.radiation = np.array([node.emissivity * node.radiating_area * SIGMA for node in nodes])
+        self.laplacian = np.zeros((len(nodes), len(nodes)))
+        for (a, b), conductance in (conductances or {}).items():
+            i, j = self.names.index(a), self.names.index(b)
+            self.laplacian[[i, j], [i, j]] += conductance
+            self.laplacian[[i, j], [j, i]] -= conductance
+
+        # heat input (W): constant, plus a part proportional to the solar flux while sunlit
+        self.constant = np.array(
+            [node.dissipation + node.emissivity * node.earth_area * EARTH_IR for node in nodes]
+        )
+        self.solar = np.array(
+            [node.absorptivity * (node.sun_area + ALBEDO * node.earth_area) for node in nodes]
+        )
+
+    @classmethod
+    def cubesat(cls):
+        """
+        Builds a two-node model of a 3U CubeSat: the structure (with body-mounted panels) and
+        the battery pack inside it
+
+        :return: The model
+        :rtype: ThermalModel
+        """
+        return cls(
+            [
+                ThermalNode(
+                    "structure",
+                    capacitance=2500.0,
+                    radiating_area=0.14,
+                    emissivity=0.85,
+                    absorptivity=0.9,
+                    sun_area=0.03,
+                    earth_area=0.03,
+                    dissipation=3.0,
+                ),
+                ThermalNode("battery", capacitance=350.0, dissipation=1.0),
+            ],
+            {("structure", "battery"): 0.5},
+        )
+
+    def initial(self) -> np.ndarray:
+        """
+        :return: The temperature of each node at the start (K)
+        :rtype: np.ndarray
+        """
+        return np.array([node.temperature for node in self.nodes], dtype=np.float64)
+
+    def evolve(
+        self,
+        step: float,
+        heat: np.ndarray,
+        start: np.ndarray,
+        tolerance: float = 1e-3,
+        iterations: int = 30,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Integrates the node temperatures over a chunk (the heat input is held over each step)
+
+        :param step: The time between samples (s)
+        :type step: float
+        :param heat: The solar flux reaching the spacecraft at each time (W/m^2, 0 in
+                     eclipse), shape (n,)
+        :type heat: np.ndarray
+        :param start: The temperatures at the first time (K), shape (nodes,)
+        :type start: np.ndarray
+        :param tolerance: (optional) How closely the iterations must agree (K)
+        :type tolerance: float
+        :param iterations: (optional) The most iterations made
+        :type iterations: int
+        :return: The temperatures at each time (K), shape (n, nodes), and one step after the
+                 last time, shape (nodes,)
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        # (arrays are laid out (nodes, n) here, so that each node's history is contiguous)
+        forcing = self.constant[:, None] + self.solar[:, None] * heat
+        root = np.sqrt(self.capacitance)
+        radiation = self.radiation[:, None]
+        steps = np.arange(1, len(heat) + 1)
+        guess = np.repeat(start[:, None], len(heat), axis=1)
+        for _ in range(iterations):
+            reference = guess.mean(axis=1)
+            slope = 4 * self.radiation * reference ** 3
+            # C dT/dt = -K T + g with K symmetric; in the modes of C^-1/2 K C^-1/2 it decouples
+            rates, modes = np.linalg.eigh(
+                (self.laplacian + np.diag(slope)) / np.outer(root, root)
+            )
+            g = guess * guess
+            g *= g
+            g *= -radiation
+            g += forcing
+            g += slope[:, None] * guess
+            # each step's input, integrated over the step (just step for a mode that never decays)
+            gain = np.full_like(rates, step)
+            decaying = rates > 1e-12
+            gain[decaying] = -np.expm1(-rates[decaying] * step) / rates[decaying]
+            drive = (modes.T / root) @ g
+            drive *= gain[:, None]
+            states = _linear_scan(np.exp(-rates * step), drive)
+            states += np.exp(np.outer(-rates * step, steps)) * (modes.T @ (root * start))[:, None]
+            after = (modes / root[:, None]) @ states  # temperatures after each step
+
+            temperatures = np.empty_like(after)
+            temperatures[:, 0] = start
+            temperatures[:, 1:] = after[:, :-1]
+            converged = np.abs(temperatures - guess).max() < tolerance
+            guess = temperatures
+            if converged:
+                break
+        return guess.T, after[:, -1]
+
+
+def _linear_scan(a: np.ndarray, c: np.ndarray) -> np.ndarray:
+    """
+    Solves the recurrences x[n] = a x[n-1] + c[n] along the last axis all at once, from
+    x[-1] = 0, with a log-depth (Hillis-Steele) scan
+
+    :param a: The multiplier of each row, shape (rows,)
+    :type a: np.ndarray
+    :param c: The increments, shape (rows, n); overwritten with the result
+    :type c: np.ndarray
+    :return: c
+    :rtype: np.ndarray
+    """
+    power = a[:, None].copy()
+    shift = 1
+    while shift < c.shape[1]:
+        c[:, shift:] += power * c[:, :-shift]
+        power *= power
+        shift *= 2
+    return c
+
+
+class BudgetChunk(NamedTuple):
+    """
+    A stretch of the budget timeline
+    """
+
+    t: np.ndarray  # seconds after the orbit's epoch, shape (n,)
+    sunlit: np.ndarray  # True in sunlight, shape (n,)
+    generated: np.ndarray  # solar array output (W), shape (n,)
+    soc: np.ndarray  # battery state of charge (0-1), shape (n,)
+    temperatures: Union[np.ndarray, None]  # node temperatures (K), shape (n, nodes)
+
+
+def simulate(
+    elements: OrbitalElements,
+    duration: float,
+    step: float,
+    power: PowerSystem = None,
+    thermal: ThermalModel = None,
+    chunk: int = 1 << 16,
+) -> Iterator[BudgetChunk]:
+    """
+    Evaluates the power (and thermal) budget along an orbit, one chunk at a time
+    Only the current chunk is ever held in memory, so runs can be years long.
+
+    :param elements: The orbit
+    :type elements: OrbitalElements
+    :param duration: The length of the timeline (s)
+    :type duration: float
+    :param step: The spacing of the timeline (s)
+    :type step: float
+    :param power: (optional) The power system, defaults to PowerSystem()
+    :type power: PowerSystem
+    :param thermal: (optional) The thermal model (temperatures are skipped if None)
+    :type thermal: ThermalModel
+    :param chunk: (optional) The number of times evaluated at once
+    :type chunk: int
+    :return: The timeline, in order
+    :rtype: Iterator[BudgetChunk]
+    """
+    power = power or PowerSystem()
+    energy = power.capacity * power.initial_soc
+    temperatures = thermal.initial() if thermal is not None else None
+    count = int(duration // step) + 1
+    for begin in range(0, count, chunk):
+        t = step * np.arange(begin, min(begin + chunk, count), dtype=np.float64)
+        r = propagate(elements, t, velocity=False).r
+        sun, flux = sun_vector(elements.epoch, t)
+        lit = sunlit(r, sun)
+        generated = power.generation(r, sun, flux, lit)
+        soc, energy = power.battery(generated, step, energy)
+        nodes = None
+        if thermal is not None:
+            nodes, temperatures = thermal.evolve(step, np.where(lit, flux, 0.0), temperatures)
+        yield BudgetChunk(t, lit, generated, soc, nodes)
+
+
+def export(chunks: Iterator[BudgetChunk], sink, names: List[str] = (), every: int = 1):
+    """
+    Streams a budget timeline to a results sink (see testdata.results), chunk by chunk, as
+    records of t, sunlit, generated_w, soc and temp_<node> (in degrees C)
+
+    :param chunks: The timeline (e.g. from simulate())
+    :type chunks: Iterator[BudgetChunk]
+    :param sink: Where to write the records, e.g. an NpyChannelSink
+    :type sink: ResultSink
+    :param names: (optional) The thermal node names, for the temperature fields
+    :type names: List[str]
+    :param every: (optional) Only write every nth time (to thin out long runs)
+    :type every: int
+    :return: The chunks, passed on unchanged as they are written
+    :rtype: Iterator[BudgetChunk]
+    """
+    offset = 0
+    for part in chunks:
+        rows = slice((-offset) % every, None, every)
+        columns = {
+            "t": part.t[rows],
+            "sunlit": part.sunlit[rows].astype(np.float64),
+            "generated_w": part.generated[rows],
+            "soc": part.soc[rows],
+        }
+        if part.temperatures is not None:
+            for index, name in enumerate(names):
+                columns[f"temp_{name}"] = part.temperatures[rows, index] - 273.15
+        sink.write_columns({name: np.ascontiguousarray(value) for name, value in columns.items()})
+        offset += len(part.t)
+        yield part
@@ -0,0 +1,422 @@
+# montecarlo.py
+# Contains the MonteCarlo runner, which repeats a simulation thousands of times with dispersed
+# parameters across a process pool, and the streaming statistics it aggregates the runs with
+#
+# Only a small summary of each run (its parameters and a few metrics) ever leaves the worker,
+# and the statistics are updated one summary at a time (percentiles with the P-squared
+# algorithm), so the memory used doesn't grow with the number of runs.
+
+import math
+import multiprocessing
+import os
+import threading
+from bisect import bisect_right, insort
+from typing import Callable, Dict, Iterator, NamedTuple, Tuple, Union
+
+import numpy as np
+
+from .budget import PowerSystem, ThermalModel, simulate
+from .orbit import R_EARTH, OrbitalElements, decay
+
+# Set in each worker process by _init_worker()
+_job = None
+
+
+class Dispersion(NamedTuple):
+    """
+    How a parameter is dispersed: a numpy.random.Generator distribution and its two arguments,
+    e.g. Dispersion("normal", 2.2, 0.1) (mean, standard deviation) or
+    Dispersion("uniform", 0.0, 0.2) (low, high)
+    """
+
+    distribution: str
+    a: float
+    b: float
+
+    def sample(self, rng: np.random.Generator) -> float:
+        """
+        :param rng: The generator to draw from
+        :type rng: np.random.Generator
+        :return: A value of the parameter
+        :rtype: float
+        """
+        return float(getattr(rng, self.distribution)(self.a, self.b))
+
+
+class RunSummary(NamedTuple):
+    """
+    The outcome of one Monte Carlo run
+    """
+
+    run: int  # the number of the run (which also determines its random numbers)
+    parameters: Dict[str, float]  # every parameter the run used
+    metrics: Dict[str, float]  # what the model reported
+    error: Union[str, None] = None  # the exception that ended the run (if any)
+
+    def record(self) -> dict:
+        """
+        :return: The summary as a flat record, for a results sink
+        :rtype: dict
+        """
+        return {"run": self.run, **self.parameters, **self.metrics, "error": self.error}
+
+
+class P2Quantile:
+    """
+    Estimates a quantile of a stream of values in constant memory with the P-squared algorithm
+    (Jain & Chlamtac, 1985): five markers track the minimum, the maximum, the quantile and the
+    points halfway to it, and are nudged along a piecewise-parabolic fit as values arrive.
+    The first few values are kept as they are, so small runs get exact percentiles.
+    """
+
+    EXACT = 64  # values kept (and used exactly) before switching to the markers
+
+    def __init__(self, quantile: float):
+        """
+        :param quantile: The quantile to estimate (0-1, e.g. 0.95)
+        :type quantile: float
+        """
+        p = quantile
+        self.quantile = p
+        self.fractions = [0, p / 2, p, (1 + p) / 2, 1]  # where the markers belong
+        self.values = []  # the first EXACT values, sorted (until the markers take over)
+        self.heights = None  # marker heights
+        self.positions = None  # marker positions (1-based ranks)
+        self.desired = None  # where the markers should be
+
+    def _start_markers(self) -> None:
+        """
+        Places the markers at the right ranks of the values seen so far
+        """
+        count = len(self.values)
+        positions = [1 + round(fraction * (count - 1)) for fraction in self.fractions]
+        for i in (1, 2, 3):  # markers must be at distinct ranks
+            positions[i] = max(positions[i], positions[i - 1] + 1)
+        for i in (3, 2, 1):
+            positions[i] = min(positions[i], positions[i + 1] - 1)
+        self.positions = positions
+        self.heights = [self.values[position - 1] for position in positions]
+        self.desired = [1 + fraction * (count - 1) for fraction in self.fractions]
+        self.values = None
+
+    def add(self, value: float) -> None:
+        """
+        :param value: The next value of the stream
+        :type value: float
+        """
+        if self.values is not None:
+            insort(self.values, value)
+            if len(self.values) > self.EXACT:
+                self._start_markers()
+            return
+        q, n = self.heights, self.positions
+        if value < q[0]:
+            q[0] = value
+            cell = 0
+        elif value >= q[4]:
+            q[4] = value
+            cell = 3
+        else:
+            cell = bisect_right(q, value) - 1
+        for i in range(cell + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.fractions[i]
+
+        for i in (1, 2, 3):
+            offset = self.desired[i] - n[i]
+            if (offset >= 1 and n[i + 1] - n[i] > 1) or (offset <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if offset > 0 else -1
+                height = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not q[i - 1] < height < q[i + 1]:  # the parabola overshot: go linear
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    @property
+    def value(self) -> float:
+        """
+        :return: The estimate (exact for the first EXACT values; NaN if there are none)
+        :rtype: float
+        """
+        if self.values is None:
+            return self.heights[2]
+        if not self.values:
+            return math.nan
+        rank = self.quantile * (len(self.values) - 1)
+        low = int(rank)
+        high = min(low + 1, len(self.values) - 1)
+        return self.values[low] + (self.values[high] - self.values[low]) * (rank - low)
+
+
+class Statistics:
+    """
+    Running statistics of one metric: count, mean, standard deviation (Welford's method),
+    extremes and a P2Quantile for each percentile of interest
+    """
+
+    def __init__(self, percentiles: Tuple[float, ...] = (5, 50, 95)):
+        """
+        :param percentiles: (optional) The percentiles to track (0-100)
+        :type percentiles: Tuple[float, ...]
+        """
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.quantiles = {p: P2Quantile(p / 100) for p in percentiles}
+
+    def add(self, value: float) -> None:
+        """
+        :param value: The metric from one more run (NaN is ignored)
+        :type value: float
+        """
+        if math.isnan(value):
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        for quantile in self.quantiles.values():
+            quantile.add(value)
+
+    @property
+    def std(self) -> float:
+        """
+        :return: The sample standard deviation (NaN with fewer than two values)
+        :rtype: float
+        """
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else math.nan
+
+    def percentile(self, p: float) -> float:
+        """
+        :param p: One of the percentiles being tracked
+        :type p: float
+        :return: Its current estimate
+        :rtype: float
+        """
+        return self.quantiles[p].value
+
+
+def _init_worker(job) -> None:
+    """
+    Gives a worker process the model, the nominal parameters, the dispersions and the seed
+    """
+    global _job
+    _job = job
+
+
+def _run(index: int) -> RunSummary:
+    """
+    Makes one Monte Carlo run (in a worker process)
+    Each run draws from its own generator, spawned from the seed by run number, so a run's
+    parameters don't depend on which worker made it or how many workers there are.
+
+    :param index: The run number
+    :type index: int
+    :return: The run's summary
+    :rtype: RunSummary
+    """
+    model, nominal, dispersions, seed = _job
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(index,)))
+    parameters = dict(nominal)
+    for name in sorted(dispersions):
+        parameters[name] = dispersions[name].sample(rng)
+    try:
+        metrics = {name: float(value) for name, value in model(parameters, rng).items()}
+    except Exception as e:  # a run that blows up is reported, not fatal
+        return RunSummary(index, parameters, {}, repr(e))
+    return RunSummary(index, parameters, metrics)
+
+
+class MonteCarlo:
+    """
+    Runs a model many times across a process pool (one worker per core by default), streaming
+    each run's summary back as soon as it finishes and folding it into running statistics
+    A model is a module-level function taking (parameters: dict, rng: numpy.random.Generator)
+    and returning a dict of metrics (floats), e.g. mission().
+    """
+
+    def __init__(
+        self,
+        model: Callable[[dict, np.random.Generator], Dict[str, float]],
+        runs: int,
+        dispersions: Dict[str, Dispersion],
+        nominal: dict = None,
+        seed: int = 0,
+        workers: int = None,
+        percentiles: Tuple[float, ...] = (5, 50, 95),
+    ):
+        """
+        :param model: The simulation to run
+        :type model: Callable[[dict, np.random.Generator], Dict[str, float]]
+        :param runs: The number of runs
+        :type runs: int
+        :param dispersions: How each dispersed parameter is drawn, by name
+        :type dispersions: Dict[str, Dispersion]
+        :param nominal: (optional) The parameters that aren't dispersed
+        :type nominal: dict
+        :param seed: (optional) The root seed (the same seed gives the same runs)
+        :type seed: int
+        :param workers: (optional) The number of worker processes, defaults to the CPU count
+        :type workers: int
+        :param percentiles: (optional) The percentiles to track for each metric (0-100)
+        :type percentiles: Tuple[float, ...]
+        """
+        rng = np.random.default_rng(0)
+        for name, dispersion in dispersions.items():
+            if not callable(getattr(rng, dispersion.distribution, None)):
+                raise ValueError(f'Unknown distribution "{dispersion.distribution}" for {name}')
+        self.model = model
+        self.runs = runs
+        self.dispersions = dict(dispersions)
+        self.nominal = dict(nominal or {})
+        self.seed = seed
+        self.workers = workers or os.cpu_count() or 1
+        self.percentiles = tuple(percentiles)
+        self.statistics = {}  # type: Dict[str, Statistics]
+        self.completed = 0
+        self.failed = 0
+        self._pool = None
+        self._cancelled = threading.Event()
+
+    def run(self, sink=None) -> Iterator[RunSummary]:
+        """
+        Starts the runs and yields each summary as soon as it arrives (in no particular order),
+        after adding it to the statistics
+
+        :param sink: (optional) A results sink to also stream every summary to
+        :type sink: ResultSink
+        :return: The summaries
+        :rtype: Iterator[RunSummary]
+        """
+        job = (self.model, self.nominal, self.dispersions, self.seed)
+        self._pool = multiprocessing.Pool(
+            min(self.workers, max(self.runs, 1)), initializer=_init_worker, initargs=(job,)
+        )
+        self._cancelled.clear()
+        summaries = self._pool.imap_unordered(_run, range(self.runs))
+        try:
+            while True:
+                try:
+                    summary = summaries.next(timeout=0.1)
+                except multiprocessing.TimeoutError:
+                    if self._cancelled.is_set():
+                        break
+                    continue
+                except StopIteration:
+                    break
+                self.completed += 1
+                if summary.error is not None:
+                    self.failed += 1
+                for name, value in summary.metrics.items():
+                    statistics = self.statistics.get(name)
+                    if statistics is None:
+                        statistics = self.statistics[name] = Statistics(self.percentiles)
+                    statistics.add(value)
+                if sink is not None:
+                    sink.write(summary.record())
+                yield summary
+        finally:
+            # stop any workers left behind (e.g. if the caller stopped iterating early)
+            self.cancel()
+
+    def cancel(self) -> None:
+        """
+        Stops the runs that are in progress and skips the rest
+        This may be called from any thread while run() is being iterated.
+        """
+        self._cancelled.set()
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    def report(self) -> str:
+        """
+        :return: A table of the statistics of every metric
+        :rtype: str
+        """
+        columns = "".join(f"{f'p{p:g}':>11}" for p in self.percentiles)
+        rows = [f"{'metric':<20}{'mean':>11}{'std':>11}{columns}"]
+        for name in sorted(self.statistics):
+            stats = self.statistics[name]
+            values = [stats.mean, stats.std] + [stats.percentile(p) for p in self.percentiles]
+            rows.append(f"{name:<20}" + "".join(f"{value:>11.4g}" for value in values))
+        rows.append(f"{self.completed} of {self.runs} runs finished, {self.failed} failed")
+        return "\n".join(rows)
+
+
+# The nominal parameters of mission()
+MISSION = {
+    "altitude": 500.0,  # km
+    "inclination": 97.4,  # deg
+    "raan": 0.0,  # deg
+    "anomaly": 0.0,  # deg
+    "drag_coefficient": 2.2,
+    "area": 0.03,  # mean cross-section (m^2)
+    "mass": 4.0,  # kg
+    "capacity": 40.0,  # battery capacity when new (Wh)
+    "battery_fade": 0.0,  # fraction of the capacity lost
+    "load": 4.0,  # W
+    "days": 7.0,
+    "step": 60.0,  # s
+}
+
+
+def mission(parameters: dict, rng: np.random.Generator = None) -> Dict[str, float]:
+    """
+    A Monte Carlo model of a CubeSat mission: the power and thermal budget (see budget.py)
+    along the orbit, and how far drag lowers it
+
+    :param parameters: Values for (some of) the keys of MISSION
+    :type parameters: dict
+    :param rng: (optional) The run's generator (unused: the model is deterministic)
+    :type rng: np.random.Generator
+    :return: lowest_soc, eclipse_fraction, energy_margin (Wh/day), battery_min_c,
+             battery_max_c, altitude_loss_km and reentered (1 or 0)
+    :rtype: Dict[str, float]
+    """
+    p = {**MISSION, **parameters}
+    elements = OrbitalElements(
+        R_EARTH + p["altitude"] * 1000,
+        0.0,
+        math.radians(p["inclination"]),
+        math.radians(p["raan"]),
+        0.0,
+        math.radians(p["anomaly"]),
+    )
+    duration = p["days"] * 86400
+    power = PowerSystem(load=p["load"], capacity=p["capacity"] * (1 - p["battery_fade"]))
+    thermal = ThermalModel.cubesat()
+    battery = thermal.names.index("battery")
+
+    samples = lit = 0
+    generated = 0.0
+    lowest = 1.0
+    coldest, hottest = math.inf, -math.inf
+    for part in simulate(elements, duration, p["step"], power, thermal):
+        samples += len(part.t)
+        lit += int(part.sunlit.sum())
+        generated += float(part.generated.sum()) * p["step"] / 3600
+        lowest = min(lowest, float(part.soc.min()))
+        coldest = min(coldest, float(part.temperatures[:, battery].min()))
+        hottest = max(hottest, float(part.temperatures[:, battery].max()))
+
+    ballistic = p["drag_coefficient"] * p["area"] / p["mass"]
+    a, reentry = decay(elements, duration, ballistic)
+    return {
+        "lowest_soc": lowest,
+        "eclipse_fraction": 1 - lit / samples,
+        "energy_margin": (generated - p["load"] * samples * p["step"] / 3600) / p["days"],
+        "battery_min_c": coldest - 273.15,
+        "battery_max_c": hottest - 273.15,
+        "altitude_loss_km": (elements.a - a) / 1000,
+        "reentered": float(reentry is not None),
+    }
@@ -0,0 +1,384 @@
+# orbit.py
+# Contains the orbit propagators used by the simulation mode: Keplerian two-body motion with
+# the secular effects of J2, and (if the sgp4 package is installed) SGP4 from two-line elements
+#
+# Every propagator takes a whole array of times and returns whole arrays of states, so a year
+# at 10 s resolution (about 3.2 million steps) is a handful of NumPy calls, not a Python loop.
+# Units are SI throughout: metres, seconds and radians, in an Earth-centred inertial frame.
+
+import math
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Tuple, Union
+
+import numpy as np
+
+try:
+    from sgp4.api import Satrec
+except ImportError:  # optional: only needed to propagate TLEs with SGP4
+    Satrec = None
+
+MU_EARTH = 3.986004418e14  # gravitational parameter (m^3/s^2)
+R_EARTH = 6378137.0  # equatorial radius (m)
+J2 = 1.08262668e-3  # second zonal harmonic
+SECONDS_PER_DAY = 86400.0
+
+# Exponential atmosphere (Vallado, table 8-4): base altitude (km), density there (kg/m^3) and
+# scale height (km), for the bands from each base altitude up to the next
+_ATMOSPHERE = np.array(
+    [
+        (100, 5.297e-7, 5.877),
+        (110, 9.661e-8, 7.263),
+        (120, 2.438e-8, 9.473),
+        (130, 8.484e-9, 12.636),
+        (140, 3.845e-9, 16.149),
+        (150, 2.070e-9, 22.523),
+        (180, 5.464e-10, 29.740),
+        (200, 2.789e-10, 37.105),
+        (250, 7.248e-11, 45.546),
+        (300, 2.418e-11, 53.628),
+        (350, 9.518e-12, 53.298),
+        (400, 3.725e-12, 58.515),
+        (450, 1.585e-12, 60.828),
+        (500, 6.967e-13, 63.822),
+        (600, 1.454e-13, 71.835),
+        (700, 3.614e-14, 88.667),
+        (800, 1.170e-14, 124.64),
+        (900, 5.245e-15, 181.05),
+        (1000, 3.019e-15, 268.00),
+    ]
+)
+
+
+class OrbitalElements(NamedTuple):
+    """
+    Classical (mean) orbital elements at an epoch
+    """
+
+    a: float  # semi-major axis (m)
+    e: float  # eccentricity
+    i: float  # inclination (rad)
+    raan: float  # right ascension of the ascending node (rad)
+    argp: float  # argument of perigee (rad)
+    M0: float  # mean anomaly at the epoch (rad)
+    epoch: Union[datetime, None] = None  # when the elements apply (times are seconds after it)
+
+    @classmethod
+    def circular(cls, altitude: float, inclination: float, raan: float = 0.0, **kwargs):
+        """
+        Builds the elements of a circular orbit
+
+        :param altitude: The altitude above the equatorial radius (m)
+        :type altitude: float
+        :param inclination: The inclination (rad)
+        :type inclination: float
+        :param raan: (optional) The right ascension of the ascending node (rad)
+        :type raan: float
+        :return: The elements
+        :rtype: OrbitalElements
+        """
+        return cls(R_EARTH + altitude, 0.0, inclination, raan, 0.0, 0.0, **kwargs)
+
+    @property
+    def period(self) -> float:
+        """
+        :return: The two-body orbital period (s)
+        :rtype: float
+        """
+        return 2 * np.pi * np.sqrt(self.a ** 3 / MU_EARTH)
+
+    def j2_rates(self):
+        """
+        :return: The secular drift of the node, the perigee and the mean anomaly due to J2
+                 (rad/s), i.e. (raan_dot, argp_dot, mean_motion)
+        :rtype: tuple
+        """
+        n = np.sqrt(MU_EARTH / self.a ** 3)
+        p = self.a * (1 - self.e ** 2)
+        k = 0.75 * n * J2 * (R_EARTH / p) ** 2
+        cos_i = np.cos(self.i)
+        raan_dot = -2 * k * cos_i
+        argp_dot = k * (5 * cos_i ** 2 - 1)
+        mean_motion = n + k * np.sqrt(1 - self.e ** 2) * (3 * cos_i ** 2 - 1)
+        return raan_dot, argp_dot, mean_motion
+
+
+class Trajectory(NamedTuple):
+    """
+    States along a time grid
+    """
+
+    t: np.ndarray  # seconds after the epoch, shape (n,)
+    r: np.ndarray  # position (m), shape (n, 3)
+    v: Union[np.ndarray, None]  # velocity (m/s), shape (n, 3), if it was computed
+    epoch: Union[datetime, None] = None
+
+    @property
+    def altitude(self) -> np.ndarray:
+        """
+        :return: The height above a spherical Earth of equatorial radius (m)
+        :rtype: np.ndarray
+        """
+        return np.sqrt(np.einsum("ij,ij->i", self.r, self.r)) - R_EARTH
+
+
+def time_grid(duration: float, step: float, start: float = 0.0) -> np.ndarray:
+    """
+    :param duration: The length of the grid (s)
+    :type duration: float
+    :param step: The spacing of the grid (s)
+    :type step: float
+    :param start: (optional) The first time (s)
+    :type start: float
+    :return: Evenly spaced times from start to start + duration (inclusive where it lands)
+    :rtype: np.ndarray
+    """
+    return start + step * np.arange(int(duration // step) + 1, dtype=np.float64)
+
+
+def solve_kepler(M: np.ndarray, e: float, tolerance: float = 1e-12) -> np.ndarray:
+    """
+    Solves Kepler's equation M = E - e sin E for every mean anomaly at once (Newton's method)
+
+    :param M: Mean anomalies (rad)
+    :type M: np.ndarray
+    :param e: The eccentricity (< 1)
+    :type e: float
+    :param tolerance: (optional) The largest acceptable error in E (rad)
+    :type tolerance: float
+    :return: Eccentric anomalies (rad)
+    :rtype: np.ndarray
+    """
+    return _kepler(M, e, tolerance)[0]
+
+
+def _kepler(M: np.ndarray, e: float, tolerance: float = 1e-12):
+    """
+    Solves Kepler's equation, also returning cos E and sin E (which the last Newton step has
+    already computed, to within the tolerance)
+
+    :return: (E, cos E, sin E)
+    :rtype: tuple
+    """
+    M = np.remainder(M, 2 * np.pi)
+    if e == 0:
+        return M, np.cos(M), np.sin(M)
+    if e < 0.8:
+        sin_M = np.sin(M)
+        E = M + e * sin_M * (1 + e * np.cos(M))  # third-order starting guess
+    else:
+        E = np.full_like(M, np.pi)
+    for _ in range(30):
+        cos_E, sin_E = np.cos(E), np.sin(E)
+        step = (E - e * sin_E - M) / (1 - e * cos_E)
+        E -= step
+        # Newton converges quadratically: what is left after a step s is about e s^2 / 2(1-e)
+        largest = np.abs(step).max()
+        if e * largest * largest < 2 * (1 - e) * tolerance:
+            break
+    # move cos/sin along with the last (tiny) step: cos(E - s) ~ cos E + s sin E
+    cos_E += step * sin_E
+    sin_E -= step * cos_E
+    return E, cos_E, sin_E
+
+
+def propagate(
+    elements: OrbitalElements,
+    t: np.ndarray,
+    j2: bool = True,
+    velocity: bool = True,
+    block: int = 1 << 16,
+) -> Trajectory:
+    """
+    Propagates an orbit over a grid of times with two-body motion plus the secular J2 drift of
+    the node, perigee and mean anomaly
+    The grid is processed in blocks small enough for the intermediate arrays to stay in cache,
+    writing straight into the output arrays.
+
+    :param elements: The orbit at the epoch
+    :type elements: OrbitalElements
+    :param t: Seconds after the epoch, shape (n,) (e.g. from time_grid())
+    :type t: np.ndarray
+    :param j2: (optional) Whether to include J2, defaults to True
+    :type j2: bool
+    :param velocity: (optional) Whether to compute velocities too, defaults to True
+    :type velocity: bool
+    :param block: (optional) The number of times processed at once
+    :type block: int
+    :return: The states at each time
+    :rtype: Trajectory
+    """
+    t = np.ascontiguousarray(t, dtype=np.float64).ravel()
+    r = np.empty((len(t), 3))
+    v = np.empty((len(t), 3)) if velocity else None
+    for start in range(0, len(t), block):
+        end = start + block
+        _propagate_block(
+            elements, j2, t[start:end], r[start:end], v[start:end] if velocity else None
+        )
+    return Trajectory(t, r, v, elements.epoch)
+
+
+def _propagate_block(
+    elements: OrbitalElements, j2: bool, t: np.ndarray, r: np.ndarray, v: np.ndarray
+) -> None:
+    """
+    Propagates one block of times into the matching rows of r (and v, unless it is None)
+    Uses the argument of latitude u (perigee plus true anomaly), which needs four
+    trigonometric evaluations per step for a circular orbit and six otherwise.
+    """
+    a, e, i = elements.a, elements.e, elements.i
+    if j2:
+        raan_dot, argp_dot, mean_motion = elements.j2_rates()
+    else:
+        raan_dot, argp_dot, mean_motion = 0.0, 0.0, np.sqrt(MU_EARTH / a ** 3)
+    cos_i, sin_i = np.cos(i), np.sin(i)
+
+    M = elements.M0 + mean_motion * t
+    argp = elements.argp + argp_dot * t
+    if e == 0:
+        u = np.remainder(argp + M, 2 * np.pi)  # the true anomaly is the mean anomaly
+        cos_u, sin_u = np.cos(u), np.sin(u)
+        radius = a
+        cos_w = sin_w = None
+    else:
+        _, cos_E, sin_E = _kepler(M, e)
+        denominator = 1 - e * cos_E
+        cos_nu = (cos_E - e) / denominator
+        sin_nu = np.sqrt(1 - e * e) * sin_E / denominator
+        radius = a * denominator
+        cos_w, sin_w = np.cos(argp), np.sin(argp)
+        cos_u = cos_w * cos_nu - sin_w * sin_nu
+        sin_u = sin_w * cos_nu + cos_w * sin_nu
+
+    raan = elements.raan + raan_dot * t
+    cos_O, sin_O = np.cos(raan), np.sin(raan)
+    r[:, 0] = radius * (cos_O * cos_u - sin_O * sin_u * cos_i)
+    r[:, 1] = radius * (sin_O * cos_u + cos_O * sin_u * cos_i)
+    r[:, 2] = radius * sin_u * sin_i
+    if v is None:
+        return
+
+    # the perifocal velocity is sqrt(mu/p) * (-sin nu, e + cos nu), rotated by u as above
+    speed = np.sqrt(MU_EARTH / (a * (1 - e * e)))
+    if e == 0:
+        along, radial = sin_u, cos_u
+    else:
+        along = sin_u + e * sin_w
+        radial = cos_u + e * cos_w
+    v[:, 0] = -speed * (cos_O * along + sin_O * radial * cos_i)
+    v[:, 1] = -speed * (sin_O * along - cos_O * radial * cos_i)
+    v[:, 2] = speed * radial * sin_i
+
+
+def density(altitude: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+    """
+    :param altitude: Heights above the equatorial radius (m), from 100 km up
+    :type altitude: Union[float, np.ndarray]
+    :return: The density of the atmosphere there (kg/m^3), from a static exponential model
+    :rtype: Union[float, np.ndarray]
+    """
+    km = np.asarray(altitude, dtype=np.float64) / 1000
+    band = np.clip(np.searchsorted(_ATMOSPHERE[:, 0], km, side="right") - 1, 0, None)
+    base, rho, height = _ATMOSPHERE[band].T
+    return rho * np.exp((base - km) / height)
+
+
+def decay(
+    elements: OrbitalElements, duration: float, ballistic: float, step: float = 3600.0
+) -> Tuple[float, Union[float, None]]:
+    """
+    Estimates how far drag lowers a near-circular orbit: da/dt = -B rho(a) sqrt(mu a)
+
+    :param elements: The orbit at the start
+    :type elements: OrbitalElements
+    :param duration: How long to go on for (s)
+    :type duration: float
+    :param ballistic: The ballistic coefficient B = Cd A / m (m^2/kg)
+    :type ballistic: float
+    :param step: (optional) The integration step (s)
+    :type step: float
+    :return: The semi-major axis at the end (m), and when the orbit fell below 100 km (s, or
+             None if it didn't)
+    :rtype: Tuple[float, Union[float, None]]
+    """
+    bases = list(_ATMOSPHERE[:, 0])
+    table = _ATMOSPHERE.tolist()
+
+    def rate(a):  # (plain floats: this is called twice per step)
+        km = (a - R_EARTH) / 1000
+        base, rho, height = table[max(bisect_right(bases, km) - 1, 0)]
+        return ballistic * rho * math.exp((base - km) / height) * math.sqrt(MU_EARTH * a)
+
+    a = elements.a
+    floor = R_EARTH + 100e3
+    t = 0.0
+    while t < duration:
+        h = min(step, duration - t)
+        a -= h * rate(a - 0.5 * h * rate(a))  # midpoint (second order) step
+        t += h
+        if a < floor:
+            return floor, t
+    return a, None
+
+
+def _tle_epoch(line1: str) -> datetime:
+    """
+    :param line1: The first line of a TLE
+    :type line1: str
+    :return: The epoch of the TLE (UTC)
+    :rtype: datetime
+    """
+    year = int(line1[18:20])
+    year += 2000 if year < 57 else 1900
+    day = float(line1[20:32])
+    return datetime(year, 1, 1, tzinfo=timezone.utc) + timedelta(days=day - 1)
+
+
+def elements_from_tle(line1: str, line2: str) -> OrbitalElements:
+    """
+    Reads the mean elements of a two-line element set (for propagate(); SGP4 is more accurate
+    for TLEs, see propagate_tle())
+
+    :param line1: The first line of the TLE
+    :type line1: str
+    :param line2: The second line of the TLE
+    :type line2: str
+    :return: The elements at the TLE's epoch
+    :rtype: OrbitalElements
+    """
+    inclination = np.radians(float(line2[8:16]))
+    raan = np.radians(float(line2[17:25]))
+    e = float("0." + line2[26:33].strip())
+    argp = np.radians(float(line2[34:42]))
+    M0 = np.radians(float(line2[43:51]))
+    n = float(line2[52:63]) * 2 * np.pi / SECONDS_PER_DAY  # rev/day to rad/s
+    a = (MU_EARTH / n ** 2) ** (1 / 3)
+    return OrbitalElements(a, e, inclination, raan, argp, M0, _tle_epoch(line1))
+
+
+def propagate_tle(line1: str, line2: str, t: np.ndarray) -> Trajectory:
+    """
+    Propagates a two-line element set with SGP4 (requires the sgp4 package)
+
+    :param line1: The first line of the TLE
+    :type line1: str
+    :param line2: The second line of the TLE
+    :type line2: str
+    :param t: Seconds after the TLE's epoch, shape (n,)
+    :type t: np.ndarray
+    :return: The states at each time (in SGP4's TEME frame)
+    :rtype: Trajectory
+    """
+    if Satrec is None:
+        raise ImportError("propagate_tle() needs the sgp4 package (pip install sgp4)")
+    satellite = Satrec.twoline2rv(line1, line2)
+    t = np.asarray(t, dtype=np.float64)
+    days = t / SECONDS_PER_DAY
+    jd = np.full(t.shape, satellite.jdsatepoch) + np.floor(days)
+    fr = satellite.jdsatepochF + (days - np.floor(days))
+    errors, r, v = satellite.sgp4_array(jd, fr)
+    if errors.any():
+        first = int(np.flatnonzero(errors)[0])
+        raise ValueError(f"SGP4 failed at t={t[first]:g} s (error code {errors[first]})")
+    return Trajectory(t, r * 1000.0, v * 1000.0, _tle_epoch(line1))
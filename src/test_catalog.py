@@ -0,0 +1,178 @@
+# test_catalog.py
+# Contains the TestCatalog, the single index of available tests that the TestLoader and the
+# TestLoaderMenu both query (it is filled in by the DynamicImporter as it scans /testdata)
+
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Iterator, List, NamedTuple, Tuple, Union
+
+
+class CatalogEntry(NamedTuple):
+    """
+    What is known about one test without importing it
+    """
+
+    name: str  # the name of the test class
+    module: str  # the module that defines it, e.g. "testdata.sample"
+    path: str  # the file that defines it, relative to /testdata
+    tags: Tuple[str, ...]  # the test class's tags attribute
+    source_hash: str  # a hash of the file's source, to tell real edits from touched files
+
+
+class TestCatalog:
+    """
+    An index of tests by name and by tag
+    Names are kept sorted (case-insensitively) so that a prefix search is two binary searches,
+    and each tag maps to the set of tests carrying it.
+    """
+
+    def __init__(self):
+        """
+        Initializes a new, empty TestCatalog instance
+        """
+        self._entries = {}  # name: CatalogEntry
+        self._keys = []  # the folded names, sorted
+        self._names = []  # the names, in the same order as _keys
+        self._tags = {}  # folded tag: set of names
+        self._lock = threading.RLock()
+        self.version = 0  # incremented on every change, so views can tell they are stale
+
+    def update(self, entries: Iterable[CatalogEntry] = (), removed: Iterable[str] = ()) -> None:
+        """
+        Adds or replaces entries, and removes tests that no longer exist
+
+        :param entries: (optional) The new or changed entries
+        :type entries: Iterable[CatalogEntry]
+        :param removed: (optional) The names of the tests to remove
+        :type removed: Iterable[str]
+        """
+        with self._lock:
+            for name in removed:
+                self._remove(name)
+            for entry in entries:
+                self._remove(entry.name)
+                self._entries[entry.name] = entry
+                key = entry.name.casefold()
+                index = bisect_right(self._keys, key)
+                self._keys.insert(index, key)
+                self._names.insert(index, entry.name)
+                for tag in entry.tags:
+                    self._tags.setdefault(tag.casefold(), set()).add(entry.name)
+            self.version += 1
+
+    def _remove(self, name: str) -> None:
+        """
+        Drops a test from the indexes (the caller must hold the lock)
+        """
+        entry = self._entries.pop(name, None)
+        if entry is None:
+            return
+        key = name.casefold()
+        index = bisect_left(self._keys, key)
+        while self._names[index] != name:
+            index += 1
+        del self._keys[index]
+        del self._names[index]
+        for tag in entry.tags:
+            tagged = self._tags.get(tag.casefold())
+            if tagged is not None:
+                tagged.discard(name)
+                if not tagged:
+                    del self._tags[tag.casefold()]
+
+    def get(self, name: str) -> Union[CatalogEntry, None]:
+        """
+        :param name: The name of a test class
+        :type name: str
+        :return: The test's entry, or None if there is no such test
+        :rtype: Union[CatalogEntry, None]
+        """
+        return self._entries.get(name)
+
+    def find(self, name: str) -> Union[CatalogEntry, None]:
+        """
+        Looks a test up by name, ignoring case
+
+        :param name: The name of a test class
+        :type name: str
+        :return: The test's entry, or None if there is no such test
+        :rtype: Union[CatalogEntry, None]
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                key = name.casefold()
+                index = bisect_left(self._keys, key)
+                if index < len(self._keys) and self._keys[index] == key:
+                    entry = self._entries[self._names[index]]
+            return entry
+
+    def search(
+        self, prefix: str = "", tags: Iterable[str] = (), limit: int = None
+    ) -> List[CatalogEntry]:
+        """
+        Finds the tests whose names start with a prefix and that carry all of the given tags
+
+        :param prefix: (optional) The start of the name (case-insensitive), "" for any name
+        :type prefix: str
+        :param tags: (optional) Tags that every result must have (case-insensitive)
+        :type tags: Iterable[str]
+        :param limit: (optional) The maximum number of results
+        :type limit: int
+        :return: The matching entries, sorted by name
+        :rtype: List[CatalogEntry]
+        """
+        with self._lock:
+            key = prefix.casefold()
+            low = bisect_left(self._keys, key)
+            high = bisect_right(self._keys, key + "\U0010ffff", low)
+            names = self._names[low:high]
+
+            tagged = None
+            for tag in tags:
+                matches = self._tags.get(tag.casefold(), set())
+                tagged = matches if tagged is None else tagged & matches
+            if tagged is not None:
+                names = [name for name in names if name in tagged]
+            return [self._entries[name] for name in names[:limit]]
+
+    def query(self, text: str, limit: int = None) -> List[CatalogEntry]:
+        """
+        Searches with a query typed by the user, e.g. "pow #smoke" finds the tests tagged
+        "smoke" whose names start with "pow" (tags may also be written as "tag:smoke")
+
+        :param text: The query
+        :type text: str
+        :param limit: (optional) The maximum number of results
+        :type limit: int
+        :return: The matching entries, sorted by name
+        :rtype: List[CatalogEntry]
+        """
+        prefix = ""
+        tags = []
+        for term in text.split():
+            if term.startswith("#"):
+                tags.append(term[1:])
+            elif term.lower().startswith("tag:"):
+                tags.append(term[4:])
+            else:
+                prefix = term
+        return self.search(prefix, tags, limit)
+
+    def tags(self) -> List[str]:
+        """
+        :return: Every tag in use (folded to lower case), sorted
+        :rtype: List[str]
+        """
+        with self._lock:
+            return sorted(self._tags)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[CatalogEntry]:
+        with self._lock:
+            return iter([self._entries[name] for name in self._names])
@@ -1,48 +1,260 @@
-from importlib import import_module
+import ast
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import select
+import sys
+import threading
+from importlib import import_module, reload
 from pathlib import Path
 
+from test_catalog import CatalogEntry, TestCatalog
+
+# Files in /testdata that hold the testing framework rather than tests
+NOT_TESTS = frozenset(
+    [
+        "__init__.py",
+        "test_module.py",
+        "test_registry.py",
+        "connections.py",
+        "framing.py",
+        "emulator.py",
+        "results.py",
+        "telemetry.py",
+        "ports.py",
+        "sockets.py",
+    ]
+)
+
 
 class DynamicImporter:
     """
     Allows for dynamic loading of test classes into the TestLoader at runtime
+    Test files are only parsed (not imported) to find their test classes, and what was found is
+    cached in a manifest so unchanged files aren't even parsed next time. A test's module is
+    imported only when the test is actually loaded (see get_class()).
     IMPORTANT: This is a singleton class!
     NOTE: This is probably not "pythonic" but it works, so...
     """
 
-    # TODO: Add hot-reloading so that tests written while an ATMOS instance is running can be
-    #       included automatically
-
     _instance = None
-    class_list = {}  # a dictionary ("ClassName": Class,)
+    class_list = {}  # a dictionary ("ClassName": "module.name",)
+    MANIFEST = ".manifest.json"  # the discovery cache, kept in the testdata directory
 
     def __init__(self):
         """
         Initializes the DynamicImporter instance.
-        Traverses the files in the /testdata directory and imports classes with the naming
+        Traverses the files in the /testdata directory and finds classes with the naming
         convention: filename.py -> class FilenameTest
         """
         if DynamicImporter._instance is not None:
             raise Exception("DynamicImporter instance already exists!")
         DynamicImporter._instance = self
 
+        self.catalog = TestCatalog()  # name, module, tags, etc. of every test found
+        self._classes = {}  # the test classes that have been imported so far
+        self._lock = threading.RLock()
         current_path = Path(__file__).parent
-        test_path = current_path / "testdata"
-        files = test_path.rglob("*.py")
+        self.test_path = current_path / "testdata"
+        self.manifest_path = self.test_path / self.MANIFEST
 
-        for file in files:
+        try:
+            manifest = json.loads(self.manifest_path.read_text())
+        except (OSError, ValueError):
+            manifest = {}
+        self._manifest = manifest.get("files", {}) if manifest.get("version") == 2 else {}
+        self._saved_manifest = dict(self._manifest)
+        self.refresh()
 
-            if file.name in ["__init__.py", "test_module.py", "test_registry.py", "connections.py"]:
-                continue
+    def refresh(self, errors: dict = None) -> set:
+        """
+        Rescans the /testdata directory, updating class_list and the catalog in place
+        Only files that are new or have changed (by mtime and size, then by content hash) are
+        parsed, and only the modules of changed tests that were already imported are re-imported.
+        A test whose file can't be parsed or re-imported (e.g. it was saved mid-edit) keeps its
+        last working version until the file is fixed.
 
-            name = file.stem
-            module = import_module(f"testdata.{name}")
-            class_title = f"{name.title()}Test"
+        :param errors: (optional) Filled with the modules that could not be parsed or
+                       re-imported and the exception each one raised
+        :type errors: dict
+        :return: The names of the test classes that were added, changed or removed
+        :rtype: set
+        """
+        with self._lock:
+            manifest = {}
+            changed_modules = {}  # module name: file
 
-            try:
-                _class = getattr(module, class_title)  # get the class
-                self.class_list[class_title] = _class  # add the class to the class list
-            except AttributeError:  # don't throw exceptions for files that don't have a test
+            for file in sorted(self.test_path.rglob("*.py")):
+
+                if file.name in NOT_TESTS:
+                    continue
+
+                relative = file.relative_to(self.test_path).as_posix()
+                try:
+                    stat = file.stat()
+                except OSError:  # deleted while scanning
+                    continue
+                entry = self._manifest.get(relative)
+                if entry is None or [entry["mtime"], entry["size"]] != [stat.st_mtime_ns, stat.st_size]:
+                    try:
+                        source = file.read_bytes()
+                    except OSError:
+                        continue
+                    source_hash = hashlib.sha1(source).hexdigest()
+                    if entry is None or entry["hash"] != source_hash:
+                        module_name = "testdata." + relative[: -len(".py")].replace("/", ".")
+                        try:
+                            tests = self._scan(file, source)
+                        except (SyntaxError, ValueError) as e:
+                            tests = None
+                            if errors is not None:
+                                errors[module_name] = e
+                        if tests is not None or entry is None:
+                            entry = {
+                                "module": module_name,
+                                "hash": source_hash,
+                                "tests": tests or [],
+                            }
+                            changed_modules[module_name] = relative
+                    # a file that was only touched (or doesn't parse) keeps its entry (and isn't
+                    # reloaded)
+                    entry = dict(entry, mtime=stat.st_mtime_ns, size=stat.st_size)
+                manifest[relative] = entry
+
+            for module_name, relative in changed_modules.items():
+                module = sys.modules.get(module_name)
+                if module is None:
+                    continue
+                previous = dict(vars(module))
+                try:
+                    reload(module)
+                except Exception as e:  # keep the old version of a broken test
+                    vars(module).clear()
+                    vars(module).update(previous)
+                    if errors is not None:
+                        errors[module_name] = e
+                    if relative in self._manifest:
+                        current = manifest[relative]
+                        manifest[relative] = dict(
+                            self._manifest[relative], mtime=current["mtime"], size=current["size"]
+                        )
+
+            entries = {
+                test["name"]: CatalogEntry(
+                    test["name"], entry["module"], relative, tuple(test["tags"]), entry["hash"]
+                )
+                for relative, entry in manifest.items()
+                for test in entry["tests"]
+            }
+            changed = {
+                class_title
+                for class_title in set(entries) | set(self.class_list)
+                if entries.get(class_title) != self.catalog.get(class_title)
+            }
+
+            for class_title in changed:
+                self._classes.pop(class_title, None)
+                if class_title in entries:
+                    self.class_list[class_title] = entries[class_title].module
+                else:
+                    del self.class_list[class_title]
+            if changed:
+                self.catalog.update(
+                    [entries[name] for name in changed if name in entries],
+                    [name for name in changed if name not in entries],
+                )
+
+            self._manifest = manifest
+            if manifest != self._saved_manifest:
+                self._save_manifest(self.manifest_path, manifest)
+                self._saved_manifest = dict(manifest)
+            return changed
+
+    @staticmethod
+    def _scan(file: Path, source: bytes) -> list:
+        """
+        Finds the test class in a file (and its tags) without importing it
+        Raises SyntaxError (or ValueError, for null bytes) if the file can't be parsed.
+
+        :param file: The test file
+        :type file: Path
+        :param source: The contents of the file
+        :type source: bytes
+        :return: {"name": class name, "tags": [tag, ...]} for the file's test class (an empty
+                 list if it doesn't have one)
+        :rtype: list
+        """
+        class_title = f"{file.stem.title()}Test"
+        tree = ast.parse(source, filename=str(file))
+        return [
+            {"name": node.name, "tags": DynamicImporter._tags(node)}
+            for node in tree.body
+            if isinstance(node, ast.ClassDef) and node.name == class_title
+        ]
+
+    @staticmethod
+    def _tags(node: ast.ClassDef) -> list:
+        """
+        Reads a test class's tags attribute, e.g. tags = ("power", "smoke"), from its source
+
+        :param node: The class definition
+        :type node: ast.ClassDef
+        :return: The tags (empty if the class has none or they aren't literal strings)
+        :rtype: list
+        """
+        for statement in node.body:
+            if isinstance(statement, ast.Assign):
+                targets, value = statement.targets, statement.value
+            elif isinstance(statement, ast.AnnAssign) and statement.value is not None:
+                targets, value = [statement.target], statement.value
+            else:
+                continue
+            if not any(isinstance(t, ast.Name) and t.id == "tags" for t in targets):
                 continue
+            try:
+                tags = ast.literal_eval(value)
+            except ValueError:
+                return []
+            tags = [tags] if isinstance(tags, str) else tags
+            if isinstance(tags, (list, tuple, set, frozenset)):
+                return sorted(tag for tag in tags if isinstance(tag, str))
+            return []
+        return []
+
+    @staticmethod
+    def _save_manifest(path: Path, manifest: dict) -> None:
+        """
+        Writes the discovery cache (atomically, so a crash can't leave a half-written file)
+
+        :param path: Where the manifest lives
+        :type path: Path
+        :param manifest: The cache entry for each test file
+        :type manifest: dict
+        """
+        temporary = path.with_name(path.name + ".tmp")
+        try:
+            temporary.write_text(json.dumps({"version": 2, "files": manifest}, indent=1))
+            os.replace(temporary, path)
+        except OSError:
+            pass  # e.g. a read-only install: discovery still works, just uncached
+
+    def get_class(self, class_title: str):
+        """
+        Returns a test class, importing its module the first time it is asked for
+
+        :param class_title: The name of the test class
+        :type class_title: str
+        :return: The test class
+        :rtype: type
+        """
+        with self._lock:
+            _class = self._classes.get(class_title)
+            if _class is None:
+                module = import_module(self.class_list[class_title])
+                _class = self._classes[class_title] = getattr(module, class_title)
+            return _class
 
     @staticmethod
     def instance():
@@ -54,6 +266,108 @@ class DynamicImporter:
         return DynamicImporter._instance
 
 
+class TestWatcher:
+    """
+    Watches the /testdata directory and refreshes a TestLoader whenever a test file changes
+    Uses inotify where it is available (Linux) and polls file modification times elsewhere.
+    """
+
+    # inotify event masks (from <sys/inotify.h>)
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, loader, interval: float = 1.0, settle: float = 0.1):
+        """
+        :param loader: The TestLoader to refresh
+        :type loader: TestLoader
+        :param interval: (optional) Seconds between scans when polling
+        :type interval: float
+        :param settle: (optional) Seconds to wait for a burst of file events to finish
+        :type settle: float
+        """
+        self.loader = loader
+        self.interval = interval
+        self.settle = settle
+        self._stop = threading.Event()
+        self._thread = None
+        self._inotify = None
+        self._fd = None
+
+    def start(self) -> None:
+        """
+        Starts watching in a background thread
+        """
+        self._fd = self._init_inotify()
+        self._thread = threading.Thread(target=self._run, name="TestWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops watching
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _init_inotify(self):
+        """
+        :return: An inotify file descriptor, or None if inotify is not available
+        :rtype: Union[int, None]
+        """
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        self._inotify = libc
+        self._add_watches(fd)
+        return fd
+
+    def _add_watches(self, fd: int) -> None:
+        """
+        Watches /testdata and every folder below it (watching a folder twice is harmless)
+        """
+        root = self.loader.importer.test_path
+        for folder in [root] + [path for path in root.rglob("*") if path.is_dir()]:
+            self._inotify.inotify_add_watch(fd, os.fsencode(folder), self.WATCH_MASK)
+
+    def _run(self) -> None:
+        """
+        Body of the watcher thread
+        """
+        while not self._stop.is_set():
+            if self._fd is None:
+                self._stop.wait(self.interval)
+                self.loader.reload()
+                continue
+
+            readable, _, _ = select.select([self._fd], [], [], 0.5)
+            if not readable:
+                continue
+            # let a burst of events (e.g. an editor's save) finish, then rescan once
+            while readable:
+                try:
+                    os.read(self._fd, 65536)
+                except BlockingIOError:
+                    pass
+                readable, _, _ = select.select([self._fd], [], [], self.settle)
+            self._add_watches(self._fd)  # pick up any new folders
+            self.loader.reload()
+
+
 class TestLoader:
     """
     Provides useful utilities to load test classes into the App
@@ -62,13 +376,68 @@ class TestLoader:
     def __init__(self):
         self.menu = None
         self.importer = DynamicImporter.instance()
-        self.library = self.importer.class_list
+        self.library = self.importer.class_list  # ("ClassName": "module.name",)
+        self.catalog = self.importer.catalog
+        self.watcher = None
 
     def set_menu(self, menu):
         self.menu = menu
 
+    def get(self, test_name: str):
+        """
+        Returns a test class by name (importing it if necessary)
+
+        :param test_name: The name of the test class
+        :type test_name: str
+        :return: The test class
+        :rtype: type
+        """
+        return self.importer.get_class(test_name)
+
+    def search(self, query: str, limit: int = None) -> list:
+        """
+        Finds tests by name prefix and tags (see TestCatalog.query)
+
+        :param query: The search, e.g. "pow #smoke"
+        :type query: str
+        :param limit: (optional) The maximum number of results
+        :type limit: int
+        :return: The matching catalog entries, sorted by name
+        :rtype: list
+        """
+        return self.catalog.query(query, limit)
+
     def load(self, test_name: str):
-        self.menu.load_test(self.library[test_name])
+        self.menu.load_test(self.get(test_name))
 
     def unload(self):
         self.menu.load_test(None)
+
+    def reload(self) -> set:
+        """
+        Picks up new, changed and deleted tests, swapping the loaded test for its new version
+
+        :return: The names of the test classes that were added, changed or removed
+        :rtype: set
+        """
+        errors = {}
+        changed = self.importer.refresh(errors)
+        for module_name, error in errors.items():
+            message = f"Could not reload {module_name}: {error!r}"
+            if self.menu is None:
+                print(message)
+            else:  # this may be the watcher's thread, so the menu prints it on the app's loop
+                self.menu.notify(message)
+        test = getattr(self.menu, "test", None)
+        if test is not None and test.__class__.__name__ in changed:
+            name = test.__class__.__name__
+            self.menu.reload_test(self.get(name) if name in self.library else None)
+        return changed
+
+    def watch(self) -> None:
+        """
+        Starts hot-reloading tests as they are written or edited
+        """
+        if self.watcher is None:
+            self.watcher = TestWatcher(self)
+            self.watcher.start()
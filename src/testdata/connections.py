@@ -4,11 +4,24 @@
 # Contains classes and utility functions related to the operation of serial communication
 # between ATMOS and the MCU (connected via COM port)
 
+import asyncio
+import os
+import select
 import serial as ser
+import threading
+from abc import ABC, abstractmethod
 from base64 import b64decode, b64encode
+from collections import deque
+from contextlib import contextmanager
 from time import monotonic, sleep
 from typing import Union
 
+from .framing import make_codec
+
+# Readiness probe: ATMOS sends ENQ until the MCU answers with ACK
+ENQ = b"\x05"
+ACK = b"\x06"
+
 
 class SerialLock:
     """
@@ -46,6 +59,17 @@ class SerialLock:
                 self.active = False
         return not self.active
 
+    def remaining(self) -> float:
+        """
+        Determines how long this SerialLock instance will stay locked
+
+        :return: The number of seconds before the lock can be unlocked (0 if it can be now)
+        :rtype: float
+        """
+        if not self.active:
+            return 0
+        return max(0, self.duration - (monotonic() - self.time))
+
     def lock(self, duration: Union[int, float], key: Union[int, float, str, bytes] = None) -> None:
         """
         Locks this SerialLock instance
@@ -95,7 +119,375 @@ def locked(func):
     return decorator
 
 
-class SerialLine:
+def async_locked(func):
+    """
+    A decorator to ensure that an AsyncSerialLine coroutine abides by SerialLock protocols
+
+    :param func: The coroutine function being decorated
+    :type func: callable
+    :return: The decorated coroutine function
+    :rtype: callable
+    """
+
+    async def decorator(self, *args, **kwargs):
+        """
+        A decorator to ensure that an AsyncSerialLine coroutine abides by SerialLock protocols
+
+        :param self: The class instance whose method is being decorated
+        :type self: object
+        :return: The result of the decorated coroutine
+        :rtype: Any
+        """
+
+        lock = getattr(self, "lock", None)
+        if lock is None:
+            return
+        key = getattr(self, "key", None)
+        result = None
+        if lock.attempt_unlock(key):
+            result = await func(self, *args, **kwargs)
+        return result
+
+    return decorator
+
+
+class RingBuffer:
+    """
+    A preallocated single-producer/single-consumer byte ring buffer
+    The producer only ever advances the head and the consumer only ever advances the tail, so
+    the two sides never need to take a lock to share the buffer.
+    """
+
+    def __init__(self, size: int):
+        """
+        Initializes a new RingBuffer instance
+
+        :param size: The capacity of the buffer in bytes
+        :type size: int
+        """
+        self.size = size
+        self._data = bytearray(size)
+        self._view = memoryview(self._data)
+        self._head = 0  # total number of bytes ever written (producer only)
+        self._tail = 0  # total number of bytes ever consumed (consumer only)
+        self._readable = threading.Event()  # set by the producer whenever data is committed
+
+        self.overruns = 0  # how many times incoming data found the buffer full
+        self.overrun_bytes = 0  # how many bytes were dropped because the buffer was full
+        self.high_water = 0  # the largest number of bytes that were ever waiting at once
+
+    def __len__(self) -> int:
+        """
+        :return: The number of bytes waiting to be consumed
+        :rtype: int
+        """
+        return self._head - self._tail
+
+    def write_view(self) -> memoryview:
+        """
+        Returns the largest contiguous free region of the buffer (producer side)
+        Data placed in the view only becomes visible to the consumer after commit() is called.
+
+        :return: A writable view of the free space (empty if the buffer is full)
+        :rtype: memoryview
+        """
+        start = self._head % self.size
+        free = self.size - (self._head - self._tail)
+        return self._view[start : start + min(free, self.size - start)]
+
+    def commit(self, count: int) -> None:
+        """
+        Publishes bytes that were placed in the most recent write_view() (producer side)
+
+        :param count: The number of bytes that were written
+        :type count: int
+        """
+        self._head += count
+        self.high_water = max(self.high_water, self._head - self._tail)
+        self._readable.set()
+
+    def overrun(self, count: int) -> None:
+        """
+        Records bytes that had to be discarded because the buffer was full (producer side)
+
+        :param count: The number of bytes that were discarded
+        :type count: int
+        """
+        if count:
+            self.overruns += 1
+            self.overrun_bytes += count
+
+    def _segments(self, count: int):
+        """
+        :param count: The number of waiting bytes to cover
+        :type count: int
+        :return: One or two views covering the oldest count bytes, in order
+        :rtype: list
+        """
+        start = self._tail % self.size
+        first = min(count, self.size - start)
+        if first == count:
+            return [self._view[start : start + count]]
+        return [self._view[start:], self._view[: count - first]]
+
+    def find(self, terminator: bytes) -> int:
+        """
+        Finds the first frame that ends with a terminator (consumer side)
+
+        :param terminator: The byte sequence that ends a frame
+        :type terminator: bytes
+        :return: The length of the frame including the terminator, or -1 if there is none
+        :rtype: int
+        """
+        waiting = self._head - self._tail
+        start = self._tail % self.size
+        first = min(waiting, self.size - start)
+        index = self._data.find(terminator, start, start + first)
+        if index >= 0:
+            return index - start + len(terminator)
+        if first == waiting:
+            return -1
+        # the waiting data wraps around: check across the seam, then the wrapped part
+        overlap = len(terminator) - 1
+        if overlap:
+            seam = bytes(self._view[start + first - min(overlap, first) : start + first])
+            seam += bytes(self._view[: min(overlap, waiting - first)])
+            index = seam.find(terminator)
+            if index >= 0:
+                return first - min(overlap, first) + index + len(terminator)
+        index = self._data.find(terminator, 0, waiting - first)
+        if index >= 0:
+            return first + index + len(terminator)
+        return -1
+
+    def read(self, count: int) -> bytes:
+        """
+        Consumes bytes from the buffer (consumer side)
+
+        :param count: The number of bytes to consume (at most len(self))
+        :type count: int
+        :return: The consumed bytes
+        :rtype: bytes
+        """
+        count = min(count, self._head - self._tail)
+        data = b"".join(self._segments(count))
+        self._tail += count
+        return data
+
+    def readinto(self, buffer, count: int) -> int:
+        """
+        Consumes bytes from the buffer into a caller-provided buffer (consumer side)
+
+        :param buffer: A writable buffer that receives the data
+        :type buffer: Union[bytearray, memoryview]
+        :param count: The maximum number of bytes to consume
+        :type count: int
+        :return: The number of bytes consumed
+        :rtype: int
+        """
+        target = memoryview(buffer)
+        count = min(count, self._head - self._tail, len(target))
+        offset = 0
+        for segment in self._segments(count):
+            target[offset : offset + len(segment)] = segment
+            offset += len(segment)
+        self._tail += count
+        return count
+
+    def wait_for_frame(
+        self, terminator: bytes, timeout: Union[int, float, None]
+    ) -> int:
+        """
+        Blocks until a terminated frame is waiting or a timeout expires (consumer side)
+
+        :param terminator: The byte sequence that ends a frame
+        :type terminator: bytes
+        :param timeout: The maximum amount of time in seconds to wait (None waits forever)
+        :type timeout: Union[int, float, None]
+        :return: The length of the frame, or -1 if the timeout expired first
+        :rtype: int
+        """
+        return self._wait(lambda: self.find(terminator), timeout)
+
+    def wait_for_data(self, timeout: Union[int, float, None]) -> int:
+        """
+        Blocks until any data is waiting or a timeout expires (consumer side)
+
+        :param timeout: The maximum amount of time in seconds to wait (None waits forever)
+        :type timeout: Union[int, float, None]
+        :return: The number of bytes waiting, or -1 if the timeout expired first
+        :rtype: int
+        """
+        return self._wait(lambda: len(self) or -1, timeout)
+
+    def _wait(self, check, timeout: Union[int, float, None]) -> int:
+        """
+        Blocks until a check succeeds or a timeout expires (consumer side)
+
+        :param check: Returns a non-negative result once the wait is over, -1 otherwise
+        :type check: callable
+        :param timeout: The maximum amount of time in seconds to wait (None waits forever)
+        :type timeout: Union[int, float, None]
+        :return: The result of the check, or -1 if the timeout expired first
+        :rtype: int
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            result = check()
+            if result >= 0:
+                return result
+            self._readable.clear()
+            result = check()  # data may have landed before the clear
+            if result >= 0:
+                return result
+            remaining = None if deadline is None else deadline - monotonic()
+            if remaining is not None and remaining <= 0:
+                return -1
+            self._readable.wait(remaining)
+
+
+class TransmitStats:
+    """
+    Counts what a SerialLine has written, so the effect of write coalescing can be measured
+    """
+
+    def __init__(self):
+        """
+        Initializes a new TransmitStats instance
+        """
+        self.messages = 0  # how many messages were handed to the line
+        self.bytes = 0  # how many bytes were written to the port
+        self.writes = 0  # how many write() calls were made on the port
+        self.coalesced_bytes = 0  # how many bytes went out in a write shared by several messages
+
+    @property
+    def syscalls_saved(self) -> int:
+        """
+        :return: How many write() calls were avoided by batching messages together
+        :rtype: int
+        """
+        return self.messages - self.writes
+
+    def __repr__(self):
+        return (
+            f"TransmitStats(messages={self.messages}, bytes={self.bytes}, writes={self.writes}, "
+            f"coalesced_bytes={self.coalesced_bytes}, syscalls_saved={self.syscalls_saved})"
+        )
+
+
+class Transport(ABC):
+    """
+    Provides an interface for the links that ATMOS talks to the MCU (or to radio software) over
+    Every transport has a SerialLock (lock) and the key that unlocks it (key), and its transmit
+    and receive methods abide by them (see locked), so Test instances, the PortManager and
+    Mission Ops can use a SerialLine or a socket (see sockets.make_transport) interchangeably.
+    """
+
+    name = None  # a name for the link (used to name its threads)
+    port = None  # the serial port or URL that the link was created for
+    timeout = 10  # the default receive timeout in seconds
+    framing = None  # the frame codec name (see framing.make_codec), None for LF-terminated data
+    codec = None  # the frame codec built from framing
+    ready = False  # whether the far end answered the ready_probe when the link was opened
+
+    @abstractmethod
+    def open(self):
+        """
+        Opens the link and waits until the far end is ready (see probe), recording whether it
+        answered in ready
+        """
+        pass
+
+    @abstractmethod
+    def close(self):
+        """
+        Closes the link (after writing out anything that is still buffered)
+        """
+        pass
+
+    @property
+    @abstractmethod
+    def is_open(self):
+        """
+        :return: True if the link is open, False otherwise
+        :rtype: bool
+        """
+        pass
+
+    @abstractmethod
+    def probe(self, timeout: Union[int, float] = None) -> bool:
+        """
+        Sends the ready_probe repeatedly until the far end answers or a timeout expires
+
+        :param timeout: (optional) The amount of time in seconds to keep probing
+        :type timeout: Union[int, float]
+        :return: True if the far end answered, False otherwise (or if there is no ready_probe)
+        :rtype: bool
+        """
+        pass
+
+    @abstractmethod
+    def transmit(self, message: bytes):
+        """
+        Writes a message to the link (wrapped in a frame if the link has a codec)
+
+        :param message: The raw data to be written
+        :type message: bytes
+        :return: The number of bytes written (or accepted for writing)
+        :rtype: int
+        """
+        pass
+
+    def transmit_many(self, messages):
+        """
+        Writes several messages to the link
+
+        :param messages: The raw data for each message
+        :type messages: Iterable[bytes]
+        :return: The number of bytes written
+        :rtype: int
+        """
+        return sum(self.transmit(message) or 0 for message in messages)
+
+    def flush(self) -> int:
+        """
+        Writes out anything that the link is holding back (e.g. coalesced writes)
+
+        :return: The number of bytes written
+        :rtype: int
+        """
+        return 0
+
+    @abstractmethod
+    def receive(self, timeout: Union[int, float] = None):
+        """
+        Reads the next message (a LF-terminated line, or a frame's payload) from the link
+
+        :param timeout: (optional) The amount of time in seconds to wait, defaults to the link
+                        timeout
+        :type timeout: Union[int, float]
+        :return: The message (whatever had arrived if the timeout expired first)
+        :rtype: bytes
+        """
+        pass
+
+    @abstractmethod
+    def receive_into(self, buffer, timeout: Union[int, float] = None):
+        """
+        Reads the next message from the link into a caller-provided buffer
+
+        :param buffer: A writable buffer that receives the data
+        :type buffer: Union[bytearray, memoryview]
+        :param timeout: (optional) The amount of time in seconds to wait, defaults to the link
+                        timeout
+        :type timeout: Union[int, float]
+        :return: The number of bytes received
+        :rtype: int
+        """
+        pass
+
+
+class SerialLine(Transport):
     """
     Provides a restricted Serial object for use in ATMOS Test instances
     """
@@ -103,9 +495,16 @@ class SerialLine:
     def __init__(self, name, port, baud, **options):
         """
         Initializes a new SerialLine instance
-        IMPORTANT: The Serial line will be opened automatically and then immediately closed
-                   This is an artifact of how pySerial initializes its Serial instances and
-                   is subject to change in future versions (it should not break compatibility)
+        The port is not touched until open() is called or the line is first used.
+        Pass ready_probe (and optionally ready_response) to have open() return as soon as the
+        MCU answers the probe rather than locking the line for ready_timeout seconds.
+        Pass capture=True (and optionally capture_size) to have a background thread drain the
+        port continuously into a RingBuffer while the line is open.
+        Pass framing (see framing.make_codec) to send and receive whole binary frames instead of
+        LF-terminated data.
+        Pass coalesce=True to buffer small transmissions and write them together once
+        flush_size bytes are waiting or flush_latency seconds have passed (whichever is first).
+        Pass archive (a TelemetryStore) to keep a timestamped copy of everything received.
         """
 
         self.name = name
@@ -118,29 +517,184 @@ class SerialLine:
         self.parity = options.get("parity", ser.PARITY_NONE)
         self.stop_bits = options.get("stop_bits", ser.STOPBITS_ONE)
         self.timeout = options.get("timeout", 10)
+        self.framing = options.get("framing", None)
+        self.ready_probe = options.get("ready_probe", None)
+        self.ready_response = options.get("ready_response", None)
+        self.ready_timeout = options.get("ready_timeout", 2)
+        self.probe_interval = options.get("probe_interval", 0.05)
+        self.ready = False  # whether the MCU answered the ready_probe when the line was opened
+        self.archive = options.get("archive", None)
 
+        self.codec = make_codec(self.framing)
+        self._frames = deque()  # frames decoded but not yet returned to a caller
+        self.capture_buffer = (
+            RingBuffer(options.get("capture_size", 65536))
+            if options.get("capture", False)
+            else None
+        )
+        self._reader = None  # the background capture thread (if capturing)
+        self._stop_capture = threading.Event()
+
+        self.coalesce = options.get("coalesce", False)
+        self.flush_size = options.get("flush_size", 256)
+        self.flush_latency = options.get("flush_latency", 0.005)
+        self.tx_stats = TransmitStats()
+        self._tx_buffer = bytearray()  # coalesced data waiting to be written
+        self._tx_pending = 0  # how many messages are in the coalescing buffer
+        self._tx_lock = threading.Lock()
+        self._flush_timer = None
+
+        # pySerial only opens the port on construction when it is given one
         self._line = ser.Serial(
-            port=self.port,
+            port=None,
             baudrate=self.baud,
             bytesize=self.byte_size,
             parity=self.parity,
             stopbits=self.stop_bits,
             timeout=self.timeout,
         )
-        self._line.close()
+        self._line.port = self.port
 
     def open(self):
         """
-        Opens and subsequently locks the serial line for 2 seconds (to give it time to open)
+        Opens the serial line and gives the MCU time to get ready
+        With a ready_probe, this waits until the MCU answers (at most ready_timeout seconds) and
+        records whether it did in ready. Otherwise, the line is locked for ready_timeout seconds.
         """
         self._line.open()
-        self.lock.lock(2, self.key)
+        self.ready = False
+        if self.ready_probe is None:
+            self.lock.lock(self.ready_timeout, self.key)
+        elif self.probe():
+            self.ready = True
+            self._line.reset_input_buffer()  # drop any duplicate answers
+        if self.capture_buffer is not None:
+            self._start_capture()
+
+    def _ensure_open(self) -> None:
+        """
+        Opens the serial line on first use, waiting until it is ready rather than letting the
+        call that triggered the open be dropped by the settling lock
+        """
+        if self._line.is_open:
+            return
+        self.open()
+        if self.lock.active:
+            sleep(self.lock.remaining())
+            self.lock.attempt_unlock(self.key)
+
+    def probe(self, timeout: Union[int, float] = None) -> bool:
+        """
+        Sends the ready_probe repeatedly until the MCU answers or a timeout expires
+
+        :param timeout: (optional) The amount of time in seconds to keep probing, defaults to
+                        ready_timeout
+        :type timeout: Union[int, float]
+        :return: True if the MCU answered, False otherwise (or if there is no ready_probe)
+        :rtype: bool
+        """
+        if self.ready_probe is None or not self._line.is_open:
+            return False
+        deadline = monotonic() + (self.ready_timeout if timeout is None else timeout)
+        reply = b""
+        with self._line_timeout(self.probe_interval):
+            while True:
+                self._line.write(self.ready_probe)
+                reply = reply[-64:] + self._read_available(self.probe_interval)
+                if reply and (self.ready_response is None or self.ready_response in reply):
+                    if self.codec is not None:
+                        self.codec.reset()  # the answer is not part of any frame
+                    return True
+                if monotonic() >= deadline:
+                    return False
+
+    def _read_available(self, timeout: Union[int, float, None]) -> bytes:
+        """
+        Reads whatever data is waiting, blocking until at least one byte arrives or a timeout
+        expires (the port's read timeout when not capturing)
+
+        :param timeout: The maximum amount of time in seconds to wait for the capture buffer
+        :type timeout: Union[int, float, None]
+        :return: The data that was read (empty on timeout)
+        :rtype: bytes
+        """
+        if self.capture_buffer is not None and self._reader is not None:
+            ring = self.capture_buffer
+            return ring.read(len(ring)) if ring.wait_for_data(timeout) > 0 else b""
+        return self._line.read(max(1, self._line.in_waiting))
 
     def close(self):
         """
-        Closes the serial line immediately
+        Closes the serial line immediately (after writing out any coalesced data)
         """
+        if self._line.is_open:
+            self.flush()
+        self._end_capture()
         self._line.close()
+        self.ready = False
+
+    def _start_capture(self) -> None:
+        """
+        Starts the background thread that drains the port into the capture buffer
+        """
+        if self._reader is not None and self._reader.is_alive():
+            return
+        self._stop_capture.clear()
+        self._reader = threading.Thread(
+            target=self._capture, name=f"{self.name}-capture", daemon=True
+        )
+        self._reader.start()
+
+    def _end_capture(self) -> None:
+        """
+        Stops the background capture thread (if it is running)
+        """
+        if self._reader is None:
+            return
+        self._stop_capture.set()
+        cancel = getattr(self._line, "cancel_read", None)
+        if cancel is not None and self._line.is_open:
+            cancel()
+        self._reader.join()
+        self._reader = None
+
+    def _capture(self) -> None:
+        """
+        Body of the capture thread: moves bytes from the port into the ring buffer
+        Reads go straight into the ring's free space, so steady-state capture allocates nothing.
+        When the ring is full the port is still drained (into a scratch buffer) so the OS buffer
+        never overruns, and the lost bytes are counted on the ring instead.
+        """
+        ring = self.capture_buffer
+        scratch = memoryview(bytearray(4096))
+        try:
+            fd = self._line.fileno()
+        except (AttributeError, ser.SerialException):
+            fd = None  # e.g. Windows: fall back to pySerial's readinto()
+
+        while not self._stop_capture.is_set():
+            try:
+                target = ring.write_view()
+                full = len(target) == 0
+                if full:
+                    target = scratch
+                if fd is not None:
+                    readable, _, _ = select.select([fd], [], [], 0.1)
+                    if not readable:
+                        continue
+                    count = os.readv(fd, [target])
+                else:
+                    waiting = self._line.in_waiting
+                    count = self._line.readinto(target[: max(1, min(waiting, len(target)))])
+            except BlockingIOError:
+                continue
+            except (ser.SerialException, OSError, TypeError, ValueError):
+                break  # the line was closed underneath the reader
+
+            if full:
+                ring.overrun(count)
+            elif count:
+                ring.commit(count)
 
     @property
     def is_open(self):
@@ -155,29 +709,504 @@ class SerialLine:
     @locked
     def transmit(self, message: bytes):
         """
-        Writes data to the serial line
+        Writes data to the serial line (wrapped in a frame if the line has a codec)
+        If the line coalesces writes, the data may be buffered briefly before it is written.
 
         :param message: The raw data to be written to the serial port
         :type message: bytes
+        :return: The number of bytes written (or accepted for writing)
+        :rtype: int
+        """
+        if self.codec is not None:
+            message = self.codec.encode(message)
+        if self.coalesce:
+            return self._enqueue(message, 1)
+        return self._write(message, 1)
+
+    @locked
+    def transmit_many(self, messages):
+        """
+        Writes several messages to the serial line with a single write call
+
+        :param messages: The raw data for each message
+        :type messages: Iterable[bytes]
+        :return: The number of bytes written
+        :rtype: int
+        """
+        if self.codec is not None:
+            messages = [self.codec.encode(message) for message in messages]
+        else:
+            messages = list(messages)
+        if not messages:
+            return 0
+        with self._tx_lock:
+            batch = b"".join(messages)
+            if self._tx_buffer:
+                # keep ordering with anything already coalesced
+                self._tx_buffer += batch
+                self._tx_pending += len(messages)
+                self._flush_locked()
+                return len(batch)
+            return self._write(batch, len(messages))
+
+    def flush(self) -> int:
+        """
+        Writes out any data waiting in the coalescing buffer
+
+        :return: The number of bytes written
+        :rtype: int
+        """
+        with self._tx_lock:
+            return self._flush_locked()
+
+    def _enqueue(self, data: bytes, count: int) -> int:
+        """
+        Adds data to the coalescing buffer, writing the buffer out if it is full enough
+
+        :param data: The data to be written
+        :type data: bytes
+        :param count: The number of messages that the data contains
+        :type count: int
+        :return: The number of bytes accepted
+        :rtype: int
+        """
+        with self._tx_lock:
+            self._tx_buffer += data
+            self._tx_pending += count
+            if len(self._tx_buffer) >= self.flush_size:
+                self._flush_locked()
+            elif self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_latency, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        return len(data)
+
+    def _flush_locked(self) -> int:
+        """
+        Writes out the coalescing buffer (the caller must hold the transmit lock)
+
         :return: The number of bytes written
         :rtype: int
         """
-        return self._line.write(message)
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if not self._tx_buffer:
+            return 0
+        written = self._write(self._tx_buffer, self._tx_pending)
+        self._tx_buffer.clear()
+        self._tx_pending = 0
+        return written
+
+    def _write(self, data, count: int) -> int:
+        """
+        Writes data to the port and records it in the transmit statistics
+
+        :param data: The data to be written
+        :type data: Union[bytes, bytearray]
+        :param count: The number of messages that the data contains
+        :type count: int
+        :return: The number of bytes written
+        :rtype: int
+        """
+        self._ensure_open()
+        written = self._line.write(data)
+        self.tx_stats.messages += count
+        self.tx_stats.writes += 1
+        self.tx_stats.bytes += written or 0
+        if count > 1:
+            self.tx_stats.coalesced_bytes += written or 0
+        return written
 
     @locked
-    def receive(self):
+    def receive(self, timeout: Union[int, float] = None):
         """
-        Reads data from the serial line until a terminator is received
+        Reads data from the serial line until a terminator (or a whole frame) is received
 
-        :return: The data received from the line
+        :param timeout: (optional) The amount of time in seconds to wait, defaults to the line
+                        timeout
+        :type timeout: Union[int, float]
+        :return: The data received from the line (a frame's payload if the line has a codec)
         :rtype: bytes
         """
-        return self._line.read_until()  # default terminator is linefeed (LF) char
+        timeout = self.timeout if timeout is None else timeout
+        self._ensure_open()
+        if self._tx_buffer:
+            self.flush()  # don't leave a coalesced command sitting while awaiting its reply
+        if self.codec is not None:
+            data = self._receive_frame(timeout)
+        elif self.capture_buffer is not None:
+            ring = self.capture_buffer
+            length = ring.wait_for_frame(b"\n", timeout)
+            data = ring.read(length if length >= 0 else len(ring))
+        else:
+            with self._line_timeout(timeout):
+                data = self._line.read_until()  # default terminator is linefeed (LF) char
+        if data and self.archive is not None:
+            self.archive.append(data)
+        return data
+
+    @locked
+    def receive_into(self, buffer, timeout: Union[int, float] = None):
+        """
+        Reads data from the serial line until a terminator (or a whole frame) is received, into
+        a caller-provided buffer (avoids allocating a new bytes object per message when
+        capturing)
+
+        :param buffer: A writable buffer that receives the data
+        :type buffer: Union[bytearray, memoryview]
+        :param timeout: (optional) The amount of time in seconds to wait, defaults to the line
+                        timeout
+        :type timeout: Union[int, float]
+        :return: The number of bytes received
+        :rtype: int
+        """
+        timeout = self.timeout if timeout is None else timeout
+        self._ensure_open()
+        if self._tx_buffer:
+            self.flush()
+        if self.codec is not None:
+            data = self._receive_frame(timeout)
+        elif self.capture_buffer is not None:
+            ring = self.capture_buffer
+            length = ring.wait_for_frame(b"\n", timeout)
+            count = ring.readinto(buffer, length if length >= 0 else len(ring))
+            if count and self.archive is not None:
+                self.archive.append(memoryview(buffer)[:count])
+            return count
+        else:
+            with self._line_timeout(timeout):
+                data = self._line.read_until(size=len(buffer))
+        memoryview(buffer)[: len(data)] = data
+        if data and self.archive is not None:
+            self.archive.append(data)
+        return len(data)
+
+    def _receive_frame(self, timeout: Union[int, float, None]) -> bytes:
+        """
+        Feeds data from the line into the codec until it produces a frame or a timeout expires
+
+        :param timeout: The maximum amount of time in seconds to wait (None waits forever)
+        :type timeout: Union[int, float, None]
+        :return: The payload of the next frame, or an empty bytes object on timeout
+        :rtype: bytes
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._line_timeout(timeout):
+            while not self._frames:
+                remaining = None if deadline is None else max(0, deadline - monotonic())
+                self._frames.extend(self.codec.decode(self._read_available(remaining)))
+                if not self._frames and remaining == 0:
+                    return b""
+        return self._frames.popleft()
+
+    @contextmanager
+    def _line_timeout(self, timeout: Union[int, float, None]):
+        """
+        Temporarily applies a read timeout to the underlying port
+
+        :param timeout: The read timeout in seconds
+        :type timeout: Union[int, float, None]
+        """
+        previous = self._line.timeout
+        if timeout != previous:
+            self._line.timeout = timeout
+        try:
+            yield
+        finally:
+            if timeout != previous:
+                self._line.timeout = previous
 
     def __del__(self):
         """
         Cleans up the Serial instance before finalizing the deletion of this SerialLine instance
         """
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+        self._end_capture()
+        if self._line.is_open:
+            self._line.close()
+
+
+class AsyncSerialLine:
+    """
+    Provides a restricted, asyncio-native Serial object so that a single event loop can drive
+    several serial lines at once without blocking on any one of them
+    """
+
+    READ_CHUNK = 4096  # the maximum number of bytes pulled from the port per read
+    POLL_INTERVAL = 0.01  # seconds between polls where the event loop cannot watch the port
+
+    def __init__(self, name, port, baud, **options):
+        """
+        Initializes a new AsyncSerialLine instance
+        Accepts the same options as SerialLine (except capture and coalescing). The underlying
+        port is used in non-blocking mode; the timeout option is used as the default receive
+        deadline instead. As with SerialLine, the port is not touched until it is first used.
+        """
+
+        self.name = name
+        self.port = port
+        self.baud = baud
+        self.lock = SerialLock()
+        self.key = f"{monotonic()}"
+
+        self.byte_size = options.get("byte_size", ser.EIGHTBITS)
+        self.parity = options.get("parity", ser.PARITY_NONE)
+        self.stop_bits = options.get("stop_bits", ser.STOPBITS_ONE)
+        self.timeout = options.get("timeout", 10)
+        self.framing = options.get("framing", None)
+        self.ready_probe = options.get("ready_probe", None)
+        self.ready_response = options.get("ready_response", None)
+        self.ready_timeout = options.get("ready_timeout", 2)
+        self.probe_interval = options.get("probe_interval", 0.05)
+        self.ready = False  # whether the MCU answered the ready_probe when the line was opened
+
+        self.codec = make_codec(self.framing)
+        self._frames = deque()  # frames decoded but not yet returned to a caller
+        self._buffer = bytearray()  # bytes received but not yet returned to a caller
+        self._line = ser.Serial(
+            port=None,
+            baudrate=self.baud,
+            bytesize=self.byte_size,
+            parity=self.parity,
+            stopbits=self.stop_bits,
+            timeout=0,  # non-blocking reads
+            write_timeout=0,  # non-blocking writes
+        )
+        self._line.port = self.port
+
+    async def open(self):
+        """
+        Opens the serial line and gives the MCU time to get ready
+        With a ready_probe, this waits until the MCU answers (at most ready_timeout seconds) and
+        records whether it did in ready. Otherwise, the line is locked for ready_timeout seconds.
+        """
+        self._line.open()
+        self.ready = False
+        if self.ready_probe is None:
+            self.lock.lock(self.ready_timeout, self.key)
+        elif await self.probe():
+            self.ready = True
+            self._line.reset_input_buffer()
+            self._buffer.clear()
+
+    async def _ensure_open(self) -> None:
+        """
+        Opens the serial line on first use, waiting until it is ready rather than letting the
+        call that triggered the open be dropped by the settling lock
+        """
+        if self._line.is_open:
+            return
+        await self.open()
+        if self.lock.active:
+            await asyncio.sleep(self.lock.remaining())
+            self.lock.attempt_unlock(self.key)
+
+    async def probe(self, timeout: Union[int, float] = None) -> bool:
+        """
+        Sends the ready_probe repeatedly until the MCU answers or a timeout expires
+
+        :param timeout: (optional) The amount of time in seconds to keep probing, defaults to
+                        ready_timeout
+        :type timeout: Union[int, float]
+        :return: True if the MCU answered, False otherwise (or if there is no ready_probe)
+        :rtype: bool
+        """
+        if self.ready_probe is None or not self._line.is_open:
+            return False
+        deadline = monotonic() + (self.ready_timeout if timeout is None else timeout)
+        while True:
+            self._line.write(self.ready_probe)
+            await self._wait_for(writable=False, timeout=self.probe_interval)
+            self._buffer = self._buffer[-64:] + self._line.read(self.READ_CHUNK)
+            response = self.ready_response
+            if self._buffer and (response is None or response in self._buffer):
+                self._buffer.clear()
+                if self.codec is not None:
+                    self.codec.reset()
+                return True
+            if monotonic() >= deadline:
+                return False
+
+    def close(self):
+        """
+        Closes the serial line immediately
+        """
+        self._line.close()
+        self.ready = False
+        self._buffer.clear()
+        self._frames.clear()
+        if self.codec is not None:
+            self.codec.reset()
+
+    @property
+    def is_open(self):
+        """
+        Determines whether the serial line is currently open
+
+        :return: True if the line is open, False otherwise
+        :rtype: bool
+        """
+        return self._line.is_open
+
+    async def _wait_for(self, writable: bool, timeout: Union[int, float, None]) -> None:
+        """
+        Suspends the calling coroutine until the port is ready (or the timeout expires)
+        Falls back to polling on platforms where the event loop cannot watch the port directly
+
+        :param writable: True to wait for the port to accept writes, False to wait for data
+        :type writable: bool
+        :param timeout: The maximum amount of time in seconds to wait (None waits forever)
+        :type timeout: Union[int, float, None]
+        """
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+
+        def wake():
+            if not ready.done():
+                ready.set_result(None)
+
+        try:
+            fd = self._line.fileno()
+            if writable:
+                loop.add_writer(fd, wake)
+            else:
+                loop.add_reader(fd, wake)
+        except (AttributeError, NotImplementedError):
+            # e.g. Windows or a proactor event loop: poll instead
+            delay = self.POLL_INTERVAL if timeout is None else min(self.POLL_INTERVAL, timeout)
+            await asyncio.sleep(max(delay, 0))
+            return
+
+        try:
+            await asyncio.wait_for(ready, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if writable:
+                loop.remove_writer(fd)
+            else:
+                loop.remove_reader(fd)
+
+    @async_locked
+    async def transmit(self, message: bytes):
+        """
+        Writes data to the serial line, yielding to the event loop whenever the port is busy
+        The message is wrapped in a frame if the line has a codec.
+
+        :param message: The raw data to be written to the serial port
+        :type message: bytes
+        :return: The number of bytes written
+        :rtype: int
+        """
+        await self._ensure_open()
+        if self.codec is not None:
+            message = self.codec.encode(message)
+        view = memoryview(message)
+        written = 0
+        while written < len(view):
+            n = self._line.write(view[written:])
+            written += n or 0
+            if written < len(view):
+                await self._wait_for(writable=True, timeout=self.timeout)
+        return written
+
+    @async_locked
+    async def receive(self):
+        """
+        Reads data from the serial line until a terminator (or a whole frame) is received
+
+        :return: The data received from the line (a frame's payload if the line has a codec)
+        :rtype: bytes
+        """
+        if self.codec is not None:
+            return await self._read_frame(None)
+        return await self._read_until(b"\n", None)  # default terminator is linefeed (LF) char
+
+    @async_locked
+    async def receive_until(
+        self, terminator: bytes = b"\n", deadline: Union[int, float] = None
+    ):
+        """
+        Reads data from the serial line until a terminator is received or a deadline passes
+
+        :param terminator: (optional) The byte sequence that ends a message, defaults to LF
+        :type terminator: bytes
+        :param deadline: (optional) The time.monotonic() value at which to give up waiting,
+                         defaults to the line timeout from now
+        :type deadline: Union[int, float]
+        :return: The data received from the line, including the terminator if one was found
+        :rtype: bytes
+        """
+        return await self._read_until(terminator, deadline)
+
+    async def _read_until(self, terminator: bytes, deadline: Union[int, float, None]) -> bytes:
+        """
+        Reads data into the internal buffer until a terminator is found or a deadline passes
+        Like pySerial's read_until(), whatever has been received is returned on timeout.
+
+        :param terminator: The byte sequence that ends a message
+        :type terminator: bytes
+        :param deadline: The time.monotonic() value at which to give up waiting (or None)
+        :type deadline: Union[int, float, None]
+        :return: The data received from the line
+        :rtype: bytes
+        """
+        await self._ensure_open()
+        if deadline is None and self.timeout is not None:
+            deadline = monotonic() + self.timeout
+
+        searched = 0  # avoids rescanning the start of the buffer on every chunk
+        while True:
+            index = self._buffer.find(terminator, searched)
+            if index >= 0:
+                end = index + len(terminator)
+                message = bytes(self._buffer[:end])
+                del self._buffer[:end]
+                return message
+            searched = max(0, len(self._buffer) - len(terminator) + 1)
+
+            chunk = self._line.read(self.READ_CHUNK)
+            if chunk:
+                self._buffer += chunk
+                continue
+
+            remaining = None if deadline is None else deadline - monotonic()
+            if remaining is not None and remaining <= 0:
+                message = bytes(self._buffer)
+                self._buffer.clear()
+                return message
+            await self._wait_for(writable=False, timeout=remaining)
+
+    async def _read_frame(self, deadline: Union[int, float, None]) -> bytes:
+        """
+        Feeds data from the line into the codec until it produces a frame or a deadline passes
+
+        :param deadline: The time.monotonic() value at which to give up waiting (or None)
+        :type deadline: Union[int, float, None]
+        :return: The payload of the next frame, or an empty bytes object on timeout
+        :rtype: bytes
+        """
+        await self._ensure_open()
+        if deadline is None and self.timeout is not None:
+            deadline = monotonic() + self.timeout
+
+        while not self._frames:
+            chunk = self._line.read(self.READ_CHUNK)
+            if chunk:
+                self._frames.extend(self.codec.decode(chunk))
+                continue
+            remaining = None if deadline is None else deadline - monotonic()
+            if remaining is not None and remaining <= 0:
+                return b""
+            await self._wait_for(writable=False, timeout=remaining)
+        return self._frames.popleft()
+
+    def __del__(self):
+        """
+        Cleans up the Serial instance before finalizing the deletion of this AsyncSerialLine
+        """
         if self._line.is_open:
             self._line.close()
 
@@ -0,0 +1,453 @@
+# emulator.py
+# Contains the McuEmulator, which pretends to be the MCU on the far end of a pseudo-terminal (or
+# a loopback socket) so that the serial stack can be exercised (and benchmarked) without any
+# hardware attached
+#
+# Usage: python -m testdata.emulator --telemetry-rate 10 --latency 0.01
+#        python -m testdata.emulator --listen tcp://127.0.0.1:52001
+#        (prints the port to point ATMOS at, then runs until interrupted)
+
+import argparse
+import math
+import os
+import random
+import select
+import socket
+import threading
+import tty
+from collections import deque
+from time import monotonic, sleep
+from typing import Union
+
+from .connections import ACK, ENQ
+from .framing import make_codec
+from .sockets import parse_url
+
+# Synthetic telemetry channels: name -> value at time t (seconds since the emulator started)
+DEFAULT_CHANNELS = {
+    "bus_voltage": lambda t: 7.4 + 0.2 * math.sin(t / 30),
+    "bus_current": lambda t: 0.5 + 0.1 * math.sin(t / 3),
+    "board_temp": lambda t: 20 + 5 * math.sin(t / 300),
+}
+
+
+class McuEmulator:
+    """
+    Emulates the MCU end of a serial line on a pseudo-terminal (Linux/macOS only), or the radio
+    software end of a socket link when given a URL to listen on
+    - Answers the readiness probe (a read consisting only of ENQ bytes) with ACK
+    - Echoes every command (line or frame) it receives
+    - Optionally acknowledges scheduled commands ("CMD <id> ...") with "ACK <id>"
+    - Streams "t=<time>,<channel>=<value>,..." telemetry at a configurable rate
+    - Injects latency, dropped bytes and bit flips into everything it sends
+    """
+
+    def __init__(self, **options):
+        """
+        Initializes a new McuEmulator instance
+
+        :param listen: (optional) A socket URL to serve on instead of a pseudo-terminal (see
+                       sockets.parse_url), e.g. "tcp://127.0.0.1:0" for any free port
+        :param framing: (optional) The frame codec to speak (see framing.make_codec)
+        :param echo: (optional) Whether to echo commands back, defaults to True
+        :param ack: (optional) Whether to acknowledge "CMD <id> ..." commands (see
+                    mops.scheduler), defaults to False
+        :param telemetry_rate: (optional) Telemetry frames per second, defaults to 0 (off)
+        :param channels: (optional) The telemetry channels, defaults to DEFAULT_CHANNELS
+        :param baud: (optional) Paces output as a real line of this baud rate would (8N1)
+        :param latency: (optional) Seconds added before anything is sent, defaults to 0
+        :param drop_rate: (optional) The probability of dropping each byte sent, defaults to 0
+        :param bitflip_rate: (optional) The probability of flipping a bit in each byte sent
+        :param seed: (optional) Seeds the fault injection so that runs are reproducible
+        """
+        self.listen = options.get("listen", None)
+        self.framing = options.get("framing", None)
+        self.echo = options.get("echo", True)
+        self.ack = options.get("ack", False)
+        self.telemetry_rate = options.get("telemetry_rate", 0)
+        self.channels = options.get("channels", DEFAULT_CHANNELS)
+        self.baud = options.get("baud", None)
+        self.latency = options.get("latency", 0)
+        self.drop_rate = options.get("drop_rate", 0)
+        self.bitflip_rate = options.get("bitflip_rate", 0)
+        self._random = random.Random(options.get("seed", None))
+
+        self.port = None  # the path of the emulated serial port, or the URL served (once started)
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.bytes_dropped = 0
+        self.bits_flipped = 0
+        self.handshakes = 0
+        self.commands = 0
+        self.acks = 0
+        self.telemetry_frames = 0
+        self.connections = 0  # how many socket connections were accepted
+
+        self._codecs = {}  # peer: the codec decoding its commands (when framing)
+        self._partials = {}  # peer: its unterminated command (when not framing)
+        self._codec = make_codec(self.framing)  # encodes everything sent
+        self._outgoing = deque()  # [time due, data, peer] waiting to be written
+        self._line_free = 0  # when the emulated line finishes sending queued data
+        self._master = None
+        self._slave = None
+        self._server = None  # the listening (or, for UDP, the only) socket
+        self.scheme = None  # the socket URL's scheme (when listening)
+        self.address = None  # the address being served (when listening)
+        self._peers = []  # the pty's master fd, the connected sockets or the UDP peer addresses
+        self._thread = None
+        self._stop = threading.Event()
+        self._started = 0
+
+    def start(self) -> str:
+        """
+        Creates the pseudo-terminal pair (or starts listening) and starts emulating
+
+        :return: The path of the emulated serial port, or the URL to connect to
+        :rtype: str
+        """
+        if self.listen is None:
+            self._master, self._slave = os.openpty()
+            tty.setraw(self._slave)  # no echo or line discipline: a plain byte pipe like a UART
+            os.set_blocking(self._master, False)
+            self.port = os.ttyname(self._slave)
+            self._peers = [self._master]
+        else:
+            self._serve()
+        self._started = monotonic()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="McuEmulator", daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self) -> None:
+        """
+        Stops emulating and closes the pseudo-terminal pair
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if self._server is None:
+            os.close(self._master)
+            os.close(self._slave)
+            return
+        for peer in self._peers:
+            if isinstance(peer, socket.socket):
+                peer.close()
+        self._peers = []
+        self._server.close()
+        self._server = None
+        if self.scheme == "unix":
+            os.unlink(self.address)
+
+    def _serve(self) -> None:
+        """
+        Opens the socket that ATMOS connects to (see listen)
+        """
+        self.scheme, address = parse_url(self.listen)
+        if self.scheme == "unix":
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            if os.path.exists(address):
+                os.unlink(address)  # left behind by an emulator that didn't stop cleanly
+        else:
+            kind = socket.SOCK_DGRAM if self.scheme == "udp" else socket.SOCK_STREAM
+            family, kind, proto, _, address = socket.getaddrinfo(*address, type=kind)[0]
+            server = socket.socket(family, kind, proto)
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(address)
+        if self.scheme != "udp":
+            server.listen()
+        server.setblocking(False)
+        self._server = server
+        self.address = server.getsockname()
+        if self.scheme == "unix":
+            self.port = f"unix://{self.address}"
+        else:
+            host = f"[{self.address[0]}]" if ":" in self.address[0] else self.address[0]
+            self.port = f"{self.scheme}://{host}:{self.address[1]}"
+        self._peers = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def send(self, data: bytes, peer=None) -> None:
+        """
+        Queues raw data to be sent to ATMOS (subject to the configured faults)
+
+        :param data: The data to send
+        :type data: bytes
+        :param peer: (optional) The connection to send it on, defaults to every connection
+        :type peer: Union[int, socket.socket, tuple, str]
+        """
+        now = monotonic()
+        due = max(now + self.latency, self._line_free)
+        if self.baud:
+            self._line_free = due + len(data) * 10 / self.baud  # 8N1: 10 bits per byte
+        for peer in self._peers if peer is None else [peer]:
+            self._outgoing.append([due, self._corrupt(data), peer])
+
+    def _corrupt(self, data: bytes) -> bytearray:
+        """
+        Applies the configured byte drops and bit flips
+
+        :param data: The data to be sent
+        :type data: bytes
+        :return: The data as it will arrive at the other end
+        :rtype: bytearray
+        """
+        if not self.drop_rate and not self.bitflip_rate:
+            return bytearray(data)
+        out = bytearray()
+        for byte in data:
+            if self._random.random() < self.drop_rate:
+                self.bytes_dropped += 1
+                continue
+            if self._random.random() < self.bitflip_rate:
+                byte ^= 1 << self._random.randrange(8)
+                self.bits_flipped += 1
+            out.append(byte)
+        return out
+
+    def _frame(self, payload: bytes) -> bytes:
+        """
+        :param payload: A message to send
+        :type payload: bytes
+        :return: The message framed as the emulator's framing requires
+        :rtype: bytes
+        """
+        return self._codec.encode(payload) if self._codec is not None else payload + b"\n"
+
+    def _handle(self, data: bytes, peer) -> None:
+        """
+        Reacts to data received from ATMOS
+
+        :param data: The data that was read
+        :type data: bytes
+        :param peer: The connection that it was read from
+        :type peer: Union[int, socket.socket, tuple, str]
+        """
+        self.bytes_received += len(data)
+        if data.strip(ENQ) == b"":
+            self.handshakes += 1
+            self.send(ACK * len(data), peer)
+            return
+
+        if self.framing is not None:
+            codec = self._codecs.get(peer)
+            if codec is None:
+                codec = self._codecs[peer] = make_codec(self.framing)
+            commands = codec.decode(data)
+        else:
+            partial = self._partials.get(peer, b"") + data
+            *commands, rest = partial.split(b"\n")
+            self._partials[peer] = rest
+        for command in commands:
+            self.commands += 1
+            if self.echo:
+                self.send(self._frame(bytes(command)), peer)
+            if self.ack and command.startswith(b"CMD "):
+                self.acks += 1
+                self.send(self._frame(b"ACK " + bytes(command[4:]).split(b" ", 1)[0]), peer)
+
+    def _read(self, ready) -> None:
+        """
+        Receives whatever is waiting on a readable pty, socket or listening socket
+
+        :param ready: The pty's master fd or a socket that select() found readable
+        :type ready: Union[int, socket.socket]
+        """
+        try:
+            if ready is self._master:
+                data, peer = os.read(self._master, 4096), self._master
+            elif ready is self._server and self.scheme == "udp":
+                data, peer = self._server.recvfrom(65536)
+                if peer not in self._peers:
+                    self._peers.append(peer)  # telemetry goes to everyone who has been heard from
+            elif ready is self._server:
+                peer, _ = self._server.accept()
+                peer.setblocking(False)
+                self._peers.append(peer)
+                self.connections += 1
+                return
+            else:
+                data, peer = ready.recv(4096), ready
+                if not data:  # ATMOS hung up
+                    self._disconnect(ready)
+                    return
+        except (BlockingIOError, OSError):
+            return
+        if data:
+            self._handle(data, peer)
+
+    def _disconnect(self, peer: socket.socket) -> None:
+        """
+        Forgets a connection that ATMOS has closed (along with anything queued for it)
+
+        :param peer: The connected socket
+        :type peer: socket.socket
+        """
+        peer.close()
+        self._peers.remove(peer)
+        self._codecs.pop(peer, None)
+        self._partials.pop(peer, None)
+        self._outgoing = deque(entry for entry in self._outgoing if entry[2] is not peer)
+
+    def _write(self, data: bytearray, peer) -> int:
+        """
+        Writes queued data to a peer without blocking
+
+        :param data: The data to write
+        :type data: bytearray
+        :param peer: The connection to write it on
+        :type peer: Union[int, socket.socket, tuple, str]
+        :return: The number of bytes written
+        :rtype: int
+        """
+        if peer is self._master:
+            return os.write(self._master, data)
+        if self.scheme == "udp":
+            try:
+                return self._server.sendto(data, peer)
+            except OSError:  # nobody is listening at that address any more
+                return len(data)
+        return peer.send(data)
+
+    def _telemetry(self, t: float) -> bytes:
+        """
+        :param t: Seconds since the emulator started
+        :type t: float
+        :return: One telemetry frame sampling every channel at time t
+        :rtype: bytes
+        """
+        fields = [f"t={t:.3f}"]
+        fields += [f"{name}={func(t):.4f}" for name, func in self.channels.items()]
+        return self._frame(",".join(fields).encode())
+
+    def _run(self) -> None:
+        """
+        Body of the emulator thread
+        """
+        period = 1 / self.telemetry_rate if self.telemetry_rate else None
+        next_frame = monotonic()
+        while not self._stop.is_set():
+            now = monotonic()
+            wake = [now + 0.05]
+            if period is not None:
+                wake.append(next_frame)
+            if self._outgoing:
+                wake.append(self._outgoing[0][0])
+            if self._server is None:
+                watching = [self._master]
+            elif self.scheme == "udp":
+                watching = [self._server]
+            else:
+                watching = [self._server] + self._peers
+
+            readable, _, _ = select.select(watching, [], [], max(0, min(wake) - now))
+            for ready in readable:
+                self._read(ready)
+
+            now = monotonic()
+            if period is not None and now >= next_frame:
+                self.telemetry_frames += 1
+                self.send(self._telemetry(now - self._started))
+                next_frame = max(next_frame + period, now - period)  # don't burst to catch up
+
+            while self._outgoing and self._outgoing[0][0] <= now:
+                entry = self._outgoing[0]
+                try:
+                    written = self._write(entry[1], entry[2])
+                except BlockingIOError:
+                    break  # ATMOS isn't reading: hold the data like a UART FIFO would
+                except OSError:  # the connection went away
+                    self._outgoing.popleft()
+                    continue
+                self.bytes_sent += written
+                del entry[1][:written]
+                if entry[1]:
+                    break
+                self._outgoing.popleft()
+
+
+def benchmark(line, count: int = 1000, size: int = 32) -> dict:
+    """
+    Measures echo round trips through a line connected to an echoing McuEmulator
+
+    :param line: An open Transport (or anything with transmit/receive) on the emulator's port
+    :type line: Transport
+    :param count: (optional) The number of round trips to make, defaults to 1000
+    :type count: int
+    :param size: (optional) The size of each message in bytes, defaults to 32
+    :type size: int
+    :return: The number of round trips, lost messages, elapsed time and throughput
+    :rtype: dict
+    """
+    message = bytes(ord("a") + i % 26 for i in range(size))
+    if line.codec is None:
+        message = message[:-1] + b"\n"
+    lost = 0
+    start = monotonic()
+    for _ in range(count):
+        line.transmit(message)
+        if line.receive() != message:
+            lost += 1
+    elapsed = monotonic() - start
+    return {
+        "round_trips": count,
+        "lost": lost,
+        "seconds": elapsed,
+        "round_trips_per_second": count / elapsed if elapsed else float("inf"),
+        "bytes_per_second": 2 * count * size / elapsed if elapsed else float("inf"),
+    }
+
+
+def _main(argv: Union[list, None] = None) -> None:
+    """
+    Runs an emulator from the command line until interrupted
+    """
+    parser = argparse.ArgumentParser(description="Emulate an ATMOS MCU on a pseudo-terminal")
+    parser.add_argument("--listen", default=None, help="serve on a socket URL instead")
+    parser.add_argument("--framing", default=None, help="frame codec, e.g. cobs-crc16")
+    parser.add_argument("--no-echo", action="store_true", help="don't echo commands")
+    parser.add_argument("--ack", action="store_true", help='acknowledge "CMD <id>" commands')
+    parser.add_argument("--telemetry-rate", type=float, default=0, help="frames per second")
+    parser.add_argument("--baud", type=int, default=None, help="pace output at this rate")
+    parser.add_argument("--latency", type=float, default=0, help="seconds of added latency")
+    parser.add_argument("--drop-rate", type=float, default=0, help="per-byte drop chance")
+    parser.add_argument("--bitflip-rate", type=float, default=0, help="per-byte flip chance")
+    parser.add_argument("--seed", type=int, default=None, help="fault injection seed")
+    args = parser.parse_args(argv)
+
+    emulator = McuEmulator(
+        listen=args.listen,
+        framing=args.framing,
+        echo=not args.no_echo,
+        ack=args.ack,
+        telemetry_rate=args.telemetry_rate,
+        baud=args.baud,
+        latency=args.latency,
+        drop_rate=args.drop_rate,
+        bitflip_rate=args.bitflip_rate,
+        seed=args.seed,
+    )
+    with emulator:
+        print(f"Emulating MCU on {emulator.port} (Ctrl+C to stop)")
+        try:
+            while True:
+                sleep(1)
+        except KeyboardInterrupt:
+            pass
+    print(
+        f"received={emulator.bytes_received} sent={emulator.bytes_sent} "
+        f"dropped={emulator.bytes_dropped} flipped={emulator.bits_flipped} "
+        f"handshakes={emulator.handshakes} commands={emulator.commands}"
+    )
+
+
+if __name__ == "__main__":
+    _main()
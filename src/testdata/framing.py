@@ -0,0 +1,349 @@
+# framing.py
+# Contains frame codecs that delimit messages on a byte stream (e.g. a SerialLine) so that
+# binary payloads can be sent as-is instead of being text-encoded around a LF terminator
+
+import struct
+import zlib
+from abc import ABC, abstractmethod
+from typing import List, Union
+
+
+def _crc16_table() -> List[int]:
+    """
+    Builds the lookup table for CRC-16/CCITT-FALSE (poly 0x1021, MSB first)
+
+    :return: The 256 precomputed CRC values, one per possible leading byte
+    :rtype: List[int]
+    """
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xFFFF)
+    return table
+
+
+_CRC16_TABLE = _crc16_table()
+
+
+def crc16(data, crc: int = 0xFFFF) -> int:
+    """
+    Computes a table-driven CRC-16/CCITT-FALSE checksum
+
+    :param data: The data to checksum (any bytes-like object)
+    :type data: Union[bytes, bytearray, memoryview]
+    :param crc: (optional) The running checksum to continue from
+    :type crc: int
+    :return: The 16-bit checksum
+    :rtype: int
+    """
+    table = _CRC16_TABLE
+    for byte in memoryview(data).cast("B"):
+        crc = ((crc << 8) & 0xFF00) ^ table[(crc >> 8) ^ byte]
+    return crc
+
+
+def crc32(data, crc: int = 0) -> int:
+    """
+    Computes a CRC-32 (IEEE 802.3) checksum
+    zlib's implementation is table-driven C code, so there is no reason to duplicate it here.
+
+    :param data: The data to checksum (any bytes-like object)
+    :type data: Union[bytes, bytearray, memoryview]
+    :param crc: (optional) The running checksum to continue from
+    :type crc: int
+    :return: The 32-bit checksum
+    :rtype: int
+    """
+    return zlib.crc32(data, crc)
+
+
+# name: (checksum size in bytes, struct format, checksum function)
+CHECKSUMS = {
+    "crc16": (2, ">H", crc16),
+    "crc32": (4, ">I", crc32),
+}
+
+
+class FrameCodec(ABC):
+    """
+    Provides an interface for encoding messages into frames and incrementally decoding frames
+    out of a byte stream that may arrive in arbitrary pieces
+    """
+
+    def __init__(self, checksum: str = None):
+        """
+        :param checksum: (optional) The name of a checksum in CHECKSUMS to append to each frame
+        :type checksum: str
+        """
+        if checksum is not None and checksum not in CHECKSUMS:
+            raise ValueError(f"Unknown checksum '{checksum}'")
+        self.checksum = checksum
+        self.errors = 0  # how many corrupt frames have been discarded
+        self._buffer = bytearray()  # undecoded bytes
+        self._start = 0  # offset of the first undecoded byte in the buffer
+
+    def _append_checksum(self, payload: bytes) -> bytes:
+        """
+        :param payload: The message to be protected
+        :type payload: bytes
+        :return: The message with its checksum appended (if a checksum is configured)
+        :rtype: bytes
+        """
+        if self.checksum is None:
+            return payload
+        _, fmt, func = CHECKSUMS[self.checksum]
+        return payload + struct.pack(fmt, func(payload))
+
+    def _strip_checksum(self, body: memoryview) -> Union[memoryview, None]:
+        """
+        :param body: A decoded frame body, including its checksum (if one is configured)
+        :type body: memoryview
+        :return: The payload if the checksum matches, otherwise None
+        :rtype: Union[memoryview, None]
+        """
+        if self.checksum is None:
+            return body
+        size, fmt, func = CHECKSUMS[self.checksum]
+        if len(body) < size:
+            return None
+        payload = body[: len(body) - size]
+        (expected,) = struct.unpack_from(fmt, body, len(body) - size)
+        return payload if func(payload) == expected else None
+
+    def decode(self, data=b"") -> List[bytes]:
+        """
+        Adds newly-received data to the decoder and returns every frame it completes
+        Partial frames are kept until the rest of their data arrives.
+
+        :param data: (optional) The data most recently read from the stream
+        :type data: Union[bytes, bytearray, memoryview]
+        :return: The payloads of all complete frames, in order
+        :rtype: List[bytes]
+        """
+        if self._start and self._start >= len(self._buffer) // 2:
+            del self._buffer[: self._start]  # compact only occasionally
+            self._start = 0
+        self._buffer += data
+
+        frames = []
+        with memoryview(self._buffer) as view:
+            self._start = self._decode(view, self._start, frames)
+        return frames
+
+    def reset(self) -> None:
+        """
+        Discards any partially-received frame
+        """
+        self._buffer.clear()
+        self._start = 0
+
+    @property
+    def pending(self) -> int:
+        """
+        :return: The number of received bytes that are not yet part of a complete frame
+        :rtype: int
+        """
+        return len(self._buffer) - self._start
+
+    @abstractmethod
+    def encode(self, payload: bytes) -> bytes:
+        """
+        Wraps a message in a frame
+
+        :param payload: The message to be framed
+        :type payload: bytes
+        :return: The framed message, ready to be written to the stream
+        :rtype: bytes
+        """
+        pass
+
+    @abstractmethod
+    def _decode(self, view: memoryview, start: int, frames: list) -> int:
+        """
+        Decodes as many complete frames as possible from the buffer
+
+        :param view: A view of the decoder's whole buffer
+        :type view: memoryview
+        :param start: The offset of the first undecoded byte
+        :type start: int
+        :param frames: The list that decoded payloads are appended to
+        :type frames: list
+        :return: The offset of the first byte that is still undecoded
+        :rtype: int
+        """
+        pass
+
+
+class LineCodec(FrameCodec):
+    """
+    Delimits frames with a terminator (LF by default), like SerialLine's unframed behaviour
+    Payloads must not contain the terminator (encode raises ValueError). There is no checksum
+    option, as a binary checksum could contain the terminator itself and split the frame.
+    """
+
+    def __init__(self, terminator: bytes = b"\n", checksum: str = None):
+        if checksum is not None:
+            raise ValueError("Line framing can't carry a checksum (use cobs or length framing)")
+        super().__init__(checksum)
+        self.terminator = terminator
+
+    def encode(self, payload: bytes) -> bytes:
+        payload = bytes(payload)
+        if self.terminator in payload:
+            raise ValueError(f"Payloads can't contain the terminator {self.terminator!r}")
+        return payload + self.terminator
+
+    def _decode(self, view: memoryview, start: int, frames: list) -> int:
+        buffer = self._buffer
+        while True:
+            end = buffer.find(self.terminator, start)
+            if end < 0:
+                return start
+            frames.append(bytes(view[start:end]))
+            start = end + len(self.terminator)
+
+
+class CobsCodec(FrameCodec):
+    """
+    Consistent Overhead Byte Stuffing: removes every 0x00 from the payload (at a cost of at most
+    one byte per 254) so that 0x00 can delimit frames
+    """
+
+    def encode(self, payload: bytes) -> bytes:
+        data = self._append_checksum(bytes(payload))
+        out = bytearray()
+        start = 0
+        while True:
+            end = data.find(b"\x00", start)
+            last = end < 0
+            if last:
+                end = len(data)
+            # split runs of more than 254 non-zero bytes into maximal blocks
+            while end - start >= 0xFE:
+                out.append(0xFF)
+                out += data[start : start + 0xFE]
+                start += 0xFE
+            out.append(end - start + 1)
+            out += data[start:end]
+            if last:
+                break
+            start = end + 1
+        out.append(0)
+        return bytes(out)
+
+    def _decode(self, view: memoryview, start: int, frames: list) -> int:
+        buffer = self._buffer
+        while True:
+            end = buffer.find(b"\x00", start)
+            if end < 0:
+                return start
+            if end > start:  # back-to-back delimiters are just idle line fill
+                body = self._unstuff(view[start:end])
+                payload = None if body is None else self._strip_checksum(memoryview(body))
+                if payload is None:
+                    self.errors += 1
+                else:
+                    frames.append(bytes(payload))
+            start = end + 1
+
+    @staticmethod
+    def _unstuff(block: memoryview) -> Union[bytearray, None]:
+        """
+        Reverses COBS encoding for a single frame (without its delimiter)
+
+        :param block: The encoded frame
+        :type block: memoryview
+        :return: The decoded frame body, or None if the frame is malformed
+        :rtype: Union[bytearray, None]
+        """
+        out = bytearray()
+        index = 0
+        length = len(block)
+        while index < length:
+            code = block[index]
+            if code == 0 or index + code > length:
+                return None  # a stray delimiter or a truncated block
+            out += block[index + 1 : index + code]
+            index += code
+            if code < 0xFF and index < length:
+                out.append(0)
+        return out
+
+
+class LengthPrefixCodec(FrameCodec):
+    """
+    Frames each message as SYNC | LENGTH | PAYLOAD | CHECKSUM
+    The sync word lets the decoder find the next frame after corruption, and the checksum
+    (CRC-16 by default) rejects frames that were damaged in transit.
+    """
+
+    def __init__(
+        self,
+        checksum: str = "crc16",
+        sync: bytes = b"\xa5\x5a",
+        max_length: int = 0xFFFF,
+    ):
+        super().__init__(checksum)
+        self.sync = sync
+        self.max_length = max_length
+
+    def encode(self, payload: bytes) -> bytes:
+        if len(payload) > self.max_length:
+            raise ValueError(
+                f"Payload of {len(payload)} bytes exceeds the {self.max_length} byte limit"
+            )
+        return self.sync + struct.pack(">H", len(payload)) + self._append_checksum(payload)
+
+    def _decode(self, view: memoryview, start: int, frames: list) -> int:
+        buffer = self._buffer
+        header = len(self.sync) + 2
+        trailer = CHECKSUMS[self.checksum][0] if self.checksum is not None else 0
+        while True:
+            found = buffer.find(self.sync, start)
+            if found < 0:
+                # keep a possible partial sync word at the very end of the buffer
+                return max(start, len(buffer) - len(self.sync) + 1)
+            start = found
+            if len(buffer) - start < header:
+                return start
+            (length,) = struct.unpack_from(">H", buffer, start + len(self.sync))
+            if length > self.max_length:
+                self.errors += 1
+                start += 1  # not a real frame: resynchronize
+                continue
+            end = start + header + length + trailer
+            if len(buffer) < end:
+                return start
+            payload = self._strip_checksum(view[start + header : end])
+            if payload is None:
+                self.errors += 1
+                start += 1  # the sync word may have been payload data: resynchronize
+                continue
+            frames.append(bytes(payload))
+            start = end
+
+
+def make_codec(framing: str) -> Union[FrameCodec, None]:
+    """
+    Builds a frame codec from a short description such as "cobs", "cobs-crc16" or "length-crc32"
+
+    :param framing: The codec name ("line", "cobs" or "length"), optionally followed by a dash
+                    and the name of a checksum in CHECKSUMS (not for "line"); None for an
+                    unframed line
+    :type framing: str
+    :return: A new codec instance (or None if framing is None)
+    :rtype: Union[FrameCodec, None]
+    """
+    if framing is None:
+        return None
+    name, _, checksum = framing.partition("-")
+    checksum = checksum or None
+    if name == "line":
+        return LineCodec(checksum=checksum)
+    if name == "cobs":
+        return CobsCodec(checksum=checksum)
+    if name == "length":
+        return LengthPrefixCodec(checksum=checksum or "crc16")
+    raise ValueError(f"Unknown framing '{framing}'")
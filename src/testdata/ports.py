@@ -0,0 +1,298 @@
+# ports.py
+# Contains the PortManager, which shares serial lines (or sockets) between Test instances so that
+# several tests can interleave commands on one physical link without reopening it
+
+import threading
+from contextlib import contextmanager
+from time import monotonic
+from typing import Union
+
+from .connections import SerialLock, Transport, locked
+from .sockets import make_transport
+
+
+class FairLock:
+    """
+    A re-entrant lock that is granted in the order it was requested (first come, first served)
+    so that no channel sharing a line can be starved by a busier one
+    """
+
+    def __init__(self):
+        """
+        Initializes a new FairLock instance
+        """
+        self._condition = threading.Condition()
+        self._next_ticket = 0  # the ticket handed to the next thread that asks for the lock
+        self._serving = 0  # the ticket that currently holds (or may take) the lock
+        self._owner = None  # the thread that holds the lock
+        self._depth = 0  # how many times the owner has acquired the lock
+
+    def acquire(self) -> None:
+        """
+        Blocks until it is the calling thread's turn to hold the lock
+        """
+        me = threading.get_ident()
+        with self._condition:
+            if self._owner == me:
+                self._depth += 1
+                return
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            while self._serving != ticket:
+                self._condition.wait()
+            self._owner = me
+            self._depth = 1
+
+    def release(self) -> None:
+        """
+        Releases the lock and hands it to the next thread in line
+        """
+        with self._condition:
+            self._depth -= 1
+            if self._depth == 0:
+                self._owner = None
+                self._serving += 1
+                self._condition.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class _SharedPort:
+    """
+    Bookkeeping for one line (any Transport) that is shared by several leases
+    """
+
+    def __init__(self, line: Transport):
+        self.line = line
+        self.arbiter = FairLock()  # serializes access to the line between leases
+        self.leases = 0  # how many channels hold this line
+
+
+class SerialChannel:
+    """
+    A leased handle on a shared SerialLine (or other Transport)
+    A channel has the same interface as a SerialLine, but closing it leaves the physical line
+    open for the other leases. The line is closed when its last lease is released.
+    """
+
+    def __init__(self, manager, key: tuple, shared: _SharedPort, name: str):
+        """
+        Initializes a new SerialChannel instance (use PortManager.lease() instead)
+        """
+        self.name = name
+        self.port, self.baud, self.framing = key
+        self.lock = SerialLock()  # a per-lease lock, independent of the other leases
+        self.key = f"{monotonic()}"
+        self._manager = manager
+        self._pool_key = key
+        self._shared = shared
+        self._released = False
+
+    @property
+    def line(self) -> Transport:
+        """
+        :return: The shared line behind this channel
+        :rtype: Transport
+        """
+        return self._shared.line
+
+    @property
+    def timeout(self) -> Union[int, float]:
+        """
+        :return: The read timeout of the shared line in seconds
+        :rtype: Union[int, float]
+        """
+        return self._shared.line.timeout
+
+    def open(self):
+        """
+        Opens the shared serial line (if no other lease has opened it already)
+        If another lease opened it but the MCU didn't answer then, the probe is tried again.
+        """
+        with self._shared.arbiter:
+            line = self._shared.line
+            if not line.is_open:
+                line.open()
+            elif not line.ready and line.ready_probe is not None:
+                line.ready = line.probe()
+
+    @property
+    def ready(self) -> bool:
+        """
+        :return: Whether the MCU answered the readiness probe when the shared line was opened
+        :rtype: bool
+        """
+        return self._shared.line.ready
+
+    def close(self):
+        """
+        Ends this channel's use of the line; the line itself stays open for the other leases
+        """
+        with self._shared.arbiter:
+            if self._shared.line.is_open:
+                self._shared.line.flush()
+
+    @property
+    def is_open(self):
+        """
+        Determines whether the shared serial line is currently open
+
+        :return: True if the line is open, False otherwise
+        :rtype: bool
+        """
+        return self._shared.line.is_open
+
+    def probe(self, timeout: Union[int, float] = None) -> bool:
+        """
+        Checks that the MCU answers the shared line's readiness probe (see SerialLine.probe)
+        """
+        with self._shared.arbiter:
+            return self._shared.line.probe(timeout)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Holds the line for this channel across several calls, e.g. so that a command and its
+        reply are not interleaved with another lease's traffic
+
+        Usage:
+            with channel.transaction():
+                channel.transmit(command)
+                reply = channel.receive()
+        """
+        with self._shared.arbiter:
+            yield self
+
+    @locked
+    def transmit(self, message: bytes):
+        """
+        Writes data to the shared serial line (see SerialLine.transmit)
+        """
+        with self._shared.arbiter:
+            return self._shared.line.transmit(message)
+
+    @locked
+    def transmit_many(self, messages):
+        """
+        Writes several messages to the shared serial line at once (see SerialLine.transmit_many)
+        """
+        with self._shared.arbiter:
+            return self._shared.line.transmit_many(messages)
+
+    @locked
+    def receive(self, timeout: Union[int, float] = None):
+        """
+        Reads data from the shared serial line (see SerialLine.receive)
+        """
+        with self._shared.arbiter:
+            return self._shared.line.receive(timeout)
+
+    @locked
+    def receive_into(self, buffer, timeout: Union[int, float] = None):
+        """
+        Reads data from the shared serial line into a buffer (see SerialLine.receive_into)
+        """
+        with self._shared.arbiter:
+            return self._shared.line.receive_into(buffer, timeout)
+
+    def release(self) -> None:
+        """
+        Gives this lease back to the PortManager; the channel cannot be used afterwards
+        """
+        if not self._released:
+            self._released = True
+            self._manager.release(self)
+
+    def __del__(self):
+        """
+        Releases the lease before finalizing the deletion of this SerialChannel instance
+        """
+        if not getattr(self, "_released", True):
+            self.release()
+
+
+class PortManager:
+    """
+    Hands out leases on shared serial lines, keyed by (port, baud, framing)
+    A port can also be a socket URL such as "tcp://localhost:52001" (see sockets.make_transport),
+    so tests and Mission Ops can be pointed at radio software without any code changes.
+    IMPORTANT: This is a singleton class!
+    """
+
+    _instance = None
+
+    def __init__(self):
+        """
+        Initializes the PortManager instance
+        """
+        if PortManager._instance is not None:
+            raise Exception("PortManager instance already exists!")
+        PortManager._instance = self
+
+        self._ports = {}  # (port, baud, framing): _SharedPort
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def instance():
+        """
+        Static access method
+        """
+        if PortManager._instance is None:
+            PortManager()
+        return PortManager._instance
+
+    def lease(self, name: str, port: str, baud: int, framing: str = None, **options):
+        """
+        Leases a channel on a serial line, creating the line if nobody holds it yet
+        The options are only used when the line is created (see SerialLine and SocketTransport);
+        later leases share the line exactly as it was configured by the first one.
+
+        :param name: A name for the channel (e.g. the name of the test using it)
+        :type name: str
+        :param port: The serial port (or socket URL)
+        :type port: str
+        :param baud: The baud rate
+        :type baud: int
+        :param framing: (optional) The frame codec for the line (see framing.make_codec)
+        :type framing: str
+        :return: A new channel on the shared line
+        :rtype: SerialChannel
+        """
+        key = (port, baud, framing)
+        with self._lock:
+            shared = self._ports.get(key)
+            if shared is None:
+                line = make_transport(f"Shared-{port}", port, baud, framing=framing, **options)
+                shared = self._ports[key] = _SharedPort(line)
+            shared.leases += 1
+        return SerialChannel(self, key, shared, name)
+
+    def release(self, channel: SerialChannel) -> None:
+        """
+        Ends a lease, closing the shared line if it was the last one
+
+        :param channel: The channel whose lease has ended
+        :type channel: SerialChannel
+        """
+        with self._lock:
+            shared = self._ports.get(channel._pool_key)
+            if shared is None or shared is not channel._shared:
+                return
+            shared.leases -= 1
+            if shared.leases > 0:
+                return
+            del self._ports[channel._pool_key]
+        shared.line.close()
+
+    def leases(self) -> dict:
+        """
+        :return: The number of active leases for each shared line
+        :rtype: dict
+        """
+        with self._lock:
+            return {key: shared.leases for key, shared in self._ports.items()}
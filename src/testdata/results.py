@@ -0,0 +1,290 @@
+# results.py
+# Contains result sinks, which stream test records to disk as they are produced so that long
+# (e.g. soak) tests never have to hold their results in memory
+
+import json
+import mmap
+import os
+import struct
+from abc import ABC, abstractmethod
+from array import array
+from pathlib import Path
+from time import monotonic
+from typing import Union
+
+
+def _to_json(value):
+    """
+    Converts values that the json module cannot serialize on its own
+
+    :param value: The value to convert
+    :type value: Any
+    :return: A JSON-serializable equivalent
+    :rtype: Any
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # readable for text commands, unambiguous (escaped) for binary data
+        return bytes(value).decode("utf-8", errors="backslashreplace")
+    return str(value)
+
+
+def _to_number(value):
+    """
+    Converts NumPy scalars (and anything else with .item()) to plain Python values
+
+    :param value: The value to convert
+    :type value: Any
+    :return: The plain value
+    :rtype: Any
+    """
+    item = getattr(value, "item", None)
+    return item() if item is not None else value
+
+
+def _to_floats(column) -> array:
+    """
+    Converts a column of values to float64, mapping non-numeric values to NaN (as
+    NpyChannelSink.write does)
+
+    :param column: The values
+    :type column: Sequence
+    :return: The values as float64
+    :rtype: array
+    """
+    values = array("d")
+    try:  # contiguous float64 buffers (e.g. NumPy arrays) are copied in one go
+        view = memoryview(column)
+        if view.format != "d" or not view.c_contiguous:
+            raise TypeError
+        values.frombytes(view.cast("B"))
+    except TypeError:
+        for value in column:
+            value = _to_number(value)
+            values.append(value if isinstance(value, (int, float)) else float("nan"))
+    return values
+
+
+class ResultSink(ABC):
+    """
+    Provides an interface for destinations that test records are streamed to
+    """
+
+    @abstractmethod
+    def write(self, record: dict) -> None:
+        """
+        Adds a record to the sink (it may be buffered until the next flush)
+
+        :param record: The record to be written
+        :type record: dict
+        """
+        pass
+
+    def write_columns(self, columns: dict) -> None:
+        """
+        Adds a block of records given column by column, e.g. {"t": [0, 1], "soc": [1.0, 0.9]}
+        (sinks that store columns override this to skip building each record)
+
+        :param columns: Equal-length sequences of values, by field name
+        :type columns: dict
+        """
+        names = list(columns)
+        for row in zip(*(columns[name] for name in names)):
+            self.write(dict(zip(names, (_to_number(value) for value in row))))
+
+    @abstractmethod
+    def flush(self, sync: bool = False) -> None:
+        """
+        Writes any buffered records out to disk
+
+        :param sync: (optional) If True, also force the data onto the storage device
+        :type sync: bool
+        """
+        pass
+
+    @abstractmethod
+    def close(self) -> None:
+        """
+        Flushes and closes the sink
+        """
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JsonLinesSink(ResultSink):
+    """
+    Appends records to a JSON Lines file (one JSON object per line)
+    At most buffer_records records are held in memory, and the file is fsync'd at least every
+    fsync_interval seconds, so a crash loses very little of a long run.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        buffer_records: int = 256,
+        fsync_interval: Union[int, float] = 5,
+    ):
+        """
+        :param path: The file to append records to
+        :type path: Union[str, Path]
+        :param buffer_records: (optional) The number of records buffered between writes
+        :type buffer_records: int
+        :param fsync_interval: (optional) The maximum number of seconds between fsyncs
+        :type fsync_interval: Union[int, float]
+        """
+        self.path = Path(path)
+        self.buffer_records = buffer_records
+        self.fsync_interval = fsync_interval
+        self.records = 0  # how many records have been written in total
+        self._buffer = []
+        self._last_sync = monotonic()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def write(self, record: dict) -> None:
+        self._buffer.append(json.dumps(record, default=_to_json))
+        self.records += 1
+        if (
+            len(self._buffer) >= self.buffer_records
+            or monotonic() - self._last_sync >= self.fsync_interval
+        ):
+            self.flush()
+
+    def flush(self, sync: bool = False) -> None:
+        if self._file.closed:
+            return
+        if self._buffer:
+            self._file.write("\n".join(self._buffer) + "\n")
+            self._buffer.clear()
+        self._file.flush()
+        if sync or monotonic() - self._last_sync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_sync = monotonic()
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self.flush(sync=True)
+            self._file.close()
+
+
+class NpyChannelSink(ResultSink):
+    """
+    Writes each numeric field of the records to its own column file in NumPy's .npy format
+    (float64), so bulk numeric channels can be memory-mapped afterwards with
+    numpy.load(path, mmap_mode="r") or read_channel(path).
+    All columns share a row index: a channel missing from a record gets NaN for that row.
+    Non-numeric fields are ignored.
+    """
+
+    HEADER_SIZE = 128  # room to rewrite the shape in place as the file grows
+
+    def __init__(self, directory: Union[str, Path], buffer_rows: int = 4096):
+        """
+        :param directory: The directory to write <channel>.npy files to
+        :type directory: Union[str, Path]
+        :param buffer_rows: (optional) The number of rows buffered between writes
+        :type buffer_rows: int
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.buffer_rows = buffer_rows
+        self.rows = 0  # how many rows have been written in total
+        self._columns = {}  # channel name: [file, buffered values]
+        self._buffered = 0
+
+    def _column(self, name: str) -> list:
+        """
+        Opens the file for a channel, back-filling NaN for any rows written before it appeared
+
+        :param name: The channel name
+        :type name: str
+        :return: [file, buffered values] for the channel
+        :rtype: list
+        """
+        column = self._columns.get(name)
+        if column is None:
+            file = open(self.directory / f"{name}.npy", "w+b")
+            file.write(self._header(0))
+            array("d", [float("nan")] * (self.rows - self._buffered)).tofile(file)
+            column = self._columns[name] = [file, array("d", [float("nan")] * self._buffered)]
+        return column
+
+    def write(self, record: dict) -> None:
+        for name, value in record.items():
+            if isinstance(value, (int, float)) and name not in self._columns:
+                self._column(name)
+        for name, (_, values) in self._columns.items():
+            value = record.get(name)
+            values.append(value if isinstance(value, (int, float)) else float("nan"))
+        self.rows += 1
+        self._buffered += 1
+        if self._buffered >= self.buffer_rows:
+            self.flush()
+
+    def write_columns(self, columns: dict) -> None:
+        # convert every column before touching a buffer, so a bad block leaves the rows aligned
+        converted = {name: _to_floats(column) for name, column in columns.items()}
+        rows = len(next(iter(converted.values()), ()))
+        if any(len(column) != rows for column in converted.values()):
+            raise ValueError("All columns must have the same number of rows")
+        for name in converted:
+            if name not in self._columns:
+                self._column(name)
+        for name, (_, values) in self._columns.items():
+            column = converted.get(name)
+            values.extend(array("d", [float("nan")]) * rows if column is None else column)
+        self.rows += rows
+        self._buffered += rows
+        if self._buffered >= self.buffer_rows:
+            self.flush()
+
+    def flush(self, sync: bool = False) -> None:
+        for file, values in self._columns.values():
+            if file.closed:
+                continue
+            file.seek(0, os.SEEK_END)
+            values.tofile(file)
+            del values[:]
+            file.seek(0)
+            file.write(self._header(self.rows))  # keep the file loadable at all times
+            file.flush()
+            if sync:
+                os.fsync(file.fileno())
+        self._buffered = 0
+
+    def close(self) -> None:
+        self.flush(sync=True)
+        for file, _ in self._columns.values():
+            file.close()
+
+    @classmethod
+    def _header(cls, rows: int) -> bytes:
+        """
+        Builds a fixed-size .npy (version 1.0) header for a float64 column
+
+        :param rows: The number of values in the column
+        :type rows: int
+        :return: The header, padded to HEADER_SIZE bytes
+        :rtype: bytes
+        """
+        text = f"{{'descr': '<f8', 'fortran_order': False, 'shape': ({rows},), }}"
+        text = text.ljust(cls.HEADER_SIZE - 10 - 1) + "\n"
+        return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(text)) + text.encode("latin1")
+
+
+def read_channel(path: Union[str, Path]) -> memoryview:
+    """
+    Memory-maps a column written by NpyChannelSink without needing NumPy
+
+    :param path: The .npy file to read
+    :type path: Union[str, Path]
+    :return: A read-only view of the column's values (as Python floats)
+    :rtype: memoryview
+    """
+    with open(path, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    (header_size,) = struct.unpack_from("<H", mapped, 8)
+    return memoryview(mapped)[10 + header_size :].cast("d")
@@ -6,6 +6,8 @@ class SampleTest(Test):
     This is a sample test that is used for general debugging of ATMOS
     """
 
+    tags = ("debug",)
+
     def execute(self):
         """
         The execute() method should always be overridden to contain whatever test procedures
@@ -0,0 +1,641 @@
+# sockets.py
+# Contains Transports that talk to radio software over TCP, UDP and Unix domain sockets with the
+# same transmit/receive/lock semantics as a SerialLine, and make_transport(), which picks the
+# Transport for a port so that a URL such as "tcp://localhost:52001" can stand in for a COM port
+
+import select
+import socket
+import threading
+from collections import deque
+from time import monotonic, sleep
+from typing import Tuple, Union
+from urllib.parse import urlsplit
+
+from .connections import SerialLine, SerialLock, TransmitStats, Transport, locked
+from .framing import make_codec
+
+# Errors that mean the far end went away (or was never there) rather than a local problem
+DISCONNECTED = (
+    BrokenPipeError,
+    ConnectionAbortedError,
+    ConnectionRefusedError,
+    ConnectionResetError,
+)
+
+
+def parse_url(port: str) -> Union[Tuple[str, Union[tuple, str]], None]:
+    """
+    Splits a URL-style port into its scheme and socket address
+
+    :param port: e.g. "tcp://host:port", "udp://host:port" or "unix:///path/to/socket"
+    :type port: str
+    :return: The scheme and address, or None if the port is not a socket URL (e.g. a COM port)
+    :rtype: Union[Tuple[str, Union[tuple, str]], None]
+    """
+    scheme, separator, rest = port.partition("://")
+    if not separator or scheme.lower() not in TRANSPORTS:
+        return None
+    scheme = scheme.lower()
+    if scheme == "unix":
+        return scheme, rest  # unix:///abs/path or unix://relative/path
+    url = urlsplit(port)
+    if url.hostname is None or url.port is None:
+        raise ValueError(f"'{port}' needs a host and a port number")
+    return scheme, (url.hostname, url.port)
+
+
+class SocketPool:
+    """
+    Keeps connected stream sockets that transports have finished with, so that reopening a link to
+    the same address (e.g. for the next Test run) reuses the connection instead of making a new one
+    IMPORTANT: This is a singleton class!
+    """
+
+    _instance = None
+
+    def __init__(self, max_idle: int = 4, idle_timeout: Union[int, float] = 60):
+        """
+        Initializes the SocketPool instance
+
+        :param max_idle: (optional) The most idle sockets kept per address, defaults to 4
+        :type max_idle: int
+        :param idle_timeout: (optional) Seconds before an idle socket is closed, defaults to 60
+        :type idle_timeout: Union[int, float]
+        """
+        if SocketPool._instance is not None:
+            raise Exception("SocketPool instance already exists!")
+        SocketPool._instance = self
+
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self._idle = {}  # (scheme, address): deque of (socket, time returned)
+        self._lock = threading.Lock()
+
+        self.hits = 0  # how many connections were served from the pool
+        self.misses = 0  # how many times the pool had nothing usable
+
+    @staticmethod
+    def instance():
+        """
+        Static access method
+        """
+        if SocketPool._instance is None:
+            SocketPool()
+        return SocketPool._instance
+
+    def checkout(self, key: tuple) -> Union[socket.socket, None]:
+        """
+        Takes an idle connection to an address out of the pool
+
+        :param key: The (scheme, address) of the connection
+        :type key: tuple
+        :return: A connected socket, or None if there is no live one
+        :rtype: Union[socket.socket, None]
+        """
+        now = monotonic()
+        with self._lock:
+            idle = self._idle.get(key)
+            while idle:
+                sock, returned = idle.pop()  # the most recently used is the most likely alive
+                if now - returned < self.idle_timeout and _alive(sock):
+                    self.hits += 1
+                    return sock
+                sock.close()
+            self.misses += 1
+        return None
+
+    def checkin(self, key: tuple, sock: socket.socket) -> None:
+        """
+        Returns a connection to the pool (or closes it if the pool is full or it has died)
+
+        :param key: The (scheme, address) of the connection
+        :type key: tuple
+        :param sock: The connected socket
+        :type sock: socket.socket
+        """
+        if not _alive(sock):
+            sock.close()
+            return
+        with self._lock:
+            idle = self._idle.setdefault(key, deque())
+            if len(idle) >= self.max_idle:
+                sock.close()
+                return
+            idle.append((sock, monotonic()))
+
+    def clear(self) -> None:
+        """
+        Closes every idle connection
+        """
+        with self._lock:
+            for idle in self._idle.values():
+                for sock, _ in idle:
+                    sock.close()
+            self._idle.clear()
+
+    def idle(self) -> dict:
+        """
+        :return: The number of idle connections kept for each address
+        :rtype: dict
+        """
+        with self._lock:
+            return {key: len(idle) for key, idle in self._idle.items()}
+
+
+def _alive(sock: socket.socket) -> bool:
+    """
+    Checks, without blocking, whether the far end of a stream socket has hung up
+    Data that arrived while the socket sat idle is discarded.
+
+    :param sock: The connected socket
+    :type sock: socket.socket
+    :return: True if the connection is still usable, False otherwise
+    :rtype: bool
+    """
+    try:
+        while select.select([sock], [], [], 0)[0]:
+            if not sock.recv(65536):
+                return False
+    except OSError:
+        return False
+    return True
+
+
+class SocketTransport(Transport):
+    """
+    A Transport over a connected socket (see TcpTransport, UdpTransport and UnixTransport)
+    Received data goes straight into a preallocated buffer with recv_into(), so steady-state
+    receiving allocates nothing besides the returned messages. A link that drops is reconnected
+    with exponential backoff the next time it is used.
+    """
+
+    family = socket.AF_INET
+    type = socket.SOCK_STREAM
+    datagram = False  # True if every message travels as one datagram
+
+    def __init__(self, name, port, baud=None, **options):
+        """
+        Initializes a new SocketTransport instance
+        Accepts the same options as SerialLine where they make sense for a socket (timeout,
+        framing, ready_probe, ready_response, ready_timeout, probe_interval and archive); the
+        rest are ignored, as the OS already buffers socket traffic. The socket is not connected
+        until open() is called or the link is first used.
+        Pass retries, backoff and max_backoff to control reconnecting: each failed attempt waits
+        twice as long as the one before, starting at backoff and capped at max_backoff seconds.
+        Pass pool=False to close the connection on close() rather than keeping it for reuse.
+        Pass buffer_size to change the size of the receive buffer (the longest message that can
+        be received, when not framing).
+
+        :param port: The URL of the far end (see parse_url)
+        :type port: str
+        :param baud: (optional) Ignored; accepted so that any port can be passed to any link
+        :type baud: int
+        """
+
+        self.name = name
+        self.port = port
+        self.baud = baud
+        self.lock = SerialLock()
+        self.key = f"{monotonic()}"
+        parsed = parse_url(port)
+        if parsed is None:
+            raise ValueError(f"'{port}' is not a socket URL")
+        self.scheme, self.address = parsed
+
+        self.timeout = options.get("timeout", 10)
+        self.framing = options.get("framing", None)
+        self.ready_probe = options.get("ready_probe", None)
+        self.ready_response = options.get("ready_response", None)
+        self.ready_timeout = options.get("ready_timeout", 2)
+        self.probe_interval = options.get("probe_interval", 0.05)
+        self.ready = False  # whether the far end answered the ready_probe when the link was opened
+        self.archive = options.get("archive", None)
+        self.retries = options.get("retries", 5)
+        self.backoff = options.get("backoff", 0.05)
+        self.max_backoff = options.get("max_backoff", 2.0)
+        self.pool = options.get("pool", True) and not self.datagram
+
+        self.codec = make_codec(self.framing)
+        self._frames = deque()  # frames decoded but not yet returned to a caller
+        self._data = bytearray(options.get("buffer_size", 65536))
+        self._view = memoryview(self._data)
+        self._start = 0  # offset of the first unread byte in the buffer
+        self._end = 0  # offset just past the last received byte in the buffer
+
+        self.tx_stats = TransmitStats()
+        self.reconnects = 0  # how many times the link was re-established after dropping
+        self._socket = None
+        self._tx_lock = threading.Lock()
+
+    def _connect(self) -> socket.socket:
+        """
+        Makes a new connection to the far end (see the subclasses)
+
+        :return: The connected socket
+        :rtype: socket.socket
+        """
+        sock = socket.socket(self.family, self.type)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(self.address)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _establish(self) -> None:
+        """
+        Connects to the far end, taking an idle connection from the SocketPool if there is one
+        and otherwise retrying with exponential backoff
+        """
+        sock = SocketPool.instance().checkout((self.scheme, self.address)) if self.pool else None
+        delay = self.backoff
+        for attempt in range(max(1, self.retries)):
+            if sock is not None:
+                break
+            try:
+                sock = self._connect()
+            except OSError:
+                if attempt + 1 >= self.retries:
+                    raise
+                sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+        sock.settimeout(self.timeout)  # blocking sends (bounded by the timeout)
+        self._socket = sock
+        self._reset()
+
+    def _reset(self) -> None:
+        """
+        Discards everything received but not yet returned to a caller
+        """
+        self._start = self._end = 0
+        self._frames.clear()
+        if self.codec is not None:
+            self.codec.reset()
+
+    def _reconnect(self) -> None:
+        """
+        Replaces a connection that the far end dropped
+        """
+        self._drop()
+        self.reconnects += 1
+        self._establish()
+
+    def _drop(self) -> None:
+        """
+        Closes the connection without returning it to the pool
+        """
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def open(self):
+        """
+        Connects to the far end
+        With a ready_probe, this waits until the far end answers (at most ready_timeout seconds)
+        and records whether it did in ready.
+        """
+        if self._socket is None:
+            self._establish()
+        self.ready = self.ready_probe is not None and self.probe()
+        if self.ready:
+            self._discard()  # drop any duplicate answers
+
+    def _ensure_open(self) -> None:
+        """
+        Connects on first use (sockets need no settling time, so there is no lock to wait out)
+        """
+        if self._socket is None:
+            self.open()
+
+    def close(self):
+        """
+        Ends the connection, keeping it in the SocketPool for reuse if pooling
+        """
+        sock, self._socket = self._socket, None
+        self.ready = False
+        if sock is None:
+            return
+        self._reset()
+        if self.pool:
+            SocketPool.instance().checkin((self.scheme, self.address), sock)
+        else:
+            sock.close()
+
+    @property
+    def is_open(self):
+        """
+        Determines whether the link is currently connected
+
+        :return: True if the link is connected, False otherwise
+        :rtype: bool
+        """
+        return self._socket is not None
+
+    def probe(self, timeout: Union[int, float] = None) -> bool:
+        """
+        Sends the ready_probe repeatedly until the far end answers or a timeout expires
+
+        :param timeout: (optional) The amount of time in seconds to keep probing, defaults to
+                        ready_timeout
+        :type timeout: Union[int, float]
+        :return: True if the far end answered, False otherwise (or if there is no ready_probe)
+        :rtype: bool
+        """
+        if self.ready_probe is None or self._socket is None:
+            return False
+        deadline = monotonic() + (self.ready_timeout if timeout is None else timeout)
+        reply = b""
+        while True:
+            self._reset()
+            try:
+                self._socket.sendall(self.ready_probe)
+            except DISCONNECTED:
+                self._reconnect()
+            else:
+                if self._fill(self.probe_interval) > 0:
+                    reply = reply[-64:] + bytes(self._view[: self._end])
+            if reply and (self.ready_response is None or self.ready_response in reply):
+                self._reset()  # the answer is not part of any message
+                return True
+            if monotonic() >= deadline:
+                self._reset()
+                return False
+
+    def _discard(self) -> None:
+        """
+        Drops whatever has already arrived (like pySerial's reset_input_buffer())
+        """
+        self._reset()
+        while self._fill(0) > 0:
+            self._reset()
+
+    def _fill(self, timeout: Union[int, float, None]) -> int:
+        """
+        Receives whatever has arrived into the free end of the buffer, waiting at most timeout
+        seconds for at least one byte (a whole datagram, when the link is datagram based)
+
+        :param timeout: The maximum amount of time in seconds to wait (None waits forever)
+        :type timeout: Union[int, float, None]
+        :return: The number of bytes received (0 on timeout, -1 if the buffer is full)
+        :rtype: int
+        """
+        if self._start == self._end:
+            self._start = self._end = 0
+        elif self._end == len(self._data):
+            if self._start == 0:
+                return -1  # a message longer than the whole buffer
+            waiting = self._end - self._start
+            self._view[:waiting] = self._view[self._start : self._end]
+            self._start, self._end = 0, waiting
+        readable, _, _ = select.select([self._socket], [], [], timeout)
+        if not readable:
+            return 0
+        try:
+            count = self._socket.recv_into(self._view[self._end :])
+        except DISCONNECTED:
+            if self.datagram:  # nobody is listening (yet) at the far end
+                sleep(self.probe_interval if timeout is None else min(self.probe_interval, timeout))
+                return 0
+            count = 0
+        if count == 0 and not self.datagram:  # the far end hung up
+            self._reconnect()
+            return 0
+        self._end += count
+        return count
+
+    @locked
+    def transmit(self, message: bytes):
+        """
+        Writes data to the link (wrapped in a frame if the link has a codec)
+
+        :param message: The raw data to be written
+        :type message: bytes
+        :return: The number of bytes written
+        :rtype: int
+        """
+        if self.codec is not None:
+            message = self.codec.encode(message)
+        return self._write(message, 1)
+
+    @locked
+    def transmit_many(self, messages):
+        """
+        Writes several messages to the link with a single send (one send per message on a
+        datagram link, so that every message stays a datagram of its own)
+
+        :param messages: The raw data for each message
+        :type messages: Iterable[bytes]
+        :return: The number of bytes written
+        :rtype: int
+        """
+        if self.codec is not None:
+            messages = [self.codec.encode(message) for message in messages]
+        else:
+            messages = list(messages)
+        if self.datagram:
+            return sum(self._write(message, 1) for message in messages)
+        return self._write(b"".join(messages), len(messages)) if messages else 0
+
+    def _write(self, data: bytes, count: int) -> int:
+        """
+        Sends data, reconnecting (once) if the far end has dropped the link
+
+        :param data: The data to be sent
+        :type data: bytes
+        :param count: The number of messages that the data contains
+        :type count: int
+        :return: The number of bytes written
+        :rtype: int
+        """
+        with self._tx_lock:
+            self._ensure_open()
+            try:
+                self._socket.sendall(data)
+            except DISCONNECTED:
+                self._reconnect()
+                self._socket.sendall(data)
+            self.tx_stats.messages += count
+            self.tx_stats.writes += 1
+            self.tx_stats.bytes += len(data)
+            if count > 1:
+                self.tx_stats.coalesced_bytes += len(data)
+        return len(data)
+
+    @locked
+    def receive(self, timeout: Union[int, float] = None):
+        """
+        Reads data from the link until a terminator (or a whole frame, or a datagram) is received
+
+        :param timeout: (optional) The amount of time in seconds to wait, defaults to the link
+                        timeout
+        :type timeout: Union[int, float]
+        :return: The data received (whatever had arrived if the timeout expired first)
+        :rtype: bytes
+        """
+        timeout = self.timeout if timeout is None else timeout
+        self._ensure_open()
+        if self.codec is not None:
+            data = self._receive_frame(timeout)
+        else:
+            length = self._receive_message(timeout)
+            data = bytes(self._view[self._start : self._start + length])
+            self._start += length
+        if data and self.archive is not None:
+            self.archive.append(data)
+        return data
+
+    @locked
+    def receive_into(self, buffer, timeout: Union[int, float] = None):
+        """
+        Reads data from the link until a terminator (or a whole frame, or a datagram) is
+        received, into a caller-provided buffer
+
+        :param buffer: A writable buffer that receives the data
+        :type buffer: Union[bytearray, memoryview]
+        :param timeout: (optional) The amount of time in seconds to wait, defaults to the link
+                        timeout
+        :type timeout: Union[int, float]
+        :return: The number of bytes received
+        :rtype: int
+        """
+        timeout = self.timeout if timeout is None else timeout
+        self._ensure_open()
+        target = memoryview(buffer)
+        if self.codec is not None:
+            data = self._receive_frame(timeout)
+            count = min(len(data), len(target))
+            target[:count] = data[:count]
+        else:
+            length = self._receive_message(timeout)
+            count = min(length, len(target))
+            data = self._view[self._start : self._start + count]
+            target[:count] = data
+            self._start += count if not self.datagram else length
+        if count and self.archive is not None:
+            self.archive.append(target[:count])
+        return count
+
+    def _receive_message(self, timeout: Union[int, float, None]) -> int:
+        """
+        Waits until the next unframed message is in the buffer (a LF-terminated line, or a
+        datagram) or a timeout expires
+
+        :param timeout: The maximum amount of time in seconds to wait (None waits forever)
+        :type timeout: Union[int, float, None]
+        :return: The length of the message, starting at the read offset (on timeout, the length of
+                 whatever had arrived)
+        :rtype: int
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        searched = self._start  # only newly-received data needs searching for the terminator
+        while True:
+            if self.datagram:
+                if self._end > self._start:
+                    return self._end - self._start
+            else:
+                index = self._data.find(b"\n", searched, self._end)
+                if index >= 0:
+                    return index + 1 - self._start
+            remaining = None if deadline is None else max(0.0, deadline - monotonic())
+            count = self._fill(remaining)
+            if count < 0 or (count == 0 and remaining == 0):
+                return self._end - self._start
+            searched = self._end - count  # the unread data may have moved to the front
+
+    def _receive_frame(self, timeout: Union[int, float, None]) -> bytes:
+        """
+        Feeds data from the link into the codec until it produces a frame or a timeout expires
+
+        :param timeout: The maximum amount of time in seconds to wait (None waits forever)
+        :type timeout: Union[int, float, None]
+        :return: The payload of the next frame, or an empty bytes object on timeout
+        :rtype: bytes
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        while not self._frames:
+            remaining = None if deadline is None else max(0.0, deadline - monotonic())
+            self._start = self._end = 0  # the codec keeps any partial frame itself
+            if self._fill(remaining) > 0:
+                self._frames.extend(self.codec.decode(self._view[: self._end]))
+            elif remaining == 0:
+                return b""
+        self._start = self._end = 0
+        return self._frames.popleft()
+
+    def __del__(self):
+        """
+        Closes the socket before finalizing the deletion of this SocketTransport instance
+        """
+        sock = getattr(self, "_socket", None)
+        if sock is not None:
+            sock.close()
+
+
+class TcpTransport(SocketTransport):
+    """
+    A Transport over a TCP connection (tcp://host:port)
+    """
+
+    def _connect(self) -> socket.socket:
+        sock = socket.create_connection(self.address, self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # commands are small
+        return sock
+
+
+class UdpTransport(SocketTransport):
+    """
+    A Transport over UDP datagrams (udp://host:port), one message per datagram
+    Nothing guarantees that a datagram arrives, so a receive may time out where a stream would
+    not have.
+    """
+
+    type = socket.SOCK_DGRAM
+    datagram = True
+
+    def _connect(self) -> socket.socket:
+        host, port = self.address
+        family, kind, proto, _, address = socket.getaddrinfo(host, port, type=self.type)[0]
+        sock = socket.socket(family, kind, proto)
+        try:
+            sock.connect(address)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+
+class UnixTransport(SocketTransport):
+    """
+    A Transport over a Unix domain stream socket (unix:///path/to/socket)
+    """
+
+    family = getattr(socket, "AF_UNIX", None)
+
+
+# scheme: the Transport for ports with that scheme
+TRANSPORTS = {
+    "tcp": TcpTransport,
+    "udp": UdpTransport,
+    "unix": UnixTransport,
+}
+
+
+def make_transport(name, port, baud, **options) -> Transport:
+    """
+    Creates the Transport for a port: a socket transport for a URL (see parse_url), otherwise a
+    SerialLine on the serial port
+
+    :param name: A name for the link
+    :type name: str
+    :param port: A serial port (e.g. "/dev/ttyUSB0") or URL (e.g. "tcp://localhost:52001")
+    :type port: str
+    :param baud: The baud rate (ignored by socket transports)
+    :type baud: int
+    :return: The new (not yet opened) link
+    :rtype: Transport
+    """
+    parsed = parse_url(port)
+    if parsed is None:
+        return SerialLine(name, port, baud, **options)
+    return TRANSPORTS[parsed[0]](name, port, baud, **options)
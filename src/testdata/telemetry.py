@@ -0,0 +1,276 @@
+# telemetry.py
+# Contains the TelemetryStore, an append-only archive of timestamped frames (e.g. everything
+# received over a SerialLine) that can be queried by time range without scanning whole files
+#
+# On disk, a store is a directory of numbered segments:
+#   <n>.seg  records of  timestamp (float64) | length (uint32) | payload
+#   <n>.idx  a sparse time index of  timestamp (float64) | offset into <n>.seg (uint64)
+# with an index entry for (at least) every index_interval bytes of records.
+
+import mmap
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from time import time
+from typing import Iterator, Tuple, Union
+
+RECORD = struct.Struct("<dI")  # timestamp, payload length
+INDEX = struct.Struct("<dQ")  # timestamp, offset of the record in the segment
+
+
+class _Segment:
+    """
+    One segment file, its sparse index, and (once read) its memory map
+    """
+
+    def __init__(self, folder: Path, number: int):
+        self.number = number
+        self.data_path = folder / f"{number:08d}.seg"
+        self.index_path = folder / f"{number:08d}.idx"
+        self.times = array("d")  # the timestamps of the indexed records
+        self.offsets = array("Q")  # the offsets of the indexed records
+        self.size = 0  # the number of bytes of complete records in the segment
+        self.last_time = float("-inf")  # the timestamp of the newest record
+        self._map = None
+        self._mapped_size = 0
+
+    def load(self) -> None:
+        """
+        Reads the index of an existing segment and trims any partially-written record
+        """
+        if self.index_path.exists():
+            raw = self.index_path.read_bytes()
+            raw = raw[: len(raw) - len(raw) % INDEX.size]
+            for timestamp, offset in INDEX.iter_unpack(raw):
+                self.times.append(timestamp)
+                self.offsets.append(offset)
+
+        # scan forward from the last index entry to find the end of the last whole record
+        size = self.data_path.stat().st_size if self.data_path.exists() else 0
+        position = self.offsets[-1] if self.offsets else 0
+        with open(self.data_path, "ab+") as file:
+            file.seek(position)
+            while position + RECORD.size <= size:
+                timestamp, length = RECORD.unpack(file.read(RECORD.size))
+                if position + RECORD.size + length > size:
+                    break
+                self.last_time = timestamp
+                file.seek(length, os.SEEK_CUR)
+                position += RECORD.size + length
+            if position < size:
+                file.truncate(position)  # a torn write from a crash
+        self.size = position
+
+        # drop index entries that point past the end (from the same crash)
+        while self.offsets and self.offsets[-1] >= self.size:
+            self.offsets.pop()
+            self.times.pop()
+
+    def view(self) -> memoryview:
+        """
+        :return: A read-only view of the segment's complete records (remapped if it has grown)
+        :rtype: memoryview
+        """
+        if self._map is None or self._mapped_size != self.size:
+            if self.size == 0:
+                return memoryview(b"")
+            self.close()
+            with open(self.data_path, "rb") as file:
+                self._map = mmap.mmap(file.fileno(), self.size, access=mmap.ACCESS_READ)
+            self._mapped_size = self.size
+        return memoryview(self._map)
+
+    def close(self) -> None:
+        """
+        Unmaps the segment (views that are still in use keep their own reference to the map)
+        """
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass  # somebody still holds a frame; the map is freed along with it
+            self._map = None
+
+
+class TelemetryStore:
+    """
+    An append-only, segmented, memory-mapped archive of timestamped frames
+    Finding the frames between t0 and t1 is a binary search over the sparse time index followed
+    by a short scan, and the frames are returned as zero-copy views of the mapped segments.
+    Timestamps must not go backwards; a frame older than its predecessor is stored with its
+    predecessor's timestamp.
+    """
+
+    _open_stores = {}  # resolved path: TelemetryStore (see open())
+    _open_lock = threading.Lock()
+
+    def __init__(
+        self,
+        folder: Union[str, Path],
+        segment_size: int = 64 * 1024 * 1024,
+        index_interval: int = 4096,
+    ):
+        """
+        :param folder: The directory holding the store (created if it doesn't exist)
+        :type folder: Union[str, Path]
+        :param segment_size: (optional) The size in bytes at which a new segment is started
+        :type segment_size: int
+        :param index_interval: (optional) The number of bytes of records between index entries
+        :type index_interval: int
+        """
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.index_interval = index_interval
+        self._lock = threading.Lock()
+
+        self._segments = []
+        for path in sorted(self.folder.glob("*.seg")):
+            segment = _Segment(self.folder, int(path.stem))
+            segment.load()
+            self._segments.append(segment)
+        if not self._segments:
+            self._segments.append(_Segment(self.folder, 0))
+        self._starts = [s.times[0] if s.times else float("inf") for s in self._segments]
+
+        active = self._segments[-1]
+        self._data = open(active.data_path, "ab")
+        self._index = open(active.index_path, "ab")
+        self._last_indexed = active.offsets[-1] if active.offsets else -index_interval
+
+    @classmethod
+    def open(cls, folder: Union[str, Path], **options):
+        """
+        Returns the store for a directory, creating it only if it is not open already, so that
+        several lines (or tests) can archive into the same store safely
+
+        :param folder: The directory holding the store
+        :type folder: Union[str, Path]
+        :return: The store
+        :rtype: TelemetryStore
+        """
+        key = Path(folder).resolve()
+        with cls._open_lock:
+            store = cls._open_stores.get(key)
+            if store is None:
+                store = cls._open_stores[key] = cls(key, **options)
+            return store
+
+    def append(self, payload, timestamp: float = None) -> None:
+        """
+        Adds a frame to the store
+
+        :param payload: The frame
+        :type payload: Union[bytes, bytearray, memoryview]
+        :param timestamp: (optional) When the frame was received, defaults to now (time.time())
+        :type timestamp: float
+        """
+        timestamp = time() if timestamp is None else timestamp
+        with self._lock:
+            segment = self._segments[-1]
+            if segment.size >= self.segment_size:
+                segment = self._rotate()
+            timestamp = max(timestamp, segment.last_time)
+
+            if segment.size - self._last_indexed >= self.index_interval:
+                self._index.write(INDEX.pack(timestamp, segment.size))
+                segment.times.append(timestamp)
+                segment.offsets.append(segment.size)
+                self._last_indexed = segment.size
+                if len(segment.times) == 1:
+                    self._starts[-1] = timestamp
+
+            self._data.write(RECORD.pack(timestamp, len(payload)))
+            self._data.write(payload)
+            segment.size += RECORD.size + len(payload)
+            segment.last_time = timestamp
+
+    def _rotate(self) -> _Segment:
+        """
+        Finishes the active segment and starts a new one (the caller must hold the lock)
+
+        :return: The new active segment
+        :rtype: _Segment
+        """
+        self._data.close()
+        self._index.close()
+        segment = _Segment(self.folder, self._segments[-1].number + 1)
+        segment.last_time = self._segments[-1].last_time
+        self._segments.append(segment)
+        self._starts.append(float("inf"))
+        self._data = open(segment.data_path, "ab")
+        self._index = open(segment.index_path, "ab")
+        self._last_indexed = -self.index_interval
+        return segment
+
+    def flush(self) -> None:
+        """
+        Writes buffered frames out so that they can be read back
+        """
+        with self._lock:
+            self._data.flush()
+            self._index.flush()
+
+    def frames(
+        self, t0: float = float("-inf"), t1: float = float("inf")
+    ) -> Iterator[Tuple[float, memoryview]]:
+        """
+        Yields the frames received between two times (inclusive)
+        The payloads are views into the mapped segment files, so nothing is copied; convert
+        them with bytes() to keep them beyond the life of the store.
+
+        :param t0: (optional) The earliest timestamp to include
+        :type t0: float
+        :param t1: (optional) The latest timestamp to include
+        :type t1: float
+        :return: (timestamp, payload) for each frame, oldest first
+        :rtype: Iterator[Tuple[float, memoryview]]
+        """
+        with self._lock:
+            self._data.flush()
+            self._index.flush()
+            # the segments that can hold frames in range: from the last one starting at or
+            # before t0 up to the last one starting at or before t1
+            first = max(0, bisect_right(self._starts, t0) - 1)
+            last = bisect_right(self._starts, t1)
+            segments = [
+                (segment, segment.size, segment.view())
+                for segment in self._segments[first : max(last, first + 1)]
+                if segment.times and segment.last_time >= t0
+            ]
+
+        for segment, size, view in segments:
+            view = view[:size]
+            entry = max(0, bisect_left(segment.times, t0) - 1)
+            position = segment.offsets[entry]
+            while position < size:
+                timestamp, length = RECORD.unpack_from(view, position)
+                if timestamp > t1:
+                    return
+                start = position + RECORD.size
+                position = start + length
+                if timestamp >= t0:
+                    yield timestamp, view[start:position]
+
+    def __len__(self) -> int:
+        """
+        :return: The number of bytes of records in the store
+        :rtype: int
+        """
+        return sum(segment.size for segment in self._segments)
+
+    def close(self) -> None:
+        """
+        Flushes and closes the store
+        """
+        with self._lock:
+            self._data.close()
+            self._index.close()
+            for segment in self._segments:
+                segment.close()
+        with TelemetryStore._open_lock:
+            if TelemetryStore._open_stores.get(self.folder.resolve()) is self:
+                del TelemetryStore._open_stores[self.folder.resolve()]
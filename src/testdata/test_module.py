@@ -1,10 +1,17 @@
 # test_module.py
 # Contains the main classes related to Test mode (i.e. communicating with MCU via COM port)
 
+import shutil
+import tempfile
 from abc import ABC, abstractmethod
+from pathlib import Path
+from time import monotonic, time
 from typing import Any, Union
 
-from .connections import SerialLine
+from .connections import ACK, ENQ
+from .ports import PortManager
+from .results import JsonLinesSink, ResultSink
+from .telemetry import TelemetryStore
 
 """
 TEST MODE
@@ -21,27 +28,108 @@ class Test(ABC):
     Provides an interface for individual tests
     """
 
-    def __init__(self):
-        self.connection = SerialLine(f"Serial-{self.__class__.__name__}", "/dev/ttyUSB0", 9600)
-        # self.connection.open()  # TODO: Lock the line for at least a second before allowing any tx
-        pass
+    port = "/dev/ttyUSB0"  # the serial port the MCU is connected to
+    baud = 9600  # the baud rate of the serial line
+    framing = None  # the frame codec for the line (see framing.make_codec), None for raw bytes
+    archive = None  # a directory to archive everything received into (see TelemetryStore)
+    tags = ()  # words to find the test by in the test loader, e.g. ("power", "smoke")
+
+    def __init__(self, port: str = None, baud: int = None):
+        """
+        :param port: (optional) Overrides the serial port for this instance
+        :type port: str
+        :param baud: (optional) Overrides the baud rate for this instance
+        :type baud: int
+        """
+        if port is not None:
+            self.port = port
+        if baud is not None:
+            self.baud = baud
+        # tests configured for the same port share one line (see PortManager)
+        # the line is opened on first use, and is ready as soon as the MCU answers ENQ with ACK
+        self.connection = PortManager.instance().lease(
+            f"Serial-{self.__class__.__name__}",
+            self.port,
+            self.baud,
+            self.framing,
+            ready_probe=ENQ,
+            ready_response=ACK,
+            archive=TelemetryStore.open(self.archive) if self.archive is not None else None,
+        )
+        # Where records are streamed during a run. Set this to send them somewhere specific;
+        # otherwise each run spools them to a temporary file that _export() copies from.
+        self.results: Union[ResultSink, None] = None
+        self.error: Union[str, None] = None  # why the latest run failed (if it did)
+        self._spool = None  # the temporary JSON Lines file for the latest run (if any)
+        self._cancelled = False  # set by cancel() to end the run in progress
+
+    def __del__(self):
+        """
+        Removes the temporary results file before finalizing the deletion of this Test instance
+        """
+        spool = getattr(self, "_spool", None)
+        if spool is not None:
+            spool.close()
+            shutil.rmtree(spool.path.parent, ignore_errors=True)
 
     def _run_full(self, **kwargs) -> None:
         """
         Begins the test and iterates through all operations
+        Every tx/rx (and anything passed to record()) is streamed to self.results as it happens.
         """
+        self._begin_results()
+        start = monotonic()
+        passed = False
+        self.error = None
+        self._cancelled = False
         if self._check_connection():
             try:
                 if self.execute(**kwargs):
-                    return True
-            except Exception:
+                    passed = True
+            except Exception as e:
                 # some exception handling stuff (?)
-                pass
+                self.error = repr(e)
+                self.record(event="error", error=self.error)
             finally:
                 # close the serial line
                 self.connection.close()
+        else:
+            self.error = f"no response from the MCU on {self.port}"
 
-        return False
+        self.record(event="end", passed=passed, seconds=monotonic() - start)
+        self._sink().flush()
+        return passed
+
+    def _begin_results(self) -> None:
+        """
+        Prepares the result sink for a new run (a fresh spool file unless results is set)
+        """
+        if self.results is None:
+            if self._spool is not None:
+                self._spool.close()
+                shutil.rmtree(self._spool.path.parent, ignore_errors=True)
+            folder = Path(tempfile.mkdtemp(prefix="atmos-"))
+            self._spool = JsonLinesSink(folder / f"{self.__class__.__name__}.jsonl")
+        self.record(event="start", test=self.__class__.__name__, port=self.port)
+
+    def _sink(self) -> ResultSink:
+        """
+        :return: The sink that records are currently streamed to
+        :rtype: ResultSink
+        """
+        return self.results if self.results is not None else self._spool
+
+    def record(self, **fields) -> None:
+        """
+        Streams a timestamped record of the test's progress to the results
+
+        :param fields: The values to record (e.g. measurements taken by the test)
+        :type fields: Any
+        """
+        sink = self._sink()
+        if sink is not None:
+            fields.setdefault("t", time())
+            sink.write(fields)
 
     def _check_connection(self) -> bool:
         """
@@ -50,7 +138,11 @@ class Test(ABC):
         :return: True if a handshake signal sent to the MCU is acknowledged, False otherwise
         :rtype: bool
         """
-        return True  # placeholder until normal functionality added
+        try:
+            self.connection.open()  # probes the MCU (unless the line is already open and ready)
+            return self.connection.ready
+        except OSError:  # includes serial.SerialException (e.g. no device on the port)
+            return False
 
     def _export(self, location: str) -> bool:
         """
@@ -61,29 +153,53 @@ class Test(ABC):
         :return: True if the export operation was successful, False otherwise
         :rtype: bool
         """
-        pass
+        if self._spool is None:
+            return False  # nothing has been run (or the results were streamed elsewhere)
+        self._spool.flush()
+        try:
+            shutil.copyfile(self._spool.path, location)
+        except OSError:
+            return False
+        return True
+
+    def cancel(self) -> None:
+        """
+        Ends the run in progress (from another thread): the test's next tx() or rx() raises
+        """
+        self._cancelled = True
 
-    def tx(self, message):  # TODO: Add type hints
+    def tx(self, message: Union[str, bytes]) -> int:
         """
         Transmits a message via the serial line to the MCU
+        Bytes are sent as-is (wrapped in a frame if the test sets framing), so binary payloads
+        need no text encoding.
 
-        :param message: The message to be sent (TODO: What format?)
-        :type message: TODO: What type?
-        :return: TODO: What?
-        :rtype: TODO: What type is the returned value?
+        :param message: The message to be sent (str messages are UTF-8 encoded)
+        :type message: Union[str, bytes]
+        :return: The number of bytes written to the line
+        :rtype: int
         """
-        pass
-
-    def rx(self, timeout: int):  # TODO: Add type hints
+        if self._cancelled:
+            raise Exception("The test was cancelled")
+        if isinstance(message, str):
+            message = self.to_bytes(message)
+        self.record(event="tx", data=message)
+        return self.connection.transmit(message)
+
+    def rx(self, timeout: int) -> bytes:
         """
         Polls for a message from the MCU on the serial line
 
         :param timeout: The amount of time in milliseconds to wait for the signal
         :type timout: int
-        :return: The message that was received from the MCU
-        :rtype: TODO: What format?
+        :return: The message that was received from the MCU (empty if none arrived in time)
+        :rtype: bytes
         """
-        pass
+        if self._cancelled:
+            raise Exception("The test was cancelled")
+        message = self.connection.receive(timeout / 1000)
+        self.record(event="rx", data=message)
+        return message
 
     def to_bytes(self, x: Union[str, Union[int, float]]) -> bytes:
         """
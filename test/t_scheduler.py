@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from mops.scheduler import PLANNED, CommandScheduler, ContactWindow  # noqa: E402
+
+failed = False
+
+
+def check(name, result, expected):
+    global failed
+    if result != expected:
+        failed = True
+        print(f"{name} failed\n\tExpected: {expected}\tResult: {result}")
+        print()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+# COMMANDS THAT CAN'T MAKE THEIR DEADLINE DON'T STOP PACKING
+
+clock = Clock()
+scheduler = CommandScheduler(clock=clock)
+for i in range(1000):
+    scheduler.submit(b"late", release=0, deadline=100 + i / 1000)
+for i in range(1000):
+    scheduler.submit(b"on time", release=0)
+plan = scheduler.pack(ContactWindow(200, 800, 1000))
+check("pack past hopeless commands", len(plan), 1000)
+check("only commands without a deadline", {command.payload for _, command in plan}, {b"on time"})
+check("hopeless commands stay queued", len(scheduler), 1000)
+
+# A LARGE RANDOM BACKLOG FILLS THE WINDOW
+
+random.seed(1)
+clock = Clock()
+clock.now = 1000
+scheduler = CommandScheduler(clock=clock)
+for i in range(50000):
+    deadline = random.choice([None, random.uniform(900, 2000)])
+    scheduler.submit(b"x" * random.randint(1, 64), 0, deadline, random.randint(0, 3))
+window = ContactWindow(1000, 1650, 100)
+plan = scheduler.pack(window)
+end = plan[-1][0] + (len(plan[-1][1].payload) + scheduler.overhead) / window.rate
+check("pack fills the window", end > window.end - 1, True)
+
+# OUTSTANDING COUNTS SENT COMMANDS
+
+clock = Clock()
+scheduler = CommandScheduler(clock=clock, ack_timeout=1, max_attempts=2)
+commands = [scheduler.submit(b"cmd", release=0) for _ in range(3)]
+plan = scheduler.pack(ContactWindow(0, 10, 1000))
+for _, command in plan:
+    scheduler.sent(command)
+check("outstanding after sending", scheduler.outstanding, 3)
+scheduler.acknowledge(commands[0].id)
+check("outstanding after an acknowledgement", scheduler.outstanding, 2)
+clock.now = 2
+scheduler.check_acks()
+check("outstanding after requeueing", scheduler.outstanding, 0)
+plan = scheduler.pack(ContactWindow(0, 10, 1000))
+check("requeued commands are planned again", [c.status for _, c in plan], [PLANNED] * 2)
+for _, command in plan:
+    scheduler.sent(command)
+clock.now = 4
+check("commands that fail", len(scheduler.check_acks()), 2)
+check("outstanding after failing", scheduler.outstanding, 0)
+
+if not failed:
+    print("*** All tests passed successfully!***")